@@ -0,0 +1,41 @@
+"""bed occupancy rollups
+
+Revision ID: 1e5b7c0d9a32
+Revises:
+Create Date: 2026-10-19 08:47:05.630914
+
+The per-room bed occupancy rollup behind /api/beds/occupancy. The table may
+already exist when the app has run create_all, so it is only created when
+missing; the rows are filled from the beds table on startup.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1e5b7c0d9a32'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    if 'bed_occupancy_rollups' in sa.inspect(op.get_bind()).get_table_names():
+        return
+    op.create_table(
+        'bed_occupancy_rollups',
+        sa.Column('floor', sa.Integer(), primary_key=True),
+        sa.Column('room_number', sa.String(length=10), primary_key=True),
+        sa.Column('total_beds', sa.Integer(), nullable=False),
+        sa.Column('occupied_beds', sa.Integer(), nullable=False),
+        sa.Column('vacant_beds', sa.Integer(), nullable=False),
+        sa.Column('maintenance_beds', sa.Integer(), nullable=False),
+        sa.Column('occupied_revenue', sa.Float(), nullable=False),
+        sa.Column('potential_revenue', sa.Float(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.func.now()),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('bed_occupancy_rollups')
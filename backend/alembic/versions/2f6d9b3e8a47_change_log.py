@@ -0,0 +1,44 @@
+"""change log
+
+Revision ID: 2f6d9b3e8a47
+Revises: 7e2b4f8a1c69
+Create Date: 2026-10-19 20:05:41.662090
+
+change_log sequence for incremental client sync: one entry per write to a
+synced table, read by facility after a sequence number. Existing rows are
+logged once on startup.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2f6d9b3e8a47'
+down_revision = '7e2b4f8a1c69'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    if 'change_log' not in inspector.get_table_names():
+        op.create_table(
+            'change_log',
+            sa.Column('seq', sa.Integer(), primary_key=True),
+            sa.Column('facility_id', sa.Integer(), nullable=False, server_default='1'),
+            sa.Column('table_name', sa.String(length=50), nullable=False),
+            sa.Column('row_id', sa.Integer(), nullable=False),
+            sa.Column('changed_at', sa.DateTime(), nullable=False),
+            sqlite_autoincrement=True,
+        )
+        op.create_index('ix_change_log_facility_id', 'change_log', ['facility_id'])
+        op.create_index('ix_change_log_facility_seq', 'change_log', ['facility_id', 'seq'])
+        op.create_index('ix_change_log_table_row', 'change_log', ['table_name', 'row_id'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_change_log_table_row', table_name='change_log')
+    op.drop_index('ix_change_log_facility_seq', table_name='change_log')
+    op.drop_index('ix_change_log_facility_id', table_name='change_log')
+    op.drop_table('change_log')
@@ -0,0 +1,30 @@
+"""checkup duration
+
+Revision ID: 3c9d51f0a7b2
+Revises: e412e921cb8e
+Create Date: 2026-10-19 12:58:09.640215
+
+Checkups without a duration are treated as 30 minutes by the
+double-booking check.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3c9d51f0a7b2'
+down_revision = 'e412e921cb8e'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    columns = [column['name'] for column in sa.inspect(op.get_bind()).get_columns('checkups')]
+    if 'duration_minutes' not in columns:
+        op.add_column('checkups', sa.Column('duration_minutes', sa.Integer(), nullable=True))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('checkups') as batch_op:
+        batch_op.drop_column('duration_minutes')
@@ -0,0 +1,43 @@
+"""shift assignments
+
+Revision ID: 4b7f1e9c3a58
+Revises: 9a4e7b2c5d13
+Create Date: 2026-10-19 17:48:12.604391
+
+Per-date shift assignments for the staff roster, unique per staff member
+and shift, with the (date, shift, floor) index used by coverage queries.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4b7f1e9c3a58'
+down_revision = '9a4e7b2c5d13'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    if 'shift_assignments' not in inspector.get_table_names():
+        op.create_table(
+            'shift_assignments',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('staff_id', sa.Integer(), sa.ForeignKey('staff.id'), nullable=False),
+            sa.Column('shift_date', sa.Date(), nullable=False),
+            sa.Column('shift', sa.String(length=20), nullable=False),
+            sa.Column('floor', sa.Integer(), nullable=False),
+            sa.Column('notes', sa.Text()),
+            sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now()),
+            sa.UniqueConstraint('staff_id', 'shift_date', 'shift', name='uq_shift_assignments_staff_shift'),
+        )
+        op.create_index('ix_shift_assignments_id', 'shift_assignments', ['id'])
+        op.create_index('ix_shift_assignments_date_shift_floor', 'shift_assignments', ['shift_date', 'shift', 'floor'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_shift_assignments_date_shift_floor', table_name='shift_assignments')
+    op.drop_index('ix_shift_assignments_id', table_name='shift_assignments')
+    op.drop_table('shift_assignments')
@@ -0,0 +1,38 @@
+"""visitor desk indexes
+
+Revision ID: 5d0b8e3f92c4
+Revises: 8f27c4d9e6a1
+Create Date: 2026-10-19 14:10:27.385016
+
+Per-resident visit history index, and a partial index over open visits
+used to rebuild the on-site register at startup.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5d0b8e3f92c4'
+down_revision = '8f27c4d9e6a1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    indexes = [index['name'] for index in sa.inspect(op.get_bind()).get_indexes('visitors')]
+    if 'ix_visitors_resident_visit_date' not in indexes:
+        op.create_index('ix_visitors_resident_visit_date', 'visitors', ['resident_id', 'visit_date'])
+    if 'ix_visitors_on_site' not in indexes:
+        op.create_index(
+            'ix_visitors_on_site',
+            'visitors',
+            ['check_in_time'],
+            sqlite_where=sa.text('check_out_time IS NULL AND check_in_time IS NOT NULL'),
+            postgresql_where=sa.text('check_out_time IS NULL AND check_in_time IS NOT NULL'),
+        )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_visitors_on_site', table_name='visitors')
+    op.drop_index('ix_visitors_resident_visit_date', table_name='visitors')
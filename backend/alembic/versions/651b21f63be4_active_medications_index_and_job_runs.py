@@ -0,0 +1,64 @@
+"""active medications index and job runs
+
+Revision ID: 651b21f63be4
+Revises: a0040abb563e
+Create Date: 2026-10-19 10:02:17.530419
+
+Adds the partial index used by the hot medication queries, plus the
+scheduler lease and job run tables for the background sweeper.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '651b21f63be4'
+down_revision = 'a0040abb563e'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    tables = inspector.get_table_names()
+
+    if 'ix_medications_active_resident' not in [index['name'] for index in inspector.get_indexes('medications')]:
+        op.create_index(
+            'ix_medications_active_resident',
+            'medications',
+            ['resident_id', 'end_date'],
+            sqlite_where=sa.text('is_active = 1'),
+            postgresql_where=sa.text('is_active'),
+        )
+    if 'scheduler_leases' not in tables:
+        op.create_table(
+            'scheduler_leases',
+            sa.Column('name', sa.String(length=100), primary_key=True),
+            sa.Column('holder', sa.String(length=100), nullable=False),
+            sa.Column('expires_at', sa.DateTime(), nullable=False),
+        )
+    if 'job_runs' not in tables:
+        op.create_table(
+            'job_runs',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('job_name', sa.String(length=100), nullable=False),
+            sa.Column('holder', sa.String(length=100)),
+            sa.Column('status', sa.String(length=20), nullable=False),
+            sa.Column('rows_affected', sa.Integer()),
+            sa.Column('batches', sa.Integer()),
+            sa.Column('duration_ms', sa.Float()),
+            sa.Column('error', sa.Text()),
+            sa.Column('started_at', sa.DateTime(), nullable=False),
+            sa.Column('finished_at', sa.DateTime()),
+        )
+        op.create_index('ix_job_runs_id', 'job_runs', ['id'])
+        op.create_index('ix_job_runs_job_name', 'job_runs', ['job_name'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_job_runs_job_name', table_name='job_runs')
+    op.drop_index('ix_job_runs_id', table_name='job_runs')
+    op.drop_table('job_runs')
+    op.drop_table('scheduler_leases')
+    op.drop_index('ix_medications_active_resident', table_name='medications')
@@ -0,0 +1,51 @@
+"""resident soft delete
+
+Revision ID: 6a1c7d4e9b20
+Revises: 2f6d9b3e8a47
+Create Date: 2026-10-19 20:48:16.203745
+
+deleted_at and archived_at on residents, partial indexes over live
+residents for the hot reads, and one over deleted residents still waiting
+for the resident_archive job.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6a1c7d4e9b20'
+down_revision = '2f6d9b3e8a47'
+branch_labels = None
+depends_on = None
+
+LIVE = sa.text('deleted_at IS NULL')
+PENDING_ARCHIVE = sa.text('deleted_at IS NOT NULL AND archived_at IS NULL')
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    columns = {column['name'] for column in inspector.get_columns('residents')}
+    if 'deleted_at' not in columns:
+        op.add_column('residents', sa.Column('deleted_at', sa.DateTime()))
+    if 'archived_at' not in columns:
+        op.add_column('residents', sa.Column('archived_at', sa.DateTime()))
+    indexes = {index['name'] for index in inspector.get_indexes('residents')}
+    if 'ix_residents_live_status' not in indexes:
+        op.create_index('ix_residents_live_status', 'residents', ['status'],
+                        sqlite_where=LIVE, postgresql_where=LIVE)
+    if 'ix_residents_live_created_at' not in indexes:
+        op.create_index('ix_residents_live_created_at', 'residents', ['created_at'],
+                        sqlite_where=LIVE, postgresql_where=LIVE)
+    if 'ix_residents_pending_archive' not in indexes:
+        op.create_index('ix_residents_pending_archive', 'residents', ['deleted_at'],
+                        sqlite_where=PENDING_ARCHIVE, postgresql_where=PENDING_ARCHIVE)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_residents_pending_archive', table_name='residents')
+    op.drop_index('ix_residents_live_created_at', table_name='residents')
+    op.drop_index('ix_residents_live_status', table_name='residents')
+    with op.batch_alter_table('residents') as batch_op:
+        batch_op.drop_column('archived_at')
+        batch_op.drop_column('deleted_at')
@@ -0,0 +1,49 @@
+"""audit log
+
+Revision ID: 7e2b4f8a1c69
+Revises: d5c3a8e1f046
+Create Date: 2026-10-19 19:22:05.418263
+
+Append-only audit_log table written in batches by the write-behind audit
+writer, indexed for lookups by row and by actor.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7e2b4f8a1c69'
+down_revision = 'd5c3a8e1f046'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    if 'audit_log' not in inspector.get_table_names():
+        op.create_table(
+            'audit_log',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('facility_id', sa.Integer()),
+            sa.Column('occurred_at', sa.DateTime(), nullable=False),
+            sa.Column('actor_id', sa.Integer()),
+            sa.Column('table_name', sa.String(length=50), nullable=False),
+            sa.Column('row_id', sa.String(length=64)),
+            sa.Column('action', sa.String(length=10), nullable=False),
+            sa.Column('changes', sa.Text(), nullable=False),
+        )
+        op.create_index('ix_audit_log_id', 'audit_log', ['id'])
+        op.create_index('ix_audit_log_facility_id', 'audit_log', ['facility_id'])
+        op.create_index('ix_audit_log_occurred_at', 'audit_log', ['occurred_at'])
+        op.create_index('ix_audit_log_table_row', 'audit_log', ['table_name', 'row_id'])
+        op.create_index('ix_audit_log_actor', 'audit_log', ['actor_id', 'occurred_at'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_audit_log_actor', table_name='audit_log')
+    op.drop_index('ix_audit_log_table_row', table_name='audit_log')
+    op.drop_index('ix_audit_log_occurred_at', table_name='audit_log')
+    op.drop_index('ix_audit_log_facility_id', table_name='audit_log')
+    op.drop_index('ix_audit_log_id', table_name='audit_log')
+    op.drop_table('audit_log')
@@ -0,0 +1,42 @@
+"""checkup follow-up worklist
+
+Revision ID: 8f27c4d9e6a1
+Revises: 3c9d51f0a7b2
+Create Date: 2026-10-19 13:34:51.902377
+
+Links a checkup to the checkup booked as its follow-up and adds the
+partial index read by the follow-up worklist.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8f27c4d9e6a1'
+down_revision = '3c9d51f0a7b2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    if 'follow_up_checkup_id' not in [column['name'] for column in inspector.get_columns('checkups')]:
+        with op.batch_alter_table('checkups') as batch_op:
+            batch_op.add_column(sa.Column('follow_up_checkup_id', sa.Integer(), nullable=True))
+            batch_op.create_foreign_key('fk_checkups_follow_up_checkup_id', 'checkups', ['follow_up_checkup_id'], ['id'])
+    if 'ix_checkups_open_follow_up' not in [index['name'] for index in inspector.get_indexes('checkups')]:
+        op.create_index(
+            'ix_checkups_open_follow_up',
+            'checkups',
+            ['follow_up_date', 'id'],
+            sqlite_where=sa.text('follow_up_required = 1 AND follow_up_checkup_id IS NULL'),
+            postgresql_where=sa.text('follow_up_required AND follow_up_checkup_id IS NULL'),
+        )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_checkups_open_follow_up', table_name='checkups')
+    with op.batch_alter_table('checkups') as batch_op:
+        batch_op.drop_constraint('fk_checkups_follow_up_checkup_id', type_='foreignkey')
+        batch_op.drop_column('follow_up_checkup_id')
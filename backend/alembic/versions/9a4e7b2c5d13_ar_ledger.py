@@ -0,0 +1,61 @@
+"""ar ledger
+
+Revision ID: 9a4e7b2c5d13
+Revises: f3a8c2e71d64
+Create Date: 2026-10-19 17:02:44.318207
+
+Payments against invoices, the per-resident receivables ledger with its
+ageing buckets, and the (payment status, due date) index used by the
+nightly ageing job. The ledger is filled on startup from open invoices.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9a4e7b2c5d13'
+down_revision = 'f3a8c2e71d64'
+branch_labels = None
+depends_on = None
+
+BUCKETS = ['current', 'past_due_0_30', 'past_due_31_60', 'past_due_61_90', 'past_due_over_90']
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    tables = inspector.get_table_names()
+    if 'payments' not in tables:
+        op.create_table(
+            'payments',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('billing_id', sa.Integer(), sa.ForeignKey('billing.id'), nullable=False),
+            sa.Column('resident_id', sa.Integer(), sa.ForeignKey('residents.id'), nullable=False),
+            sa.Column('amount', sa.BigInteger(), nullable=False),
+            sa.Column('payment_date', sa.Date(), nullable=False),
+            sa.Column('payment_method', sa.String(length=50)),
+            sa.Column('reference', sa.String(length=100)),
+            sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now()),
+        )
+        op.create_index('ix_payments_id', 'payments', ['id'])
+        op.create_index('ix_payments_billing_id', 'payments', ['billing_id'])
+        op.create_index('ix_payments_resident_id', 'payments', ['resident_id'])
+    if 'resident_balances' not in tables:
+        op.create_table(
+            'resident_balances',
+            sa.Column('resident_id', sa.Integer(), sa.ForeignKey('residents.id'), primary_key=True),
+            sa.Column('balance', sa.BigInteger(), nullable=False),
+            *[sa.Column(bucket, sa.BigInteger(), nullable=False) for bucket in BUCKETS],
+            sa.Column('as_of', sa.Date(), nullable=False),
+        )
+    if 'ix_billing_status_due' not in [index['name'] for index in inspector.get_indexes('billing')]:
+        op.create_index('ix_billing_status_due', 'billing', ['payment_status', 'due_date'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_billing_status_due', table_name='billing')
+    op.drop_table('resident_balances')
+    op.drop_index('ix_payments_resident_id', table_name='payments')
+    op.drop_index('ix_payments_billing_id', table_name='payments')
+    op.drop_index('ix_payments_id', table_name='payments')
+    op.drop_table('payments')
@@ -0,0 +1,105 @@
+"""structured bed amenities
+
+Revision ID: a0040abb563e
+Revises: 1e5b7c0d9a32
+Create Date: 2026-10-19 09:12:44.118203
+
+Moves beds.amenities (free text such as "AC, TV, Private Bathroom") into
+an amenities table linked through bed_amenities, then drops the column.
+The tables may already exist when the app has run create_all, so they are
+only created when missing.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a0040abb563e'
+down_revision = '1e5b7c0d9a32'
+branch_labels = None
+depends_on = None
+
+
+def _slug(name: str) -> str:
+    return " ".join(name.split()).lower()
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    tables = inspector.get_table_names()
+
+    if 'amenities' not in tables:
+        op.create_table(
+            'amenities',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('name', sa.String(length=50), nullable=False),
+            sa.Column('slug', sa.String(length=50), nullable=False),
+            sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now()),
+        )
+        op.create_index('ix_amenities_id', 'amenities', ['id'])
+        op.create_index('ix_amenities_slug', 'amenities', ['slug'], unique=True)
+    if 'bed_amenities' not in tables:
+        op.create_table(
+            'bed_amenities',
+            sa.Column('bed_id', sa.Integer(), sa.ForeignKey('beds.id', ondelete='CASCADE'), primary_key=True),
+            sa.Column('amenity_id', sa.Integer(), sa.ForeignKey('amenities.id', ondelete='CASCADE'), primary_key=True),
+        )
+        op.create_index('ix_bed_amenities_amenity_bed', 'bed_amenities', ['amenity_id', 'bed_id'])
+
+    if 'amenities' not in [column['name'] for column in inspector.get_columns('beds')]:
+        return
+
+    amenities = sa.table('amenities', sa.column('id', sa.Integer), sa.column('name', sa.String), sa.column('slug', sa.String))
+    links = sa.table('bed_amenities', sa.column('bed_id', sa.Integer), sa.column('amenity_id', sa.Integer))
+
+    ids = {slug: amenity_id for amenity_id, slug in bind.execute(sa.select(amenities.c.id, amenities.c.slug))}
+    rows = bind.execute(sa.text("SELECT id, amenities FROM beds WHERE amenities IS NOT NULL AND amenities != ''")).all()
+
+    parsed = []
+    for bed_id, value in rows:
+        for name in value.split(','):
+            name = " ".join(name.split())
+            if not name:
+                continue
+            slug = _slug(name)
+            if slug not in ids:
+                ids[slug] = bind.execute(
+                    amenities.insert().values(name=name, slug=slug).returning(amenities.c.id)
+                ).scalar_one()
+            parsed.append((bed_id, ids[slug]))
+
+    existing = set(bind.execute(sa.select(links.c.bed_id, links.c.amenity_id)).all())
+    new_links = [{'bed_id': bed_id, 'amenity_id': amenity_id} for bed_id, amenity_id in set(parsed) - existing]
+    if new_links:
+        op.bulk_insert(links, new_links)
+
+    with op.batch_alter_table('beds') as batch_op:
+        batch_op.drop_column('amenities')
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('beds') as batch_op:
+        batch_op.add_column(sa.Column('amenities', sa.Text(), nullable=True))
+
+    bind = op.get_bind()
+    rows = bind.execute(sa.text(
+        "SELECT bed_amenities.bed_id, amenities.name FROM bed_amenities "
+        "JOIN amenities ON amenities.id = bed_amenities.amenity_id "
+        "ORDER BY bed_amenities.bed_id, amenities.id"
+    )).all()
+    grouped = {}
+    for bed_id, name in rows:
+        grouped.setdefault(bed_id, []).append(name)
+    for bed_id, names in grouped.items():
+        bind.execute(
+            sa.text("UPDATE beds SET amenities = :amenities WHERE id = :id"),
+            {'amenities': ", ".join(names), 'id': bed_id}
+        )
+
+    op.drop_index('ix_bed_amenities_amenity_bed', table_name='bed_amenities')
+    op.drop_table('bed_amenities')
+    op.drop_index('ix_amenities_slug', table_name='amenities')
+    op.drop_index('ix_amenities_id', table_name='amenities')
+    op.drop_table('amenities')
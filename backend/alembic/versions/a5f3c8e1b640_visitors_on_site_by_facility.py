@@ -0,0 +1,40 @@
+"""visitors on site by facility
+
+Revision ID: a5f3c8e1b640
+Revises: e9d2b6a4f158
+Create Date: 2026-10-20 10:41:53.214760
+
+The fire roll is now read from the database for the request's facility,
+so the open-visit partial index ix_visitors_on_site leads with
+facility_id and serves the scoped query in check-in order.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a5f3c8e1b640'
+down_revision = 'e9d2b6a4f158'
+branch_labels = None
+depends_on = None
+
+OPEN_VISITS = sa.text('check_out_time IS NULL AND check_in_time IS NOT NULL')
+
+
+def _recreate(columns):
+    indexes = {index['name']: index for index in sa.inspect(op.get_bind()).get_indexes('visitors')}
+    if indexes.get('ix_visitors_on_site', {}).get('column_names') == columns:
+        return
+    if 'ix_visitors_on_site' in indexes:
+        op.drop_index('ix_visitors_on_site', table_name='visitors')
+    op.create_index('ix_visitors_on_site', 'visitors', columns,
+                    sqlite_where=OPEN_VISITS, postgresql_where=OPEN_VISITS)
+
+
+def upgrade() -> None:
+    _recreate(['facility_id', 'check_in_time'])
+
+
+def downgrade() -> None:
+    _recreate(['check_in_time'])
@@ -0,0 +1,28 @@
+"""visitor visit date index
+
+Revision ID: b6e1a9c47d20
+Revises: 5d0b8e3f92c4
+Create Date: 2026-10-19 14:52:40.771093
+
+Index for keyset paging of visit history and for the archival job, which
+moves closed visits past VISITOR_RETENTION_DAYS to gzip'd NDJSON files.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b6e1a9c47d20'
+down_revision = '5d0b8e3f92c4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    if 'ix_visitors_visit_date' not in [index['name'] for index in sa.inspect(op.get_bind()).get_indexes('visitors')]:
+        op.create_index('ix_visitors_visit_date', 'visitors', ['visit_date', 'id'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_visitors_visit_date', table_name='visitors')
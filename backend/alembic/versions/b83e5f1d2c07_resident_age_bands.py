@@ -0,0 +1,57 @@
+"""resident age bands
+
+Revision ID: b83e5f1d2c07
+Revises: 6a1c7d4e9b20
+Create Date: 2026-10-19 21:36:52.481093
+
+birth_month and birth_day on residents (backfilled from date_of_birth)
+with a partial index over live residents for birthday lookups, and the
+per-facility age-band rollup. Ages and the rollup are recomputed on
+startup when the rollup is empty.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b83e5f1d2c07'
+down_revision = '6a1c7d4e9b20'
+branch_labels = None
+depends_on = None
+
+LIVE = sa.text('deleted_at IS NULL')
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    columns = {column['name'] for column in inspector.get_columns('residents')}
+    if 'birth_month' not in columns:
+        op.add_column('residents', sa.Column('birth_month', sa.Integer()))
+    if 'birth_day' not in columns:
+        op.add_column('residents', sa.Column('birth_day', sa.Integer()))
+    residents = sa.table('residents', sa.column('date_of_birth', sa.Date()),
+                         sa.column('birth_month', sa.Integer()), sa.column('birth_day', sa.Integer()))
+    op.execute(residents.update().where(residents.c.birth_month.is_(None)).values(
+        birth_month=sa.extract('month', residents.c.date_of_birth),
+        birth_day=sa.extract('day', residents.c.date_of_birth),
+    ))
+    if 'ix_residents_live_birthday' not in {index['name'] for index in inspector.get_indexes('residents')}:
+        op.create_index('ix_residents_live_birthday', 'residents', ['birth_month', 'birth_day'],
+                        sqlite_where=LIVE, postgresql_where=LIVE)
+    if 'resident_age_bands' not in inspector.get_table_names():
+        op.create_table(
+            'resident_age_bands',
+            sa.Column('facility_id', sa.Integer(), primary_key=True),
+            sa.Column('band', sa.Integer(), primary_key=True),
+            sa.Column('residents', sa.Integer(), nullable=False),
+            sa.Column('as_of', sa.Date(), nullable=False),
+        )
+
+
+def downgrade() -> None:
+    op.drop_table('resident_age_bands')
+    op.drop_index('ix_residents_live_birthday', table_name='residents')
+    with op.batch_alter_table('residents') as batch_op:
+        batch_op.drop_column('birth_day')
+        batch_op.drop_column('birth_month')
@@ -0,0 +1,54 @@
+"""billing runs
+
+Revision ID: c27f6d8b1e95
+Revises: b6e1a9c47d20
+Create Date: 2026-10-19 15:31:06.204518
+
+Billing run bookkeeping, the link from generated invoices to their run,
+and the (period start, resident) index used to skip residents who are
+already billed for a period.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c27f6d8b1e95'
+down_revision = 'b6e1a9c47d20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    if 'billing_runs' not in inspector.get_table_names():
+        op.create_table(
+            'billing_runs',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('period_start', sa.Date(), nullable=False),
+            sa.Column('period_end', sa.Date(), nullable=False),
+            sa.Column('status', sa.String(length=20), nullable=False),
+            sa.Column('invoices_created', sa.Integer()),
+            sa.Column('total_amount', sa.Float()),
+            sa.Column('error', sa.Text()),
+            sa.Column('started_at', sa.DateTime(), nullable=False),
+            sa.Column('finished_at', sa.DateTime()),
+            sa.UniqueConstraint('period_start', 'period_end', name='uq_billing_runs_period'),
+        )
+        op.create_index('ix_billing_runs_id', 'billing_runs', ['id'])
+    if 'billing_run_id' not in [column['name'] for column in inspector.get_columns('billing')]:
+        with op.batch_alter_table('billing') as batch_op:
+            batch_op.add_column(sa.Column('billing_run_id', sa.Integer(), nullable=True))
+            batch_op.create_foreign_key('fk_billing_billing_run_id', 'billing_runs', ['billing_run_id'], ['id'])
+    if 'ix_billing_period_resident' not in [index['name'] for index in inspector.get_indexes('billing')]:
+        op.create_index('ix_billing_period_resident', 'billing', ['billing_period_start', 'resident_id'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_billing_period_resident', table_name='billing')
+    with op.batch_alter_table('billing') as batch_op:
+        batch_op.drop_constraint('fk_billing_billing_run_id', type_='foreignkey')
+        batch_op.drop_column('billing_run_id')
+    op.drop_index('ix_billing_runs_id', table_name='billing_runs')
+    op.drop_table('billing_runs')
@@ -0,0 +1,37 @@
+"""staff email per facility
+
+Revision ID: c4a7e2f9d813
+Revises: b83e5f1d2c07
+Create Date: 2026-10-20 09:14:37.552019
+
+Staff emails are unique within a facility rather than across the whole
+database: the unique ix_staff_email becomes a plain index and
+uq_staff_facility_email takes over, as uq_beds_facility_bed_number did
+for bed numbers.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4a7e2f9d813'
+down_revision = 'b83e5f1d2c07'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    staff_indexes = {index['name']: index for index in sa.inspect(op.get_bind()).get_indexes('staff')}
+    if 'uq_staff_facility_email' in staff_indexes:
+        return
+    if staff_indexes.get('ix_staff_email', {}).get('unique'):
+        op.drop_index('ix_staff_email', table_name='staff')
+        op.create_index('ix_staff_email', 'staff', ['email'])
+    op.create_index('uq_staff_facility_email', 'staff', ['facility_id', 'email'], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index('uq_staff_facility_email', table_name='staff')
+    op.drop_index('ix_staff_email', table_name='staff')
+    op.create_index('ix_staff_email', 'staff', ['email'], unique=True)
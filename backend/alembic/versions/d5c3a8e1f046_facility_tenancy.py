@@ -0,0 +1,86 @@
+"""facility tenancy
+
+Revision ID: d5c3a8e1f046
+Revises: 4b7f1e9c3a58
+Create Date: 2026-10-19 18:40:27.915032
+
+Adds facility_id (defaulting existing rows to facility 1) and a facility
+index to every facility-owned table, makes bed numbers and billing run
+periods unique per facility, and recreates the bed occupancy rollups keyed
+by facility (they are rebuilt from the beds table on startup).
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd5c3a8e1f046'
+down_revision = '4b7f1e9c3a58'
+branch_labels = None
+depends_on = None
+
+SCOPED_TABLES = [
+    'residents', 'beds', 'medications', 'checkups', 'events', 'event_occurrences', 'documents',
+    'staff', 'shift_assignments', 'visitors', 'billing', 'billing_runs', 'resident_balances',
+]
+
+
+def _create_rollups(with_facility: bool):
+    columns = [sa.Column('facility_id', sa.Integer(), primary_key=True)] if with_facility else []
+    op.create_table(
+        'bed_occupancy_rollups',
+        *columns,
+        sa.Column('floor', sa.Integer(), primary_key=True),
+        sa.Column('room_number', sa.String(length=10), primary_key=True),
+        sa.Column('total_beds', sa.Integer(), nullable=False),
+        sa.Column('occupied_beds', sa.Integer(), nullable=False),
+        sa.Column('vacant_beds', sa.Integer(), nullable=False),
+        sa.Column('maintenance_beds', sa.Integer(), nullable=False),
+        sa.Column('occupied_revenue', sa.BigInteger(), nullable=False),
+        sa.Column('potential_revenue', sa.BigInteger(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.func.now()),
+    )
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    for table in SCOPED_TABLES:
+        if 'facility_id' not in [column['name'] for column in inspector.get_columns(table)]:
+            op.add_column(table, sa.Column('facility_id', sa.Integer(), nullable=False, server_default='1'))
+            op.create_index(f'ix_{table}_facility_id', table, ['facility_id'])
+
+    bed_indexes = {index['name']: index for index in inspector.get_indexes('beds')}
+    if 'uq_beds_facility_bed_number' not in bed_indexes:
+        if bed_indexes.get('ix_beds_bed_number', {}).get('unique'):
+            op.drop_index('ix_beds_bed_number', table_name='beds')
+            op.create_index('ix_beds_bed_number', 'beds', ['bed_number'])
+        op.create_index('uq_beds_facility_bed_number', 'beds', ['facility_id', 'bed_number'], unique=True)
+
+    run_constraints = [constraint['name'] for constraint in inspector.get_unique_constraints('billing_runs')]
+    if 'uq_billing_runs_facility_period' not in run_constraints:
+        with op.batch_alter_table('billing_runs') as batch_op:
+            if 'uq_billing_runs_period' in run_constraints:
+                batch_op.drop_constraint('uq_billing_runs_period', type_='unique')
+            batch_op.create_unique_constraint(
+                'uq_billing_runs_facility_period', ['facility_id', 'period_start', 'period_end']
+            )
+
+    if 'facility_id' not in [column['name'] for column in inspector.get_columns('bed_occupancy_rollups')]:
+        op.drop_table('bed_occupancy_rollups')
+        _create_rollups(with_facility=True)
+
+
+def downgrade() -> None:
+    op.drop_table('bed_occupancy_rollups')
+    _create_rollups(with_facility=False)
+    with op.batch_alter_table('billing_runs') as batch_op:
+        batch_op.drop_constraint('uq_billing_runs_facility_period', type_='unique')
+        batch_op.create_unique_constraint('uq_billing_runs_period', ['period_start', 'period_end'])
+    op.drop_index('uq_beds_facility_bed_number', table_name='beds')
+    op.drop_index('ix_beds_bed_number', table_name='beds')
+    op.create_index('ix_beds_bed_number', 'beds', ['bed_number'], unique=True)
+    for table in reversed(SCOPED_TABLES):
+        op.drop_index(f'ix_{table}_facility_id', table_name=table)
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column('facility_id')
@@ -0,0 +1,44 @@
+"""event participants
+
+Revision ID: e412e921cb8e
+Revises: ee614977f7d3
+Create Date: 2026-10-19 12:15:42.118304
+
+Registration table for events. Seat counts stay on
+events.current_participants, which existing rows already carry.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e412e921cb8e'
+down_revision = 'ee614977f7d3'
+branch_labels = None
+depends_on = None
+
+participant_status = sa.Enum('REGISTERED', 'WAITLISTED', name='participantstatus')
+
+
+def upgrade() -> None:
+    if 'event_participants' in sa.inspect(op.get_bind()).get_table_names():
+        return
+    op.create_table(
+        'event_participants',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('event_id', sa.Integer(), sa.ForeignKey('events.id', ondelete='CASCADE'), nullable=False),
+        sa.Column('resident_id', sa.Integer(), sa.ForeignKey('residents.id', ondelete='CASCADE'), nullable=False),
+        sa.Column('status', participant_status, nullable=False),
+        sa.Column('registered_at', sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.UniqueConstraint('event_id', 'resident_id', name='uq_event_participants_event_resident'),
+    )
+    op.create_index('ix_event_participants_id', 'event_participants', ['id'])
+    op.create_index('ix_event_participants_event_status', 'event_participants', ['event_id', 'status', 'id'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_event_participants_event_status', table_name='event_participants')
+    op.drop_index('ix_event_participants_id', table_name='event_participants')
+    op.drop_table('event_participants')
+    participant_status.drop(op.get_bind(), checkfirst=True)
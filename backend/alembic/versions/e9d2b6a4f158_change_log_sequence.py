@@ -0,0 +1,38 @@
+"""change log sequence
+
+Revision ID: e9d2b6a4f158
+Revises: c4a7e2f9d813
+Create Date: 2026-10-20 10:02:18.907345
+
+change_log_sequence holds the last change_log seq handed out. Transactions
+take their seqs from it as they commit, so seqs follow commit order. It is
+seeded from the highest seq already logged.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e9d2b6a4f158'
+down_revision = 'c4a7e2f9d813'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    if 'change_log_sequence' in sa.inspect(op.get_bind()).get_table_names():
+        return
+    counter = op.create_table(
+        'change_log_sequence',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('last_seq', sa.Integer(), nullable=False),
+    )
+    change_log = sa.table('change_log', sa.column('seq', sa.Integer()))
+    op.execute(counter.insert().values(
+        id=1, last_seq=sa.select(sa.func.coalesce(sa.func.max(change_log.c.seq), 0)).scalar_subquery()
+    ))
+
+
+def downgrade() -> None:
+    op.drop_table('change_log_sequence')
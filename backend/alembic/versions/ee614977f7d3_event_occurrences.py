@@ -0,0 +1,43 @@
+"""event occurrences
+
+Revision ID: ee614977f7d3
+Revises: 651b21f63be4
+Create Date: 2026-10-19 11:40:05.207761
+
+Materialised event occurrences. Rows are filled in by the
+event_occurrences background job on its first run.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'ee614977f7d3'
+down_revision = '651b21f63be4'
+branch_labels = None
+depends_on = None
+
+event_status = sa.Enum('PLANNED', 'ONGOING', 'COMPLETED', 'CANCELLED', name='eventstatus')
+
+
+def upgrade() -> None:
+    if 'event_occurrences' in sa.inspect(op.get_bind()).get_table_names():
+        return
+    op.create_table(
+        'event_occurrences',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('event_id', sa.Integer(), sa.ForeignKey('events.id', ondelete='CASCADE'), nullable=False),
+        sa.Column('occurrence_at', sa.DateTime(), nullable=False),
+        sa.Column('status', sa.Enum(name='eventstatus', create_type=False, *event_status.enums), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.UniqueConstraint('event_id', 'occurrence_at', name='uq_event_occurrences_event_at'),
+    )
+    op.create_index('ix_event_occurrences_id', 'event_occurrences', ['id'])
+    op.create_index('ix_event_occurrences_at_status', 'event_occurrences', ['occurrence_at', 'status'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_event_occurrences_at_status', table_name='event_occurrences')
+    op.drop_index('ix_event_occurrences_id', table_name='event_occurrences')
+    op.drop_table('event_occurrences')
@@ -0,0 +1,73 @@
+"""money as integer cents
+
+Revision ID: f3a8c2e71d64
+Revises: c27f6d8b1e95
+Create Date: 2026-10-19 16:20:44.518302
+
+Converts every Float money column to a BIGINT count of cents
+(app.money.Cents), rounding existing values to the nearest cent.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3a8c2e71d64'
+down_revision = 'c27f6d8b1e95'
+branch_labels = None
+depends_on = None
+
+MONEY_COLUMNS = {
+    'beds': ['monthly_rate'],
+    'bed_occupancy_rollups': ['occupied_revenue', 'potential_revenue'],
+    'billing': [
+        'accommodation_charges', 'medical_charges', 'food_charges', 'other_charges',
+        'total_amount', 'amount_paid', 'balance',
+    ],
+    'billing_runs': ['total_amount'],
+}
+
+
+def _columns_to_convert(table, to_integer):
+    existing = {column['name']: column['type'] for column in sa.inspect(op.get_bind()).get_columns(table)}
+    return [
+        name for name in MONEY_COLUMNS[table]
+        if name in existing and isinstance(existing[name], sa.Integer) != to_integer
+    ]
+
+
+def upgrade() -> None:
+    postgresql = op.get_bind().dialect.name == 'postgresql'
+    for table in MONEY_COLUMNS:
+        columns = _columns_to_convert(table, to_integer=True)
+        if not columns:
+            continue
+        if not postgresql:
+            op.execute(sa.text(f"UPDATE {table} SET " + ", ".join(f"{name} = ROUND({name} * 100)" for name in columns)))
+        with op.batch_alter_table(table) as batch_op:
+            for name in columns:
+                batch_op.alter_column(
+                    name,
+                    type_=sa.BigInteger(),
+                    existing_type=sa.Float(),
+                    postgresql_using=f"ROUND({name} * 100)::bigint",
+                )
+
+
+def downgrade() -> None:
+    postgresql = op.get_bind().dialect.name == 'postgresql'
+    for table in MONEY_COLUMNS:
+        columns = _columns_to_convert(table, to_integer=False)
+        if not columns:
+            continue
+        with op.batch_alter_table(table) as batch_op:
+            for name in columns:
+                batch_op.alter_column(
+                    name,
+                    type_=sa.Float(),
+                    existing_type=sa.BigInteger(),
+                    postgresql_using=f"{name} / 100.0",
+                )
+        if not postgresql:
+            op.execute(sa.text(f"UPDATE {table} SET " + ", ".join(f"{name} = {name} / 100.0" for name in columns)))
@@ -0,0 +1,34 @@
+"""checkup slot locks
+
+Revision ID: f81c4d2a6e57
+Revises: a5f3c8e1b640
+Create Date: 2026-10-21 09:41:26.318204
+
+checkup_slot_locks holds one row per booking key (doctor, location or
+resident within a facility). Booking a checkup locks its keys' rows and
+then checks the checkups table for overlaps, so double-booking checks
+hold across workers and hosts. Rows are created on first use.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f81c4d2a6e57'
+down_revision = 'a5f3c8e1b640'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    if 'checkup_slot_locks' in sa.inspect(op.get_bind()).get_table_names():
+        return
+    op.create_table(
+        'checkup_slot_locks',
+        sa.Column('lock_key', sa.String(length=200), primary_key=True),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('checkup_slot_locks')
@@ -0,0 +1,189 @@
+"""
+Resident ages and the age-band rollup.
+
+``residents.age`` is derived from ``date_of_birth`` whenever a resident is
+written, together with ``birth_month`` and ``birth_day``, which back the
+``ix_residents_live_birthday`` index. Ages only change on birthdays, so the
+nightly ``resident_ages`` job reads just the residents whose birthday fell
+since its last run through that index and moves their age on; nothing ever
+recomputes every age except the one-off backfill in ``ensure``.
+
+``resident_age_bands`` counts active residents per ten-year band for each
+facility. Every flush that inserts, deletes, discharges or ages a resident
+adjusts the affected bands in the same transaction with relative UPDATEs,
+so the staffing report only ever reads the rollup.
+
+Residents born on 29 February have their birthday on 1 March in other
+years.
+"""
+import calendar
+from collections import Counter, defaultdict
+from datetime import date, timedelta
+
+from sqlalchemy import and_, event, false, func, insert, inspect, or_, update
+from sqlalchemy.orm import Session
+
+from app import models
+from app.events import publish
+
+
+def age_on(date_of_birth: date, day: date) -> int:
+    return day.year - date_of_birth.year - ((day.month, day.day) < (date_of_birth.month, date_of_birth.day))
+
+
+def birthday_in(date_of_birth: date, year: int) -> date:
+    if (date_of_birth.month, date_of_birth.day) == (2, 29) and not calendar.isleap(year):
+        return date(year, 3, 1)
+    return date_of_birth.replace(year=year)
+
+
+def next_birthday(date_of_birth: date, day: date) -> date:
+    """The first birthday on or after ``day``"""
+    birthday = birthday_in(date_of_birth, day.year)
+    return birthday if birthday >= day else birthday_in(date_of_birth, day.year + 1)
+
+
+def band_for(age: int) -> int:
+    return age // 10 * 10
+
+
+def birthdays_between(start: date, end: date):
+    """Filter for residents whose birthday falls on a day from ``start`` to ``end``, inclusive"""
+    if end < start:
+        return false()
+    days = defaultdict(set)
+    for offset in range(min((end - start).days, 365) + 1):
+        day = start + timedelta(days=offset)
+        days[day.month].add(day.day)
+        if (day.month, day.day) == (3, 1) and not calendar.isleap(day.year):
+            days[2].add(29)
+    resident = models.Resident
+    return or_(*[
+        and_(resident.birth_month == month, resident.birth_day.in_(sorted(month_days)))
+        for month, month_days in sorted(days.items())
+    ])
+
+
+def _derive(resident: models.Resident, day: date):
+    resident.birth_month = resident.date_of_birth.month
+    resident.birth_day = resident.date_of_birth.day
+    resident.age = age_on(resident.date_of_birth, day)
+
+
+@event.listens_for(models.Resident, "before_insert")
+def _derive_on_insert(mapper, connection, resident):
+    _derive(resident, date.today())
+
+
+@event.listens_for(models.Resident, "before_update")
+def _derive_on_update(mapper, connection, resident):
+    if inspect(resident).attrs.date_of_birth.history.has_changes():
+        _derive(resident, date.today())
+
+
+def _counted_band(status, deleted_at, age):
+    """The band a resident counts towards, or None when they aren't counted"""
+    if status != models.ResidentStatus.ACTIVE or deleted_at is not None or age is None:
+        return None
+    return band_for(age)
+
+
+def _before(state, key):
+    history = state.attrs[key].history
+    if history.deleted:
+        return history.deleted[0]
+    return history.unchanged[0] if history.unchanged else None
+
+
+@event.listens_for(Session, "after_flush")
+def _track_bands(session, flush_context):
+    deltas = Counter()
+    for objects, existed, exists in ((session.new, False, True), (session.dirty, True, True), (session.deleted, True, False)):
+        for obj in objects:
+            if not isinstance(obj, models.Resident):
+                continue
+            state = inspect(obj)
+            before = _counted_band(*(_before(state, key) for key in ("status", "deleted_at", "age"))) if existed else None
+            after = _counted_band(obj.status, obj.deleted_at, obj.age) if exists else None
+            if before != after:
+                if before is not None:
+                    deltas[(obj.facility_id, before)] -= 1
+                if after is not None:
+                    deltas[(obj.facility_id, after)] += 1
+    if any(deltas.values()):
+        _apply(session, deltas)
+
+
+def _apply(session: Session, deltas: Counter):
+    """Add per-(facility, band) deltas to the rollup; runs in the writing transaction"""
+    table = models.ResidentAgeBand.__table__
+    for (facility_id, band), delta in deltas.items():
+        if not delta:
+            continue
+        updated = session.execute(
+            update(table).where(and_(table.c.facility_id == facility_id, table.c.band == band)).values(
+                residents=table.c.residents + delta
+            )
+        )
+        if not updated.rowcount:
+            session.execute(insert(table).values(
+                facility_id=facility_id, band=band, residents=delta, as_of=date.today()
+            ))
+
+
+def refresh(db: Session, as_of: date = None):
+    """Move on the age of everyone whose birthday fell since the last refresh, up to ``as_of``"""
+    as_of = as_of or date.today()
+    band = models.ResidentAgeBand
+    last = db.query(func.min(band.as_of)).scalar()
+    if last is None:
+        return rebuild(db, as_of)
+    if last >= as_of:
+        return {"rows": 0, "batches": 0}
+    start = max(last + timedelta(days=1), as_of - timedelta(days=365))
+    rows = 0
+    for resident in db.query(models.Resident).filter(birthdays_between(start, as_of)).all():
+        age = age_on(resident.date_of_birth, as_of)
+        if resident.age != age:
+            resident.age = age
+            rows += 1
+    db.query(band).update({band.as_of: as_of}, synchronize_session=False)
+    db.commit()
+    if rows:
+        publish("residents")
+    return {"rows": rows, "batches": 1}
+
+
+def rebuild(db: Session, as_of: date = None):
+    """Recompute every age and the age-band rollup from date_of_birth (backfill / repair)"""
+    as_of = as_of or date.today()
+    resident = models.Resident
+    rows = 0
+    for person in db.query(resident).all():
+        if person.birth_month is None or person.age != age_on(person.date_of_birth, as_of):
+            _derive(person, as_of)
+            rows += 1
+    db.flush()
+
+    counts = Counter()
+    for facility_id, age, residents in db.query(resident.facility_id, resident.age, func.count(resident.id)).filter(
+        resident.status == models.ResidentStatus.ACTIVE
+    ).group_by(resident.facility_id, resident.age):
+        counts[(facility_id, band_for(age))] += residents
+    db.query(models.ResidentAgeBand).delete(synchronize_session=False)
+    if counts:
+        db.execute(insert(models.ResidentAgeBand), [
+            {"facility_id": facility_id, "band": band, "residents": residents, "as_of": as_of}
+            for (facility_id, band), residents in counts.items()
+        ])
+    db.commit()
+    if rows:
+        publish("residents")
+    return {"rows": rows, "batches": 1}
+
+
+def ensure(db: Session):
+    """Build the rollup once when residents exist but were never rolled up"""
+    if db.query(models.ResidentAgeBand).first() is None and db.query(models.Resident.id).first() is not None:
+        return rebuild(db)
+    return None
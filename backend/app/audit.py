@@ -0,0 +1,336 @@
+"""
+Write-behind audit log.
+
+Changes to the tables in ``AUDIT_TABLES`` are captured from session events
+and persisted off the request path:
+
+* ``after_flush`` records each inserted, updated or deleted row with the
+  before and after value of every changed column (read from the attribute
+  history SQLAlchemy already keeps); bulk ORM statements (``query.update``,
+  ``insert(Model)`` with a list of rows) are recorded as the statement, or
+  one entry per inserted row. Nothing is serialised here.
+* ``after_commit`` hands the transaction's entries to ``audit_log`` as one
+  queue item; a rollback discards them, so the log only holds committed
+  changes.
+* A writer thread drains the queue every ``AUDIT_FLUSH_INTERVAL_SECONDS``
+  or ``AUDIT_BATCH_SIZE`` entries and appends them, serialised, to the
+  ``audit_log`` table of each facility's database (``AUDIT_SINK=table``)
+  or to segmented NDJSON files in ``AUDIT_LOG_DIR`` (``AUDIT_SINK=file``).
+
+The queue holds at most ``AUDIT_QUEUE_SIZE`` transactions. When it is full,
+``AUDIT_OVERFLOW=block`` makes the committing request wait up to
+``AUDIT_BLOCK_SECONDS`` for room and ``drop`` discards the entries at once;
+either way dropped entries are counted and logged. ``AUDIT_DURABILITY=sync``
+makes a commit wait until its entries are written, and ``AUDIT_FSYNC``
+fsyncs each file batch.
+
+The actor is the staff id (``sub`` claim) of the request's bearer token,
+held in ``current_actor`` for the request.
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from collections import Counter, defaultdict
+from contextvars import ContextVar
+from datetime import date, datetime
+from decimal import Decimal
+from enum import Enum
+from typing import Any, List, NamedTuple, Optional
+
+from decouple import Csv, config
+from sqlalchemy import event, inspect, insert
+from sqlalchemy.orm import Session
+
+from app import models, tenancy
+from app.database import engines
+
+AUDIT_ENABLED = config("AUDIT_ENABLED", default=True, cast=bool)
+AUDIT_TABLES = frozenset(config("AUDIT_TABLES", default="residents,medications,billing,payments", cast=Csv()))
+AUDIT_SINK = config("AUDIT_SINK", default="table")  # table, file
+AUDIT_LOG_DIR = config("AUDIT_LOG_DIR", default="audit")
+AUDIT_SEGMENT_BYTES = config("AUDIT_SEGMENT_BYTES", default=16 * 1024 * 1024, cast=int)
+AUDIT_QUEUE_SIZE = config("AUDIT_QUEUE_SIZE", default=10000, cast=int)
+AUDIT_BATCH_SIZE = config("AUDIT_BATCH_SIZE", default=500, cast=int)
+AUDIT_FLUSH_INTERVAL_SECONDS = config("AUDIT_FLUSH_INTERVAL_SECONDS", default=1, cast=float)
+AUDIT_OVERFLOW = config("AUDIT_OVERFLOW", default="block")  # block, drop
+AUDIT_BLOCK_SECONDS = config("AUDIT_BLOCK_SECONDS", default=0.5, cast=float)
+AUDIT_DURABILITY = config("AUDIT_DURABILITY", default="async")  # async, sync
+AUDIT_FSYNC = config("AUDIT_FSYNC", default=False, cast=bool)
+
+logger = logging.getLogger(__name__)
+
+current_actor: ContextVar[Optional[int]] = ContextVar("current_actor", default=None)
+
+
+class Entry(NamedTuple):
+    occurred_at: datetime
+    facility_id: Optional[int]
+    actor_id: Optional[int]
+    table_name: str
+    row_id: Optional[str]
+    action: str
+    changes: Any  # {"column": [before, after]}, or the statement when dialect is set
+    dialect: Any
+    database_url: str
+
+
+def _jsonable(value):
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        # Money stays exact
+        return str(value)
+    return str(value)
+
+
+def _serialise(entry: Entry) -> dict:
+    changes = entry.changes
+    if entry.dialect is not None:
+        try:
+            sql = str(changes.compile(dialect=entry.dialect, compile_kwargs={"literal_binds": True}))
+        except Exception:
+            sql = str(changes.compile(dialect=entry.dialect))
+        changes = {"sql": sql}
+    return {
+        "occurred_at": entry.occurred_at,
+        "facility_id": entry.facility_id,
+        "actor_id": entry.actor_id,
+        "table_name": entry.table_name,
+        "row_id": entry.row_id,
+        "action": entry.action,
+        "changes": json.dumps(changes, default=_jsonable),
+    }
+
+
+class TableSink:
+    """Appends to ``audit_log`` in the database the change was made in"""
+
+    def write(self, entries: List[Entry]):
+        by_database = defaultdict(list)
+        for entry in entries:
+            by_database[entry.database_url].append(_serialise(entry))
+        for url, rows in by_database.items():
+            with engines.get(url).begin() as connection:
+                connection.execute(insert(models.AuditLog.__table__), rows)
+
+
+class FileSink:
+    """Appends NDJSON lines to ``audit-<timestamp>.ndjson`` segments of at most ``segment_bytes``"""
+
+    def __init__(self, directory: str = AUDIT_LOG_DIR, segment_bytes: int = AUDIT_SEGMENT_BYTES, fsync: bool = AUDIT_FSYNC):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.fsync = fsync
+        self._path = None
+
+    def _segment(self) -> str:
+        if self._path is None or os.path.getsize(self._path) >= self.segment_bytes:
+            os.makedirs(self.directory, exist_ok=True)
+            stamp = datetime.utcnow().strftime("%Y%m%dT%H%M%S%f")
+            self._path = os.path.join(self.directory, f"audit-{stamp}.ndjson")
+        return self._path
+
+    def write(self, entries: List[Entry]):
+        lines = "".join(json.dumps(_serialise(entry), default=_jsonable) + "\n" for entry in entries)
+        with open(self._segment(), "a", encoding="utf-8") as segment:
+            segment.write(lines)
+            if self.fsync:
+                segment.flush()
+                os.fsync(segment.fileno())
+
+
+class AuditLog:
+    """Bounded queue of committed transactions' entries and the thread that writes them"""
+
+    def __init__(self, sink, max_transactions: int = AUDIT_QUEUE_SIZE, batch_size: int = AUDIT_BATCH_SIZE,
+                 flush_interval: float = AUDIT_FLUSH_INTERVAL_SECONDS, overflow: str = AUDIT_OVERFLOW,
+                 block_seconds: float = AUDIT_BLOCK_SECONDS, durability: str = AUDIT_DURABILITY):
+        self.sink = sink
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overflow = overflow
+        self.block_seconds = block_seconds
+        self.durability = durability
+        self._queue = queue.Queue(maxsize=max_transactions)
+        self._thread = None
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+        self._counts = Counter()
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 10):
+        """Write everything queued so far and stop the writer"""
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def submit(self, entries: List[Entry]):
+        if self._thread is None or not self._thread.is_alive():
+            self.start()
+        written = threading.Event() if self.durability == "sync" else None
+        try:
+            if self.overflow == "block":
+                self._queue.put((entries, written), timeout=self.block_seconds)
+            else:
+                self._queue.put_nowait((entries, written))
+        except queue.Full:
+            self._count("dropped", len(entries))
+            logger.warning("Audit queue full; dropped %d entries", len(entries))
+            return
+        if written is not None and not written.wait(self.block_seconds + self.flush_interval * 10):
+            logger.warning("Timed out waiting for %d audit entries to be written", len(entries))
+
+    def _count(self, outcome: str, n: int):
+        with self._lock:
+            self._counts[outcome] += n
+
+    def _run(self):
+        while True:
+            batch, acknowledgements = [], []
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    entries, written = self._queue.get(timeout=max(deadline - time.monotonic(), 0.001))
+                except queue.Empty:
+                    break
+                batch.extend(entries)
+                if written is not None:
+                    acknowledgements.append(written)
+            if batch:
+                self.flush(batch)
+            for written in acknowledgements:
+                written.set()
+            if self._stopping.is_set() and self._queue.empty():
+                return
+
+    def flush(self, batch: List[Entry]):
+        try:
+            self.sink.write(batch)
+            self._count("written", len(batch))
+        except Exception:
+            self._count("failed", len(batch))
+            logger.exception("Failed to write %d audit entries", len(batch))
+
+    def stats(self) -> dict:
+        with self._lock:
+            counts = dict(self._counts)
+        return {
+            "enabled": AUDIT_ENABLED,
+            "sink": type(self.sink).__name__,
+            "queued_transactions": self._queue.qsize(),
+            "written": counts.get("written", 0),
+            "dropped": counts.get("dropped", 0),
+            "failed": counts.get("failed", 0),
+        }
+
+
+audit_log = AuditLog(FileSink() if AUDIT_SINK == "file" else TableSink())
+atexit.register(audit_log.stop)
+
+
+def _pending(session: Session) -> list:
+    return session.info.setdefault("audit_entries", [])
+
+
+def _database_url(session: Session) -> str:
+    return session.info.get("database_url") or tenancy.router.url_for(session.info.get("facility_id"))
+
+
+def _row_changes(state, action: str) -> dict:
+    """{"column": [before, after]} for the columns this flush wrote"""
+    if action == "update":
+        changes = {}
+        for attr in state.mapper.column_attrs:
+            history = state.attrs[attr.key].history
+            if history.has_changes():
+                changes[attr.key] = [
+                    history.deleted[0] if history.deleted else None,
+                    history.added[0] if history.added else None,
+                ]
+        return changes
+    columns = state.mapper.column_attrs
+    values = {key: value for key, value in state.dict.items() if key in columns and value is not None}
+    if action == "insert":
+        return {key: [None, value] for key, value in values.items()}
+    return {key: [value, None] for key, value in values.items()}
+
+
+@event.listens_for(Session, "after_flush")
+def _capture_flush(session, flush_context):
+    if not AUDIT_ENABLED:
+        return
+    occurred_at, actor_id, database_url = datetime.utcnow(), current_actor.get(), _database_url(session)
+    facility_id = session.info.get("facility_id")
+    for action, objects in (("insert", session.new), ("update", session.dirty), ("delete", session.deleted)):
+        for obj in objects:
+            state = inspect(obj)
+            table_name = state.mapper.local_table.name
+            if table_name not in AUDIT_TABLES:
+                continue
+            try:
+                changes = _row_changes(state, action)
+                if not changes:
+                    continue
+                row_id = ",".join(map(str, state.mapper.primary_key_from_instance(obj)))
+            except Exception:
+                # Like event handlers, auditing never fails the write it describes
+                logger.exception("Failed to capture audit entry for %s", table_name)
+                continue
+            _pending(session).append(Entry(
+                occurred_at, state.dict.get("facility_id", facility_id), actor_id, table_name, row_id, action, changes, None, database_url
+            ))
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _capture_statement(state):
+    if not AUDIT_ENABLED or not (state.is_insert or state.is_update or state.is_delete):
+        return
+    mapper = state.bind_mapper
+    if mapper is None or mapper.local_table.name not in AUDIT_TABLES:
+        return
+    table_name = mapper.local_table.name
+    action = "insert" if state.is_insert else "update" if state.is_update else "delete"
+    session = state.session
+    occurred_at, facility_id, actor_id = datetime.utcnow(), session.info.get("facility_id"), current_actor.get()
+    database_url = _database_url(session)
+    pending = _pending(session)
+    if state.is_insert and isinstance(state.parameters, list):
+        for row in state.parameters:
+            changes = {key: [None, value] for key, value in row.items() if value is not None}
+            pending.append(Entry(occurred_at, row.get("facility_id", facility_id), actor_id, table_name, None,
+                                 action, changes, None, database_url))
+    else:
+        # Compiled to SQL by the writer thread, not here
+        pending.append(Entry(occurred_at, facility_id, actor_id, table_name, None, action,
+                             state.statement, session.get_bind().dialect, database_url))
+
+
+@event.listens_for(Session, "after_commit")
+def _submit(session):
+    entries = session.info.pop("audit_entries", None)
+    if entries:
+        audit_log.submit(entries)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard(session):
+    session.info.pop("audit_entries", None)
+
+
+@event.listens_for(models.AuditLog, "before_update")
+@event.listens_for(models.AuditLog, "before_delete")
+def _append_only(mapper, connection, target):
+    raise ValueError("audit_log is append-only")
@@ -0,0 +1,221 @@
+"""
+In-memory index of vacant beds used by the bed recommender.
+
+The index is loaded once from the database and then kept current by the
+bed CRUD operations (create, assign, release) and by resident edits that
+change an occupant's gender, so recommendations are answered from set
+intersections and a sorted rate list. The index only sees this process's
+writes, so the beds it recommends are re-checked against the beds table,
+and assignment takes a bed with a conditional UPDATE on its status; beds
+found taken elsewhere are dropped with ``bed_unavailable``.
+"""
+import heapq
+import threading
+from bisect import bisect_left, bisect_right, insort
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from decimal import Decimal
+from typing import FrozenSet, Iterable, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from app import models
+from app.tenancy import FacilityLocal
+from app.money import ZERO
+
+
+def parse_amenities(names: Iterable[str]) -> FrozenSet[str]:
+    """Normalise requested amenity names to Amenity slugs"""
+    return frozenset(models.Amenity.slug_for(name) for name in names if name and name.strip())
+
+
+def _normalise(value: Optional[str]) -> Optional[str]:
+    return value.strip().lower() if value else None
+
+
+@dataclass(frozen=True)
+class VacantBed:
+    id: int
+    bed_number: str
+    room_number: str
+    floor: int
+    bed_type: Optional[str]
+    monthly_rate: Decimal
+    amenities: FrozenSet[str]  # slugs, for matching
+    amenity_names: Tuple[str, ...]  # display labels, for responses
+
+    @property
+    def room(self):
+        return (self.floor, self.room_number)
+
+
+class VacantBedIndex:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.loaded = False
+        self._clear()
+
+    def _clear(self):
+        self._beds = {}
+        self._by_floor = defaultdict(set)
+        self._by_type = defaultdict(set)
+        self._by_amenity = defaultdict(set)
+        self._by_rate = []  # sorted (monthly_rate, bed_id)
+        self._room_genders = defaultdict(Counter)
+
+    def rebuild(self, db: Session):
+        """Reload the index from the database"""
+        beds = db.query(models.Bed).filter(models.Bed.status == models.BedStatus.VACANT).all()
+        occupants = db.query(models.Bed.floor, models.Bed.room_number, models.Resident.gender).join(
+            models.Resident, models.Resident.bed_id == models.Bed.id
+        ).all()
+        with self._lock:
+            self._clear()
+            for bed in beds:
+                self._add(bed)
+            for floor, room_number, gender in occupants:
+                self._room_genders[(floor, room_number)][_normalise(gender)] += 1
+            self.loaded = True
+
+    def __len__(self):
+        return len(self._beds)
+
+    def _add(self, bed: models.Bed):
+        entry = VacantBed(
+            id=bed.id,
+            bed_number=bed.bed_number,
+            room_number=bed.room_number,
+            floor=bed.floor,
+            bed_type=_normalise(bed.bed_type),
+            monthly_rate=bed.monthly_rate or ZERO,
+            amenities=frozenset(amenity.slug for amenity in bed.amenities),
+            amenity_names=tuple(sorted(amenity.name for amenity in bed.amenities)),
+        )
+        self._discard(entry.id)
+        self._beds[entry.id] = entry
+        self._by_floor[entry.floor].add(entry.id)
+        self._by_type[entry.bed_type].add(entry.id)
+        for amenity in entry.amenities:
+            self._by_amenity[amenity].add(entry.id)
+        insort(self._by_rate, (entry.monthly_rate, entry.id))
+
+    def _discard(self, bed_id: int):
+        entry = self._beds.pop(bed_id, None)
+        if entry is None:
+            return
+        self._by_floor[entry.floor].discard(bed_id)
+        self._by_type[entry.bed_type].discard(bed_id)
+        for amenity in entry.amenities:
+            self._by_amenity[amenity].discard(bed_id)
+        position = bisect_left(self._by_rate, (entry.monthly_rate, bed_id))
+        if position < len(self._by_rate) and self._by_rate[position] == (entry.monthly_rate, bed_id):
+            del self._by_rate[position]
+
+    def _uncount(self, bed: models.Bed, occupant_gender: Optional[str]):
+        if not occupant_gender:
+            return
+        genders = self._room_genders[(bed.floor, bed.room_number)]
+        genders[_normalise(occupant_gender)] -= 1
+        if genders[_normalise(occupant_gender)] <= 0:
+            del genders[_normalise(occupant_gender)]
+
+    def bed_vacated(self, bed: models.Bed, occupant_gender: Optional[str] = None):
+        if not self.loaded:
+            return
+        with self._lock:
+            self._add(bed)
+            self._uncount(bed, occupant_gender)
+
+    def bed_occupied(self, bed: models.Bed, occupant_gender: Optional[str] = None):
+        if not self.loaded:
+            return
+        with self._lock:
+            self._discard(bed.id)
+            if occupant_gender:
+                self._room_genders[(bed.floor, bed.room_number)][_normalise(occupant_gender)] += 1
+
+    def occupant_changed(self, bed: models.Bed, old_gender: Optional[str], new_gender: Optional[str]):
+        """Move an occupant of ``bed`` from one gender to another in their room's count"""
+        if not self.loaded:
+            return
+        with self._lock:
+            self._uncount(bed, old_gender)
+            if new_gender:
+                self._room_genders[(bed.floor, bed.room_number)][_normalise(new_gender)] += 1
+
+    def bed_unavailable(self, bed_id: int):
+        if not self.loaded:
+            return
+        with self._lock:
+            self._discard(bed_id)
+
+    def _rate_range(self, min_rate: Optional[float], max_rate: Optional[float]):
+        low = 0 if min_rate is None else bisect_left(self._by_rate, (min_rate, -1))
+        high = len(self._by_rate) if max_rate is None else bisect_right(self._by_rate, (max_rate, float("inf")))
+        return {bed_id for _, bed_id in self._by_rate[low:high]}
+
+    def recommend(
+        self,
+        floor: Optional[int] = None,
+        bed_type: Optional[str] = None,
+        amenities: Iterable[str] = (),
+        min_rate: Optional[float] = None,
+        max_rate: Optional[float] = None,
+        gender: Optional[str] = None,
+        limit: int = 10,
+    ) -> List[dict]:
+        """Rank vacant beds matching every constraint.
+
+        Beds in rooms already shared with a compatible occupant come first
+        (keeping empty rooms free for couples and single-room requests),
+        then cheaper beds.
+        """
+        gender = _normalise(gender)
+        with self._lock:
+            constraints = []
+            if floor is not None:
+                constraints.append(self._by_floor.get(floor, set()))
+            if bed_type:
+                constraints.append(self._by_type.get(_normalise(bed_type), set()))
+            for amenity in parse_amenities(amenities):
+                constraints.append(self._by_amenity.get(amenity, set()))
+
+            if constraints:
+                constraints.sort(key=len)
+                candidates = set(constraints[0]).intersection(*constraints[1:])
+                if min_rate is not None or max_rate is not None:
+                    candidates = {
+                        bed_id for bed_id in candidates
+                        if (min_rate is None or self._beds[bed_id].monthly_rate >= min_rate)
+                        and (max_rate is None or self._beds[bed_id].monthly_rate <= max_rate)
+                    }
+            elif min_rate is not None or max_rate is not None:
+                candidates = self._rate_range(min_rate, max_rate)
+            else:
+                candidates = self._beds.keys()
+
+            ranked = []
+            for bed_id in candidates:
+                entry = self._beds[bed_id]
+                occupants = self._room_genders.get(entry.room)
+                occupied = sum(occupants.values()) if occupants else 0
+                if gender and occupied and set(occupants) != {gender}:
+                    continue
+                ranked.append((0 if occupied else 1, entry.monthly_rate, entry.bed_number, entry, occupied))
+
+        return [
+            {
+                "bed_id": entry.id,
+                "bed_number": entry.bed_number,
+                "room_number": entry.room_number,
+                "floor": entry.floor,
+                "bed_type": entry.bed_type,
+                "monthly_rate": entry.monthly_rate,
+                "amenities": list(entry.amenity_names),
+                "room_occupants": occupied,
+            }
+            for _, _, _, entry, occupied in heapq.nsmallest(limit, ranked, key=lambda item: item[:3])
+        ]
+
+
+vacant_beds = FacilityLocal(VacantBedIndex)
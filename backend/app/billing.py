@@ -0,0 +1,171 @@
+"""
+Billing run engine.
+
+A run generates one invoice per active resident for a billing period
+(normally a calendar month) in a single set-based pass:
+
+* accommodation is the bed's ``monthly_rate`` prorated by the days the
+  resident was admitted during the period;
+* food is ``BILLING_FOOD_MONTHLY_CHARGE``, prorated the same way;
+* medical is ``BILLING_CHECKUP_FEE`` per checkup completed in the period,
+  counted with one grouped SQL query.
+
+Charges are computed column-wise with pandas in integer cents (rounding
+half up once per charge) and written with one bulk INSERT. Runs are
+idempotent per period: residents who already have an invoice starting on
+the period start are skipped, so re-running a period only bills residents
+admitted since the last run. New invoices are posted to the receivables
+ledger in the same transaction.
+
+The run row is the lock for its period. A run still marked ``running``
+after ``BILLING_RUN_STALE_MINUTES`` is taken to have died with its worker
+and may be claimed again.
+"""
+from datetime import date, datetime, timedelta
+
+import pandas as pd
+from decouple import config
+from sqlalchemy import Integer, and_, func, insert, or_, type_coerce
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app import ledger, models
+from app.money import ZERO, from_cents, to_cents
+
+BILLING_DUE_DAYS = config("BILLING_DUE_DAYS", default=15, cast=int)
+FOOD_MONTHLY_CHARGE = config("BILLING_FOOD_MONTHLY_CHARGE", default="0", cast=to_cents)
+CHECKUP_FEE = config("BILLING_CHECKUP_FEE", default="0", cast=to_cents)
+RUN_STALE_MINUTES = config("BILLING_RUN_STALE_MINUTES", default=30, cast=int)
+
+CHARGE_COLUMNS = ["accommodation_charges", "food_charges", "medical_charges", "other_charges", "total_amount"]
+
+
+class BillingRunInProgress(Exception):
+    pass
+
+
+def month_period(day: date):
+    """First and last day of the calendar month containing ``day``"""
+    start = day.replace(day=1)
+    end = (start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+    return start, end
+
+
+def _billable_residents(db: Session, period_start: date, period_end: date) -> pd.DataFrame:
+    already_billed = db.query(models.Billing.resident_id).filter(
+        models.Billing.billing_period_start == period_start
+    )
+    rows = db.query(
+        models.Resident.id,
+        models.Resident.admission_date,
+        # Raw cents, so the proration below stays in integer arithmetic
+        type_coerce(models.Bed.monthly_rate, Integer),
+    ).outerjoin(
+        models.Bed, models.Bed.id == models.Resident.bed_id
+    ).filter(
+        and_(
+            models.Resident.status == models.ResidentStatus.ACTIVE,
+            models.Resident.admission_date <= period_end,
+            ~models.Resident.id.in_(already_billed)
+        )
+    ).all()
+    return pd.DataFrame(rows, columns=["resident_id", "admission_date", "monthly_rate_cents"])
+
+
+def _checkup_counts(db: Session, period_start: date, period_end: date) -> pd.Series:
+    rows = db.query(models.Checkup.resident_id, func.count(models.Checkup.id)).filter(
+        and_(
+            models.Checkup.status == models.CheckupStatus.COMPLETED,
+            models.Checkup.scheduled_date >= datetime.combine(period_start, datetime.min.time()),
+            models.Checkup.scheduled_date < datetime.combine(period_end + timedelta(days=1), datetime.min.time())
+        )
+    ).group_by(models.Checkup.resident_id).all()
+    return pd.Series(dict(rows), dtype="int64")
+
+
+def _prorate(cents: pd.Series, days: pd.Series, period_days: int) -> pd.Series:
+    # cents * days / period_days, rounded half up, without leaving integers
+    return (cents * days * 2 + period_days) // (period_days * 2)
+
+
+def compute_invoices(residents: pd.DataFrame, checkups: pd.Series, period_start: date, period_end: date) -> pd.DataFrame:
+    """Per-resident charges in integer cents"""
+    period_days = (period_end - period_start).days + 1
+    first_day = pd.to_datetime(residents["admission_date"]).clip(lower=pd.Timestamp(period_start))
+    billable_days = ((pd.Timestamp(period_end) - first_day).dt.days + 1).clip(lower=0, upper=period_days).astype("int64")
+
+    invoices = pd.DataFrame({"resident_id": residents["resident_id"]})
+    rates = residents["monthly_rate_cents"].fillna(0).astype("int64")
+    invoices["accommodation_charges"] = _prorate(rates, billable_days, period_days)
+    invoices["food_charges"] = _prorate(pd.Series(FOOD_MONTHLY_CHARGE, index=rates.index, dtype="int64"), billable_days, period_days)
+    invoices["medical_charges"] = residents["resident_id"].map(checkups).fillna(0).astype("int64") * CHECKUP_FEE
+    invoices["other_charges"] = 0
+    invoices["total_amount"] = invoices[CHARGE_COLUMNS[:-1]].sum(axis=1)
+    return invoices
+
+
+def run_billing(db: Session, period_start: date, period_end: date) -> models.BillingRun:
+    in_progress = BillingRunInProgress(f"A billing run for {period_start} to {period_end} is already running")
+    run = db.query(models.BillingRun).filter(
+        and_(models.BillingRun.period_start == period_start, models.BillingRun.period_end == period_end)
+    ).first()
+    if run is None:
+        run = models.BillingRun(period_start=period_start, period_end=period_end, status="running",
+                                invoices_created=0, total_amount=ZERO, started_at=datetime.now())
+        db.add(run)
+        try:
+            db.commit()
+        except IntegrityError:
+            # Another request created the period's run first (uq_billing_runs_facility_period)
+            db.rollback()
+            raise in_progress
+    else:
+        # Conditional UPDATE: the run row doubles as the lock for its period. A run left
+        # "running" past the stale cutoff lost its worker and can be taken over.
+        stale_before = datetime.now() - timedelta(minutes=RUN_STALE_MINUTES)
+        claimed = db.query(models.BillingRun).filter(
+            and_(
+                models.BillingRun.id == run.id,
+                or_(models.BillingRun.status != "running", models.BillingRun.started_at < stale_before)
+            )
+        ).update({
+            models.BillingRun.status: "running",
+            models.BillingRun.started_at: datetime.now(),
+            models.BillingRun.error: None,
+        }, synchronize_session=False)
+        db.commit()
+        if not claimed:
+            raise in_progress
+        db.refresh(run)
+
+    try:
+        residents = _billable_residents(db, period_start, period_end)
+        invoices = compute_invoices(residents, _checkup_counts(db, period_start, period_end), period_start, period_end)
+        total_cents = int(invoices["total_amount"].sum())
+        if len(invoices):
+            invoices[CHARGE_COLUMNS] = invoices[CHARGE_COLUMNS].apply(lambda column: column.map(from_cents))
+            invoices = invoices.assign(
+                billing_run_id=run.id,
+                billing_period_start=period_start,
+                billing_period_end=period_end,
+                amount_paid=ZERO,
+                balance=invoices["total_amount"],
+                due_date=period_end + timedelta(days=BILLING_DUE_DAYS),
+                payment_status="pending",
+            )
+            db.execute(insert(models.Billing), invoices.to_dict("records"))
+            ledger.apply(db, zip(invoices["resident_id"].tolist(), invoices["due_date"], invoices["balance"]))
+        run.invoices_created = (run.invoices_created or 0) + len(invoices)
+        run.total_amount = (run.total_amount or ZERO) + from_cents(total_cents)
+        run.status = "completed"
+        run.finished_at = datetime.now()
+        db.commit()
+    except Exception as exc:
+        db.rollback()
+        run.status = "failed"
+        run.error = str(exc)
+        run.finished_at = datetime.now()
+        db.commit()
+        raise
+    db.refresh(run)
+    return run
@@ -0,0 +1,226 @@
+"""
+Interval index of booked checkups used for double-booking checks.
+
+Every scheduled checkup is held as a ``[start, end)`` interval under three
+keys: its doctor, its location and its resident. Each key keeps its
+intervals sorted by start together with the longest duration it has seen,
+so an overlap query only bisects to the narrow band of starts that could
+reach the requested window instead of scanning the doctor's whole diary.
+
+The index is loaded at startup and kept current by this process's checkup
+CRUD operations. It only knows what this process has seen, so it is the
+fast path for the conflict and next-free-slot lookups, not the guarantee.
+Booking a checkup goes to the database: ``lock_slots`` locks the booking
+keys' rows in ``checkup_slot_locks`` and ``booked_conflicts`` then checks
+the committed checkups for overlaps in the same transaction, so two
+workers or hosts can never take the same slot.
+"""
+import threading
+from bisect import bisect_left, bisect_right, insort
+from dataclasses import dataclass
+from datetime import datetime, time, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from decouple import config
+from sqlalchemy import and_, func, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from app import models
+from app.schemas import to_local_naive
+from app.tenancy import FacilityLocal
+
+DEFAULT_DURATION_MINUTES = 30
+WORKDAY_START = time.fromisoformat(config("CHECKUP_WORKDAY_START", default="09:00"))
+WORKDAY_END = time.fromisoformat(config("CHECKUP_WORKDAY_END", default="17:00"))
+MAX_SEARCH_DAYS = 60
+
+
+def _normalise(value: Optional[str]) -> Optional[str]:
+    value = " ".join((value or "").split()).lower()
+    return value or None
+
+
+def checkup_keys(resident_id: Optional[int], doctor_name: Optional[str], location: Optional[str]):
+    keys = []
+    if _normalise(doctor_name):
+        keys.append(("doctor", _normalise(doctor_name)))
+    if _normalise(location):
+        keys.append(("location", _normalise(location)))
+    if resident_id is not None:
+        keys.append(("resident", resident_id))
+    return keys
+
+
+@dataclass(frozen=True)
+class Booking:
+    checkup_id: int
+    starts_at: datetime
+    ends_at: datetime
+
+
+@dataclass(frozen=True)
+class SlotConflict:
+    kind: str  # doctor, location, resident
+    value: str
+    checkup_id: int
+    starts_at: datetime
+    ends_at: datetime
+
+
+class _Timeline:
+    def __init__(self):
+        self.starts: List[Tuple[datetime, int]] = []  # sorted (starts_at, checkup_id)
+        self.bookings: Dict[int, Booking] = {}
+        self.longest = timedelta(0)
+
+    def add(self, booking: Booking):
+        self.bookings[booking.checkup_id] = booking
+        insort(self.starts, (booking.starts_at, booking.checkup_id))
+        self.longest = max(self.longest, booking.ends_at - booking.starts_at)
+
+    def remove(self, checkup_id: int):
+        booking = self.bookings.pop(checkup_id, None)
+        if booking is None:
+            return
+        position = bisect_left(self.starts, (booking.starts_at, checkup_id))
+        if position < len(self.starts) and self.starts[position] == (booking.starts_at, checkup_id):
+            del self.starts[position]
+
+    def overlapping(self, starts_at: datetime, ends_at: datetime):
+        # Anything that overlaps must start before ends_at and no earlier than starts_at - longest
+        low = bisect_right(self.starts, (starts_at - self.longest, float("inf")))
+        high = bisect_left(self.starts, (ends_at, -float("inf")))
+        for _, checkup_id in self.starts[low:high]:
+            booking = self.bookings[checkup_id]
+            if booking.ends_at > starts_at:
+                yield booking
+
+
+class CheckupSlotIndex:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.loaded = False
+        self._clear()
+
+    def _clear(self):
+        self._timelines: Dict[tuple, _Timeline] = {}
+        self._keys: Dict[int, list] = {}
+
+    def rebuild(self, db: Session, since: Optional[datetime] = None):
+        """Reload scheduled checkups from ``since`` (default: the start of yesterday) onwards"""
+        since = since or datetime.combine(datetime.now().date() - timedelta(days=1), time.min)
+        checkups = db.query(models.Checkup).filter(
+            models.Checkup.status == models.CheckupStatus.SCHEDULED,
+            models.Checkup.scheduled_date >= since
+        ).all()
+        with self._lock:
+            self._clear()
+            for checkup in checkups:
+                self._add(checkup.id, checkup_keys(checkup.resident_id, checkup.doctor_name, checkup.location),
+                          checkup.scheduled_date, checkup.duration_minutes)
+            self.loaded = True
+
+    def __len__(self):
+        return len(self._keys)
+
+    def _add(self, checkup_id: int, keys, starts_at: datetime, duration_minutes: Optional[int]):
+        booking = Booking(checkup_id, starts_at, starts_at + timedelta(minutes=duration_minutes or DEFAULT_DURATION_MINUTES))
+        self._keys[checkup_id] = keys
+        for key in keys:
+            self._timelines.setdefault(key, _Timeline()).add(booking)
+
+    def remove(self, checkup_id: int):
+        with self._lock:
+            for key in self._keys.pop(checkup_id, ()):
+                self._timelines[key].remove(checkup_id)
+
+    def conflicts(self, keys, starts_at: datetime, duration_minutes: Optional[int],
+                  exclude_id: Optional[int] = None) -> List[SlotConflict]:
+        starts_at = to_local_naive(starts_at)
+        ends_at = starts_at + timedelta(minutes=duration_minutes or DEFAULT_DURATION_MINUTES)
+        found = []
+        with self._lock:
+            for kind, value in keys:
+                timeline = self._timelines.get((kind, value))
+                if timeline is None:
+                    continue
+                for booking in timeline.overlapping(starts_at, ends_at):
+                    if booking.checkup_id != exclude_id:
+                        found.append(SlotConflict(kind, str(value), booking.checkup_id, booking.starts_at, booking.ends_at))
+        return found
+
+    def add(self, checkup: models.Checkup):
+        if not self.loaded or checkup.status != models.CheckupStatus.SCHEDULED:
+            return
+        with self._lock:
+            self.remove(checkup.id)
+            self._add(checkup.id, checkup_keys(checkup.resident_id, checkup.doctor_name, checkup.location),
+                      checkup.scheduled_date, checkup.duration_minutes)
+
+    def next_free_slot(self, keys, after: datetime, duration_minutes: Optional[int],
+                       workday_start: time = WORKDAY_START, workday_end: time = WORKDAY_END,
+                       max_days: int = MAX_SEARCH_DAYS) -> Optional[datetime]:
+        """Earliest start at or after ``after`` inside working hours that overlaps nothing under ``keys``"""
+        duration = timedelta(minutes=duration_minutes or DEFAULT_DURATION_MINUTES)
+        candidate = to_local_naive(after).replace(second=0, microsecond=0)
+        last_day = candidate.date() + timedelta(days=max_days)
+        with self._lock:
+            while candidate.date() <= last_day:
+                day_start = datetime.combine(candidate.date(), workday_start)
+                day_end = datetime.combine(candidate.date(), workday_end)
+                if candidate < day_start:
+                    candidate = day_start
+                if candidate + duration > day_end:
+                    candidate = day_start + timedelta(days=1)
+                    continue
+                blocking = self.conflicts(keys, candidate, duration_minutes)
+                if not blocking:
+                    return candidate
+                # Jump past the latest-ending clash and try again
+                candidate = max(conflict.ends_at for conflict in blocking)
+        return None
+
+
+checkup_slots = FacilityLocal(CheckupSlotIndex)
+
+
+def lock_slots(db: Session, keys):
+    """Lock the booking keys' rows until the transaction ends, creating them on first use"""
+    facility_id = db.info.get("facility_id")
+    names = sorted({f"{facility_id}:{kind}:{value}" for kind, value in keys})
+    if not names:
+        return
+    table = models.CheckupSlotLock.__table__
+    dialect = postgresql if db.get_bind().dialect.name == "postgresql" else sqlite
+    # On SQLite the insert already takes the database write lock; PostgreSQL locks the rows, in key order
+    db.execute(dialect.insert(table).values([{"lock_key": name} for name in names]).on_conflict_do_nothing(
+        index_elements=["lock_key"]
+    ))
+    db.execute(select(table.c.lock_key).where(table.c.lock_key.in_(names)).order_by(table.c.lock_key).with_for_update())
+
+
+def booked_conflicts(db: Session, keys, starts_at: datetime, duration_minutes: Optional[int]) -> List[SlotConflict]:
+    """Committed scheduled checkups that share a key with, and overlap, the requested slot"""
+    starts_at = to_local_naive(starts_at)
+    ends_at = starts_at + timedelta(minutes=duration_minutes or DEFAULT_DURATION_MINUTES)
+    checkup = models.Checkup
+    scheduled = and_(checkup.status == models.CheckupStatus.SCHEDULED, checkup.scheduled_date < ends_at)
+    # Anything that overlaps starts no earlier than starts_at minus the longest booking
+    longest = db.query(func.max(checkup.duration_minutes)).filter(scheduled).scalar() or DEFAULT_DURATION_MINUTES
+    candidates = db.query(checkup).filter(
+        and_(scheduled, checkup.scheduled_date >= starts_at - timedelta(minutes=max(longest, DEFAULT_DURATION_MINUTES)))
+    ).order_by(checkup.scheduled_date, checkup.id).all()
+    found = []
+    for candidate in candidates:
+        candidate_ends_at = candidate.scheduled_date + timedelta(minutes=candidate.duration_minutes or DEFAULT_DURATION_MINUTES)
+        shared = [key for key in checkup_keys(candidate.resident_id, candidate.doctor_name, candidate.location) if key in keys]
+        if candidate_ends_at <= starts_at or not shared:
+            continue
+        # Teach this process's index about bookings made through other workers
+        checkup_slots.add(candidate)
+        found.extend(
+            SlotConflict(kind, str(value), candidate.id, candidate.scheduled_date, candidate_ends_at)
+            for kind, value in shared
+        )
+    return found
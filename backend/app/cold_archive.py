@@ -0,0 +1,60 @@
+"""
+Append-only gzip'd NDJSON files shared by the visitor and resident archives.
+
+Every call to ``append`` writes its records as one new gzip member and
+fsyncs the file before returning, so callers can delete the rows they
+archived as soon as it returns; a crash in between can at worst leave a
+row both live and archived, and readers drop the duplicate by id.
+"""
+import gzip
+import json
+import os
+from datetime import date, datetime
+from decimal import Decimal
+from enum import Enum
+from typing import Iterable, Iterator
+
+from app.tenancy import DEFAULT_FACILITY_ID
+
+SUFFIX = ".ndjson.gz"
+
+
+def facility_dir(root: str, facility_id: int) -> str:
+    """The default facility archives in ``root``, every other one under ``root/facility-<id>``"""
+    if facility_id == DEFAULT_FACILITY_ID:
+        return root
+    return os.path.join(root, f"facility-{facility_id}")
+
+
+def serialise(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, Enum):
+        return value.value
+    return value
+
+
+def append(path: str, records: Iterable[dict]) -> int:
+    """Append records as one durable gzip member; returns the number written"""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    written = 0
+    with open(path, "ab") as raw:
+        with gzip.GzipFile(fileobj=raw, mode="ab") as handle:
+            for record in records:
+                handle.write(json.dumps(record, default=serialise).encode() + b"\n")
+                written += 1
+        raw.flush()
+        os.fsync(raw.fileno())
+    return written
+
+
+def read(path: str) -> Iterator[dict]:
+    """Every record in the file, in the order written; nothing if it doesn't exist"""
+    if not os.path.exists(path):
+        return
+    with gzip.open(path, "rt") as handle:
+        for line in handle:
+            if line.strip():
+                yield json.loads(line)
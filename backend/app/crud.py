@@ -1,8 +1,23 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_, func, extract
+from sqlalchemy import and_, or_, func, case, insert, true
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+import heapq
+from collections import Counter
+import logging
+from itertools import islice
 from typing import List, Optional
 from datetime import datetime, date, timedelta
-from app import models, schemas
+from app import ages, ledger, models, resident_archive, schemas, visitor_archive
+from app.bed_index import vacant_beds
+from app.checkup_slots import booked_conflicts, checkup_keys, checkup_slots, lock_slots
+from app.visitor_desk import on_site_visitors, open_visits
+from app.events import publish
+from app.money import ZERO
+from app.interactions import get_index as get_interaction_index
+from app.recurrence import parse_rule, occurrences, InvalidRecurrence
+
+logger = logging.getLogger(__name__)
 
 # Resident CRUD operations
 def get_resident(db: Session, resident_id: int):
@@ -19,25 +34,80 @@ def create_resident(db: Session, resident: schemas.ResidentCreate):
     db.add(db_resident)
     db.commit()
     db.refresh(db_resident)
+    publish("residents", resident_id=db_resident.id)
     return db_resident
 
 def update_resident(db: Session, resident_id: int, resident: schemas.ResidentUpdate):
     db_resident = db.query(models.Resident).filter(models.Resident.id == resident_id).first()
     if db_resident:
+        old_gender = db_resident.gender
         update_data = resident.dict(exclude_unset=True)
         for field, value in update_data.items():
             setattr(db_resident, field, value)
         db.commit()
         db.refresh(db_resident)
+        if db_resident.gender != old_gender and db_resident.bed_id:
+            # The bed recommender matches roommates by the genders already in each room
+            bed = db.query(models.Bed).filter(models.Bed.id == db_resident.bed_id).first()
+            if bed:
+                vacant_beds.occupant_changed(bed, old_gender, db_resident.gender)
+                publish("beds", bed_id=bed.id)
+        publish("residents", resident_id=resident_id)
     return db_resident
 
 def delete_resident(db: Session, resident_id: int):
+    # Soft delete: the row becomes a tombstone at once and the resident_archive job moves their
+    # records out of the live tables afterwards, so the request never waits on the cascade
     db_resident = db.query(models.Resident).filter(models.Resident.id == resident_id).first()
-    if db_resident:
-        db.delete(db_resident)
-        db.commit()
-        return True
-    return False
+    if not db_resident:
+        return False
+    bed = db.query(models.Bed).filter(models.Bed.id == db_resident.bed_id).first() if db_resident.bed_id else None
+    gender = db_resident.gender
+    if bed:
+        _vacate_bed(db, bed, db_resident)
+    now = datetime.now()
+    # Release what the resident still holds: their booked checkups give up their slots and
+    # any visit still open is checked out so it leaves the on-site register
+    released = [checkup_id for (checkup_id,) in db.query(models.Checkup.id).filter(
+        and_(models.Checkup.resident_id == resident_id, models.Checkup.status == models.CheckupStatus.SCHEDULED)
+    )]
+    if released:
+        db.query(models.Checkup).filter(models.Checkup.id.in_(released)).update(
+            {models.Checkup.status: models.CheckupStatus.CANCELLED}, synchronize_session=False
+        )
+    checked_out = db.query(models.Visitor).filter(
+        and_(models.Visitor.resident_id == resident_id, open_visits())
+    ).update({models.Visitor.check_out_time: now}, synchronize_session=False)
+    # Their seats on events still to come go to the waitlist
+    events = _live_registrations(db, resident_id)
+    for event_id in events:
+        _release_seats(db, event_id, [resident_id])
+    db_resident.deleted_at = now
+    db.commit()
+    if bed:
+        vacant_beds.bed_vacated(bed, gender)
+        publish("beds", bed_id=bed.id)
+    for checkup_id in released:
+        checkup_slots.remove(checkup_id)
+    if released:
+        publish("checkups", resident_id=resident_id)
+    if checked_out:
+        publish("visitors", resident_id=resident_id)
+    for event_id in events:
+        publish("participants", event_id=event_id)
+    publish("residents", resident_id=resident_id)
+    return True
+
+def _live_registrations(db: Session, resident_id: int) -> List[int]:
+    """Events the resident holds a seat or waitlist place on that haven't finished yet"""
+    return [event_id for (event_id,) in db.query(models.EventParticipant.event_id).join(
+        models.Event, models.Event.id == models.EventParticipant.event_id
+    ).filter(
+        and_(
+            models.EventParticipant.resident_id == resident_id,
+            models.Event.status.in_((models.EventStatus.PLANNED, models.EventStatus.ONGOING))
+        )
+    )]
 
 def search_residents(db: Session, query: str):
     return db.query(models.Resident).filter(
@@ -52,88 +122,47 @@ def search_residents(db: Session, query: str):
 def get_total_residents_count(db: Session):
     return db.query(models.Resident).filter(models.Resident.status == models.ResidentStatus.ACTIVE).count()
 
+def _medication_is_current():
+    # Courses past end_date count as inactive even before the expiry sweeper flips them
+    return and_(
+        models.Medication.is_active == True,
+        or_(models.Medication.end_date == None, models.Medication.end_date >= date.today())
+    )
+
 def get_residents_under_medication_count(db: Session):
     return db.query(models.Resident).join(models.Medication).filter(
         and_(
             models.Resident.status == models.ResidentStatus.ACTIVE,
-            models.Medication.is_active == True
+            _medication_is_current()
         )
     ).distinct().count()
 
 def get_vacant_beds_count(db: Session):
-    return db.query(models.Bed).filter(models.Bed.status == models.BedStatus.VACANT).count()
+    vacant = db.query(func.sum(models.BedOccupancyRollup.vacant_beds)).scalar()
+    return vacant or 0
 
 def get_upcoming_birthdays_count(db: Session, days: int = 7):
     today = date.today()
-    upcoming_date = today + timedelta(days=days)
-    
-    # Handle year boundary crossing
-    if today.year == upcoming_date.year:
-        return db.query(models.Resident).filter(
-            and_(
-                models.Resident.status == models.ResidentStatus.ACTIVE,
-                extract('month', models.Resident.date_of_birth) >= today.month,
-                extract('month', models.Resident.date_of_birth) <= upcoming_date.month,
-                or_(
-                    extract('month', models.Resident.date_of_birth) > today.month,
-                    and_(
-                        extract('month', models.Resident.date_of_birth) == today.month,
-                        extract('day', models.Resident.date_of_birth) >= today.day
-                    )
-                ),
-                or_(
-                    extract('month', models.Resident.date_of_birth) < upcoming_date.month,
-                    and_(
-                        extract('month', models.Resident.date_of_birth) == upcoming_date.month,
-                        extract('day', models.Resident.date_of_birth) <= upcoming_date.day
-                    )
-                )
-            )
-        ).count()
-    else:
-        return db.query(models.Resident).filter(
-            and_(
-                models.Resident.status == models.ResidentStatus.ACTIVE,
-                or_(
-                    and_(
-                        extract('month', models.Resident.date_of_birth) >= today.month,
-                        or_(
-                            extract('month', models.Resident.date_of_birth) > today.month,
-                            and_(
-                                extract('month', models.Resident.date_of_birth) == today.month,
-                                extract('day', models.Resident.date_of_birth) >= today.day
-                            )
-                        )
-                    ),
-                    and_(
-                        extract('month', models.Resident.date_of_birth) <= upcoming_date.month,
-                        or_(
-                            extract('month', models.Resident.date_of_birth) < upcoming_date.month,
-                            and_(
-                                extract('month', models.Resident.date_of_birth) == upcoming_date.month,
-                                extract('day', models.Resident.date_of_birth) <= upcoming_date.day
-                            )
-                        )
-                    )
-                )
-            )
-        ).count()
+    return db.query(models.Resident).filter(
+        and_(
+            models.Resident.status == models.ResidentStatus.ACTIVE,
+            ages.birthdays_between(today, today + timedelta(days=days))
+        )
+    ).count()
 
 # Birthday operations
 def get_upcoming_birthdays(db: Session, days: int = 7):
     today = date.today()
-    residents = db.query(models.Resident).filter(models.Resident.status == models.ResidentStatus.ACTIVE).all()
+    residents = db.query(models.Resident).filter(
+        and_(
+            models.Resident.status == models.ResidentStatus.ACTIVE,
+            ages.birthdays_between(today, today + timedelta(days=days))
+        )
+    ).all()
     
     upcoming_birthdays = []
     for resident in residents:
-        # Calculate next birthday
-        this_year_birthday = resident.date_of_birth.replace(year=today.year)
-        if this_year_birthday < today:
-            next_birthday = resident.date_of_birth.replace(year=today.year + 1)
-        else:
-            next_birthday = this_year_birthday
-        
-        days_until = (next_birthday - today).days
+        days_until = (ages.next_birthday(resident.date_of_birth, today) - today).days
         if 0 <= days_until <= days:
             birthday_info = schemas.ResidentBirthday(
                 id=resident.id,
@@ -148,14 +177,15 @@ def get_upcoming_birthdays(db: Session, days: int = 7):
     return sorted(upcoming_birthdays, key=lambda x: x.days_until_birthday)
 
 def get_today_birthdays(db: Session):
-    today = date.today()
+    return get_birthdays_on(db, date.today())
+
+def get_birthdays_on(db: Session, day: date):
     residents = db.query(models.Resident).filter(
         and_(
             models.Resident.status == models.ResidentStatus.ACTIVE,
-            extract('month', models.Resident.date_of_birth) == today.month,
-            extract('day', models.Resident.date_of_birth) == today.day
+            ages.birthdays_between(day, day)
         )
-    ).all()
+    ).order_by(models.Resident.name).all()
     
     return [
         schemas.ResidentBirthday(
@@ -164,34 +194,187 @@ def get_today_birthdays(db: Session):
             date_of_birth=resident.date_of_birth,
             age=resident.age,
             room_number=resident.room_number,
-            days_until_birthday=0
+            days_until_birthday=(day - date.today()).days
         )
         for resident in residents
     ]
 
+# Age bands
+def get_age_band_report(db: Session):
+    # Reads the age-band rollup only; residents are never scanned here
+    band = models.ResidentAgeBand
+    rows = db.query(band.band, func.sum(band.residents), func.min(band.as_of)).filter(
+        band.residents > 0
+    ).group_by(band.band).order_by(band.band).all()
+    return schemas.AgeBandReport(
+        as_of=min((as_of for _, _, as_of in rows), default=None),
+        total_residents=sum(residents for _, residents, _ in rows),
+        bands=[
+            schemas.AgeBand(min_age=lowest, max_age=lowest + 9, residents=residents)
+            for lowest, residents, _ in rows
+        ]
+    )
+
 # Medication CRUD operations
 def create_medication(db: Session, medication: schemas.MedicationCreate):
     db_medication = models.Medication(**medication.dict())
     db.add(db_medication)
     db.commit()
     db.refresh(db_medication)
+    publish("medications", resident_id=db_medication.resident_id)
     return db_medication
 
 def get_resident_medications(db: Session, resident_id: int):
     return db.query(models.Medication).filter(
         and_(
             models.Medication.resident_id == resident_id,
-            models.Medication.is_active == True
+            _medication_is_current()
         )
     ).all()
 
+def check_medication_conflicts(db: Session, resident_id: int, medication_name: str, exclude_medication_ids: List[int] = ()):
+    resident = db.query(models.Resident.allergies).filter(models.Resident.id == resident_id).first()
+    query = db.query(models.Medication.medication_name).filter(
+        and_(
+            models.Medication.resident_id == resident_id,
+            _medication_is_current()
+        )
+    )
+    if exclude_medication_ids:
+        query = query.filter(~models.Medication.id.in_(exclude_medication_ids))
+    active = [name for name, in query.all()]
+    return get_interaction_index().check(medication_name, active, resident.allergies if resident else None)
+
+def bulk_update_medications(db: Session, updates: List[schemas.MedicationBulkUpdate], override_conflicts: bool = False):
+    medication_ids = [update.id for update in updates]
+    medications = {
+        medication.id: medication
+        for medication in db.query(models.Medication).filter(models.Medication.id.in_(medication_ids)).all()
+    }
+    if len(medications) != len(set(medication_ids)):
+        return None, []
+
+    rechecked = []
+    for update in updates:
+        update_data = update.dict(exclude_unset=True, exclude={"id"})
+        medication = medications[update.id]
+        for field, value in update_data.items():
+            setattr(medication, field, value)
+        if "medication_name" in update_data or "is_active" in update_data:
+            rechecked.append(medication)
+    db.flush()
+
+    # Check against the state after the whole batch, so two changes in one request see each other
+    conflicts = []
+    for medication in rechecked:
+        if medication.is_active:
+            conflicts.extend(check_medication_conflicts(
+                db, medication.resident_id, medication.medication_name, exclude_medication_ids=[medication.id]
+            ))
+    if not override_conflicts and any(conflict.blocking for conflict in conflicts):
+        db.rollback()
+        return [], conflicts
+
+    db.commit()
+    for medication in medications.values():
+        db.refresh(medication)
+    publish("medications", medication_ids=list(medications))
+    return [medications[medication_id] for medication_id in medication_ids], conflicts
+
+def deactivate_expired_medications(db: Session, batch_size: int = 500, max_batches: Optional[int] = None):
+    # Flip is_active on courses whose end_date has passed, one bounded batch per transaction
+    today = date.today()
+    total = batches = 0
+    while max_batches is None or batches < max_batches:
+        expired = db.query(models.Medication.id, models.Medication.resident_id).filter(
+            and_(
+                models.Medication.is_active == True,
+                models.Medication.end_date < today
+            )
+        ).order_by(models.Medication.id).limit(batch_size).all()
+        if not expired:
+            break
+        medication_ids = [medication_id for medication_id, _ in expired]
+        db.query(models.Medication).filter(models.Medication.id.in_(medication_ids)).update(
+            {models.Medication.is_active: False}, synchronize_session=False
+        )
+        db.commit()
+        publish(
+            "medications",
+            medication_ids=medication_ids,
+            resident_ids=sorted({resident_id for _, resident_id in expired}),
+            reason="expired"
+        )
+        total += len(medication_ids)
+        batches += 1
+    return {"rows": total, "batches": batches}
+
+# Background job runs
+def get_job_runs(db: Session, job_name: Optional[str] = None, limit: int = 50):
+    query = db.query(models.JobRun)
+    if job_name:
+        query = query.filter(models.JobRun.job_name == job_name)
+    return query.order_by(models.JobRun.id.desc()).limit(limit).all()
+
+# Audit log
+def get_audit_log(db: Session, table_name: Optional[str] = None, row_id: Optional[str] = None,
+                  actor_id: Optional[int] = None, since: Optional[datetime] = None, limit: int = 100):
+    query = db.query(models.AuditLog)
+    if table_name is not None:
+        query = query.filter(models.AuditLog.table_name == table_name)
+    if row_id is not None:
+        query = query.filter(models.AuditLog.row_id == row_id)
+    if actor_id is not None:
+        query = query.filter(models.AuditLog.actor_id == actor_id)
+    if since is not None:
+        query = query.filter(models.AuditLog.occurred_at >= since)
+    return query.order_by(models.AuditLog.id.desc()).limit(limit).all()
+
 # Checkup CRUD operations
-def create_checkup(db: Session, checkup: schemas.CheckupCreate):
+def create_checkup(db: Session, checkup: schemas.CheckupCreate, allow_overlap: bool = False,
+                   follow_up_of: Optional[int] = None):
+    # Lock the booking keys and check the committed checkups for overlaps in the same transaction,
+    # so workers can't both take a slot; returns (checkup, []) or (None, conflicts). With
+    # follow_up_of the booking closes that checkup's follow-up in the same transaction;
+    # (None, None) means it was already closed and nothing was booked.
+    if checkup.status == models.CheckupStatus.SCHEDULED and not allow_overlap:
+        if not checkup_slots.loaded:
+            checkup_slots.rebuild(db)
+        keys = checkup_keys(checkup.resident_id, checkup.doctor_name, checkup.location)
+        lock_slots(db, keys)
+        conflicts = booked_conflicts(db, keys, checkup.scheduled_date, checkup.duration_minutes)
+        if conflicts:
+            db.rollback()
+            return None, conflicts
+
     db_checkup = models.Checkup(**checkup.dict())
     db.add(db_checkup)
+    if follow_up_of is not None:
+        db.flush()
+        if not _link_follow_up(db, follow_up_of, db_checkup.id):
+            db.rollback()
+            return None, None
     db.commit()
     db.refresh(db_checkup)
-    return db_checkup
+    checkup_slots.add(db_checkup)
+    publish("checkups", resident_id=db_checkup.resident_id)
+    return db_checkup, []
+
+def get_checkup_conflicts(db: Session, resident_id: Optional[int], doctor_name: Optional[str], location: Optional[str],
+                          scheduled_date: datetime, duration_minutes: Optional[int] = None,
+                          exclude_checkup_id: Optional[int] = None):
+    if not checkup_slots.loaded:
+        checkup_slots.rebuild(db)
+    keys = checkup_keys(resident_id, doctor_name, location)
+    return checkup_slots.conflicts(keys, scheduled_date, duration_minutes, exclude_id=exclude_checkup_id)
+
+def find_next_checkup_slot(db: Session, after: datetime, duration_minutes: Optional[int] = None,
+                           doctor_name: Optional[str] = None, location: Optional[str] = None,
+                           resident_id: Optional[int] = None):
+    if not checkup_slots.loaded:
+        checkup_slots.rebuild(db)
+    keys = checkup_keys(resident_id, doctor_name, location)
+    return checkup_slots.next_free_slot(keys, after, duration_minutes)
 
 def get_checkups(db: Session, skip: int = 0, limit: int = 100):
     return db.query(models.Checkup).offset(skip).limit(limit).all()
@@ -208,27 +391,303 @@ def get_today_checkups(db: Session):
 def get_resident_checkups(db: Session, resident_id: int):
     return db.query(models.Checkup).filter(models.Checkup.resident_id == resident_id).all()
 
+def get_checkup(db: Session, checkup_id: int):
+    return db.query(models.Checkup).filter(models.Checkup.id == checkup_id).first()
+
+# Follow-up worklist
+def _open_follow_ups():
+    # Matches the partial index ix_checkups_open_follow_up
+    return and_(
+        models.Checkup.follow_up_required == True,
+        models.Checkup.follow_up_checkup_id == None,
+        models.Checkup.follow_up_date != None
+    )
+
+def get_follow_up_worklist(db: Session, scope: str = "all", due_within_days: int = 7, skip: int = 0, limit: int = 50):
+    today = date.today()
+    due_soon_until = today + timedelta(days=due_within_days)
+    scopes = {
+        "overdue": models.Checkup.follow_up_date < today,
+        "due_soon": and_(models.Checkup.follow_up_date >= today, models.Checkup.follow_up_date <= due_soon_until),
+        "all": models.Checkup.follow_up_date <= due_soon_until,
+    }
+    counts = db.query(
+        func.sum(case((models.Checkup.follow_up_date < today, 1), else_=0)),
+        func.count(models.Checkup.id)
+    ).filter(_open_follow_ups(), scopes["all"]).one()
+    overdue = counts[0] or 0
+
+    rows = db.query(models.Checkup, models.Resident.name, models.Resident.room_number).join(
+        models.Resident, models.Resident.id == models.Checkup.resident_id
+    ).filter(
+        _open_follow_ups(), scopes[scope]
+    ).order_by(models.Checkup.follow_up_date, models.Checkup.id).offset(skip).limit(limit).all()
+
+    return {
+        "overdue": overdue,
+        "due_soon": counts[1] - overdue,
+        "items": [
+            schemas.FollowUpItem(
+                checkup_id=checkup.id,
+                resident_id=checkup.resident_id,
+                resident_name=resident_name,
+                room_number=room_number,
+                checkup_type=checkup.checkup_type,
+                doctor_name=checkup.doctor_name,
+                scheduled_date=checkup.scheduled_date,
+                follow_up_date=checkup.follow_up_date,
+                days_overdue=(today - checkup.follow_up_date).days,
+                notes=checkup.notes
+            )
+            for checkup, resident_name, room_number in rows
+        ]
+    }
+
+def _link_follow_up(db: Session, checkup_id: int, follow_up_checkup_id: int) -> bool:
+    # Conditional UPDATE so a follow-up can only be closed once; runs in the caller's transaction
+    return bool(db.query(models.Checkup).filter(
+        and_(models.Checkup.id == checkup_id, models.Checkup.follow_up_checkup_id == None)
+    ).update({models.Checkup.follow_up_checkup_id: follow_up_checkup_id}, synchronize_session=False))
+
+def link_follow_up(db: Session, checkup_id: int, follow_up_checkup_id: int):
+    linked = _link_follow_up(db, checkup_id, follow_up_checkup_id)
+    db.commit()
+    if linked:
+        publish("checkups", checkup_id=checkup_id)
+    return bool(linked)
+
 # Event CRUD operations
-def create_event(db: Session, event: schemas.EventCreate):
+def create_event(db: Session, event: schemas.EventCreate, horizon_days: int = 60):
     db_event = models.Event(**event.dict())
     db.add(db_event)
+    db.flush()
+    _materialise_occurrences(db, db_event, datetime.now() + timedelta(days=horizon_days))
     db.commit()
     db.refresh(db_event)
+    publish("events", event_id=db_event.id)
     return db_event
 
 def get_events(db: Session, skip: int = 0, limit: int = 100):
     return db.query(models.Event).offset(skip).limit(limit).all()
 
+def _materialise_occurrences(db: Session, event: models.Event, horizon: datetime,
+                             after: Optional[datetime] = None, since: Optional[datetime] = None):
+    # Insert the event's occurrences up to the horizon, starting after the last materialised
+    # one (or from `since` for series that were never materialised)
+    if not (event.is_recurring and event.recurrence_pattern):
+        dates = [event.event_date] if after is None else []
+    else:
+        try:
+            rule = parse_rule(event.recurrence_pattern)
+        except InvalidRecurrence:
+            logger.warning("Event %s has an unsupported recurrence pattern %r", event.id, event.recurrence_pattern)
+            dates = [event.event_date] if after is None else []
+        else:
+            if after is not None:
+                window_start = after + timedelta(seconds=1)
+            else:
+                window_start = max(event.event_date, since) if since else event.event_date
+            dates = list(occurrences(event.event_date, rule, window_start, horizon))
+    if dates:
+        db.execute(insert(models.EventOccurrence), [
+            {"facility_id": event.facility_id, "event_id": event.id, "occurrence_at": occurrence_at,
+             "status": event.status or models.EventStatus.PLANNED}
+            for occurrence_at in dates
+        ])
+    return len(dates)
+
+def refresh_event_occurrences(db: Session, horizon_days: int = 60, batch_size: int = 200):
+    # Extend every recurring series to the horizon and backfill events with no occurrence rows
+    horizon = datetime.now() + timedelta(days=horizon_days)
+    since = datetime.combine(date.today(), datetime.min.time())
+    query = db.query(models.Event).filter(
+        and_(
+            models.Event.status.in_([models.EventStatus.PLANNED, models.EventStatus.ONGOING]),
+            or_(models.Event.is_recurring == True, ~models.Event.occurrences.any())
+        )
+    ).order_by(models.Event.id)
+
+    total = batches = 0
+    last_id = 0
+    while True:
+        events = query.filter(models.Event.id > last_id).limit(batch_size).all()
+        if not events:
+            break
+        # Read per batch, not up front: an event created since the job started has its rows already
+        last_materialised = dict(db.query(
+            models.EventOccurrence.event_id, func.max(models.EventOccurrence.occurrence_at)
+        ).filter(
+            models.EventOccurrence.event_id.in_([event.id for event in events])
+        ).group_by(models.EventOccurrence.event_id).all())
+        inserted = 0
+        for event in events:
+            last = last_materialised.get(event.id)
+            if last is not None and last >= horizon:
+                continue
+            inserted += _materialise_occurrences(db, event, horizon, after=last, since=since)
+        db.commit()
+        last_id = events[-1].id
+        total += inserted
+        batches += 1
+    if total:
+        publish("events")
+    return {"rows": total, "batches": batches}
+
+def _occurrence_window(db: Session, start: datetime, end: datetime, statuses: Optional[List[models.EventStatus]] = None):
+    query = db.query(models.EventOccurrence, models.Event).join(
+        models.Event, models.Event.id == models.EventOccurrence.event_id
+    ).filter(
+        and_(
+            models.EventOccurrence.occurrence_at >= start,
+            models.EventOccurrence.occurrence_at <= end
+        )
+    )
+    if statuses:
+        query = query.filter(models.EventOccurrence.status.in_(statuses))
+    return query.order_by(models.EventOccurrence.occurrence_at).all()
+
 def get_upcoming_events(db: Session, days: int = 7):
     today = datetime.now()
     upcoming_date = today + timedelta(days=days)
-    return db.query(models.Event).filter(
-        and_(
-            models.Event.event_date >= today,
-            models.Event.event_date <= upcoming_date,
-            models.Event.status.in_([models.EventStatus.PLANNED, models.EventStatus.ONGOING])
+    rows = _occurrence_window(db, today, upcoming_date, [models.EventStatus.PLANNED, models.EventStatus.ONGOING])
+    # One entry per occurrence, dated at the occurrence rather than the series start
+    return [
+        schemas.Event.model_validate(event).model_copy(update={"event_date": occurrence.occurrence_at})
+        for occurrence, event in rows
+    ]
+
+def get_event_calendar(db: Session, start: datetime, end: datetime):
+    return [
+        schemas.EventOccurrence(
+            id=occurrence.id,
+            event_id=event.id,
+            occurrence_at=occurrence.occurrence_at,
+            status=occurrence.status,
+            title=event.title,
+            location=event.location,
+            duration_minutes=event.duration_minutes,
+            event_type=event.event_type,
+            is_recurring=bool(event.is_recurring)
         )
-    ).order_by(models.Event.event_date).all()
+        for occurrence, event in _occurrence_window(db, start, end)
+    ]
+
+def get_event(db: Session, event_id: int):
+    return db.query(models.Event).filter(models.Event.id == event_id).first()
+
+# Event participant operations
+def get_event_participants(db: Session, event_id: int, status: Optional[models.ParticipantStatus] = None):
+    query = db.query(models.EventParticipant).filter(models.EventParticipant.event_id == event_id)
+    if status is not None:
+        query = query.filter(models.EventParticipant.status == status)
+    return query.order_by(models.EventParticipant.status, models.EventParticipant.id).all()
+
+def _claim_seats(db: Session, event_id: int, wanted: int):
+    # Conditional relative UPDATE: only the event row is locked, and two requests can never
+    # both take the last seat. Returns how many seats were granted.
+    event = models.Event
+    taken = func.coalesce(event.current_participants, 0)
+    while wanted > 0:
+        claimed = db.query(event).filter(
+            and_(
+                event.id == event_id,
+                or_(event.max_participants == None, taken + wanted <= event.max_participants)
+            )
+        ).update({event.current_participants: taken + wanted}, synchronize_session=False)
+        if claimed:
+            return wanted
+        # Not enough room for all of them; retry with whatever is left right now
+        row = db.query(event.max_participants, taken).filter(event.id == event_id).first()
+        remaining = (row[0] - row[1]) if row else 0
+        wanted = min(wanted - 1, remaining)
+    return 0
+
+def register_participants(db: Session, event_id: int, resident_ids: List[int]):
+    resident_ids = list(dict.fromkeys(resident_ids))
+    known = {
+        resident_id for (resident_id,) in db.query(models.Resident.id).filter(models.Resident.id.in_(resident_ids))
+    }
+    while True:
+        existing = {
+            resident_id for (resident_id,) in db.query(models.EventParticipant.resident_id).filter(
+                and_(
+                    models.EventParticipant.event_id == event_id,
+                    models.EventParticipant.resident_id.in_(resident_ids)
+                )
+            )
+        }
+        new = [resident_id for resident_id in resident_ids if resident_id in known and resident_id not in existing]
+
+        seats = _claim_seats(db, event_id, len(new)) if new else 0
+        registered, waitlisted = new[:seats], new[seats:]
+        try:
+            if new:
+                db.execute(insert(models.EventParticipant), [
+                    {
+                        "event_id": event_id,
+                        "resident_id": resident_id,
+                        "status": models.ParticipantStatus.REGISTERED if index < seats else models.ParticipantStatus.WAITLISTED
+                    }
+                    for index, resident_id in enumerate(new)
+                ])
+            db.commit()
+            break
+        except IntegrityError:
+            # A concurrent request registered one of them first (uq_event_participants_event_resident).
+            # The rollback returns the seats claimed above; go again and report them as already registered.
+            db.rollback()
+    if new:
+        publish("participants", event_id=event_id)
+    return {
+        "event_id": event_id,
+        "registered": registered,
+        "waitlisted": waitlisted,
+        "already_registered": [resident_id for resident_id in resident_ids if resident_id in existing],
+        "unknown_residents": [resident_id for resident_id in resident_ids if resident_id not in known],
+    }
+
+def _release_seats(db: Session, event_id: int, resident_ids: List[int]):
+    """Remove the residents' registrations and pass freed seats on; returns (removed, promoted) without committing"""
+    participant = models.EventParticipant
+    rows = db.query(participant.id, participant.resident_id, participant.status).filter(
+        and_(participant.event_id == event_id, participant.resident_id.in_(resident_ids))
+    ).all()
+    freed = sum(1 for row in rows if row.status == models.ParticipantStatus.REGISTERED)
+    if rows:
+        db.query(participant).filter(participant.id.in_([row.id for row in rows])).delete(synchronize_session=False)
+
+    # Hand freed seats to the longest-waiting residents; the seat count only drops for seats
+    # nobody was waiting for
+    promoted = []
+    if freed:
+        candidates = db.query(participant.id, participant.resident_id).filter(
+            and_(participant.event_id == event_id, participant.status == models.ParticipantStatus.WAITLISTED)
+        ).order_by(participant.id).limit(freed).all()
+        for candidate in candidates:
+            if db.query(participant).filter(
+                and_(participant.id == candidate.id, participant.status == models.ParticipantStatus.WAITLISTED)
+            ).update({participant.status: models.ParticipantStatus.REGISTERED}, synchronize_session=False):
+                promoted.append(candidate.resident_id)
+        if freed > len(promoted):
+            event = models.Event
+            released = freed - len(promoted)
+            taken = func.coalesce(event.current_participants, 0)
+            db.query(event).filter(event.id == event_id).update(
+                {event.current_participants: case((taken > released, taken - released), else_=0)},
+                synchronize_session=False
+            )
+    return [row.resident_id for row in rows], promoted
+
+def unregister_participants(db: Session, event_id: int, resident_ids: List[int]):
+    removed, promoted = _release_seats(db, event_id, resident_ids)
+    db.commit()
+    if removed:
+        publish("participants", event_id=event_id)
+    return {
+        "event_id": event_id,
+        "removed": removed,
+        "promoted": promoted,
+    }
 
 # Document CRUD operations
 def create_document(db: Session, document: schemas.DocumentCreate):
@@ -247,24 +706,208 @@ def get_documents(db: Session, skip: int = 0, limit: int = 100):
 def get_resident_documents(db: Session, resident_id: int):
     return db.query(models.Document).filter(models.Document.resident_id == resident_id).all()
 
+# Bed occupancy rollups
+ROLLUP_STATUS_COLUMNS = {
+    models.BedStatus.OCCUPIED: models.BedOccupancyRollup.occupied_beds,
+    models.BedStatus.VACANT: models.BedOccupancyRollup.vacant_beds,
+    models.BedStatus.MAINTENANCE: models.BedOccupancyRollup.maintenance_beds,
+}
+
+def _update_bed_rollup(db: Session, bed: models.Bed, values: dict):
+    # Relative UPDATEs so concurrent assignments in the same room don't lose counts
+    return db.query(models.BedOccupancyRollup).filter(
+        and_(
+            models.BedOccupancyRollup.floor == bed.floor,
+            models.BedOccupancyRollup.room_number == bed.room_number
+        )
+    ).update(values, synchronize_session=False)
+
+def _add_bed_to_rollup(db: Session, bed: models.Bed):
+    rollup = models.BedOccupancyRollup
+    status = bed.status or models.BedStatus.VACANT
+    rate = bed.monthly_rate or ZERO
+    values = {
+        rollup.total_beds: rollup.total_beds + 1,
+        ROLLUP_STATUS_COLUMNS[status]: ROLLUP_STATUS_COLUMNS[status] + 1,
+        rollup.potential_revenue: rollup.potential_revenue + rate,
+    }
+    if status == models.BedStatus.OCCUPIED:
+        values[rollup.occupied_revenue] = rollup.occupied_revenue + rate
+    if not _update_bed_rollup(db, bed, values):
+        db.add(rollup(
+            floor=bed.floor,
+            room_number=bed.room_number,
+            total_beds=1,
+            occupied_beds=1 if status == models.BedStatus.OCCUPIED else 0,
+            vacant_beds=1 if status == models.BedStatus.VACANT else 0,
+            maintenance_beds=1 if status == models.BedStatus.MAINTENANCE else 0,
+            occupied_revenue=rate if status == models.BedStatus.OCCUPIED else ZERO,
+            potential_revenue=rate
+        ))
+
+def _move_bed_in_rollup(db: Session, bed: models.Bed, old_status: models.BedStatus, new_status: models.BedStatus):
+    if old_status == new_status:
+        return
+    rollup = models.BedOccupancyRollup
+    rate = bed.monthly_rate or ZERO
+    values = {
+        ROLLUP_STATUS_COLUMNS[old_status]: ROLLUP_STATUS_COLUMNS[old_status] - 1,
+        ROLLUP_STATUS_COLUMNS[new_status]: ROLLUP_STATUS_COLUMNS[new_status] + 1,
+    }
+    if new_status == models.BedStatus.OCCUPIED:
+        values[rollup.occupied_revenue] = rollup.occupied_revenue + rate
+    elif old_status == models.BedStatus.OCCUPIED:
+        values[rollup.occupied_revenue] = rollup.occupied_revenue - rate
+    _update_bed_rollup(db, bed, values)
+
+# Recompute every room rollup from the beds table (backfill / repair)
+def rebuild_bed_rollups(db: Session):
+    bed = models.Bed
+    rows = db.query(
+        bed.facility_id,
+        bed.floor,
+        bed.room_number,
+        func.count(bed.id),
+        func.sum(case((bed.status == models.BedStatus.OCCUPIED, 1), else_=0)),
+        func.sum(case((bed.status == models.BedStatus.VACANT, 1), else_=0)),
+        func.sum(case((bed.status == models.BedStatus.MAINTENANCE, 1), else_=0)),
+        func.sum(case((bed.status == models.BedStatus.OCCUPIED, func.coalesce(bed.monthly_rate, ZERO)), else_=ZERO)),
+        func.sum(func.coalesce(bed.monthly_rate, ZERO))
+    ).group_by(bed.facility_id, bed.floor, bed.room_number).all()
+
+    db.query(models.BedOccupancyRollup).delete(synchronize_session=False)
+    db.add_all([
+        models.BedOccupancyRollup(
+            facility_id=facility_id,
+            floor=floor,
+            room_number=room_number,
+            total_beds=total,
+            occupied_beds=occupied,
+            vacant_beds=vacant,
+            maintenance_beds=maintenance,
+            occupied_revenue=occupied_revenue,
+            potential_revenue=potential_revenue
+        )
+        for facility_id, floor, room_number, total, occupied, vacant, maintenance, occupied_revenue, potential_revenue in rows
+    ])
+    db.commit()
+    return len(rows)
+
+# Backfill the rollups when beds exist but were never rolled up
+def ensure_bed_rollups(db: Session):
+    if db.query(models.BedOccupancyRollup).first() is None and db.query(models.Bed).first() is not None:
+        return rebuild_bed_rollups(db)
+    return 0
+
+def _occupancy_rate(occupied: int, total: int):
+    return round(occupied / total, 4) if total else 0.0
+
+def get_bed_occupancy_summary(db: Session, floor: Optional[int] = None, include_rooms: bool = True):
+    rollup = models.BedOccupancyRollup
+    query = db.query(rollup)
+    if floor is not None:
+        query = query.filter(rollup.floor == floor)
+    rooms = query.order_by(rollup.floor, rollup.room_number).all()
+
+    floors = {}
+    for room in rooms:
+        summary = floors.get(room.floor)
+        if summary is None:
+            summary = floors[room.floor] = schemas.FloorOccupancy(floor=room.floor)
+        summary.total_beds += room.total_beds
+        summary.occupied += room.occupied_beds
+        summary.vacant += room.vacant_beds
+        summary.maintenance += room.maintenance_beds
+        summary.monthly_revenue += room.occupied_revenue
+        summary.potential_revenue += room.potential_revenue
+        if include_rooms:
+            summary.rooms.append(schemas.RoomOccupancy(
+                room_number=room.room_number,
+                total_beds=room.total_beds,
+                occupied=room.occupied_beds,
+                vacant=room.vacant_beds,
+                maintenance=room.maintenance_beds,
+                occupancy_rate=_occupancy_rate(room.occupied_beds, room.total_beds),
+                monthly_revenue=room.occupied_revenue
+            ))
+
+    totals = schemas.BedOccupancySummary(floors=list(floors.values()))
+    for summary in totals.floors:
+        summary.occupancy_rate = _occupancy_rate(summary.occupied, summary.total_beds)
+        totals.total_beds += summary.total_beds
+        totals.occupied += summary.occupied
+        totals.vacant += summary.vacant
+        totals.maintenance += summary.maintenance
+        totals.monthly_revenue += summary.monthly_revenue
+        totals.potential_revenue += summary.potential_revenue
+    totals.occupancy_rate = _occupancy_rate(totals.occupied, totals.total_beds)
+    return totals
+
+# Amenity operations
+def get_or_create_amenities(db: Session, names: List[str]):
+    labels = {}
+    for name in names:
+        if name and name.strip():
+            labels.setdefault(models.Amenity.slug_for(name), " ".join(name.split()))
+    if not labels:
+        return []
+    existing = db.query(models.Amenity).filter(models.Amenity.slug.in_(labels)).all()
+    found = {amenity.slug: amenity for amenity in existing}
+    missing = [slug for slug in labels if slug not in found]
+    if missing:
+        # Insert-if-absent then re-select, so two requests adding the same new amenity both succeed
+        dialect = postgresql if db.get_bind().dialect.name == "postgresql" else sqlite
+        db.execute(dialect.insert(models.Amenity).values(
+            [{"name": labels[slug], "slug": slug} for slug in missing]
+        ).on_conflict_do_nothing(index_elements=["slug"]))
+        found.update({
+            amenity.slug: amenity for amenity in db.query(models.Amenity).filter(models.Amenity.slug.in_(missing))
+        })
+    return [found[slug] for slug in labels]
+
+def get_amenities(db: Session):
+    return db.query(models.Amenity).order_by(models.Amenity.name).all()
+
+def _beds_with_amenities(db: Session, names: List[str]):
+    # Resolve through the (amenity_id, bed_id) index: beds linked to every requested amenity
+    slugs = {models.Amenity.slug_for(name) for name in names if name and name.strip()}
+    link = models.bed_amenities
+    return db.query(link.c.bed_id).join(
+        models.Amenity, models.Amenity.id == link.c.amenity_id
+    ).filter(models.Amenity.slug.in_(slugs)).group_by(link.c.bed_id).having(
+        func.count(link.c.amenity_id) == len(slugs)
+    )
+
 # Bed CRUD operations
 def create_bed(db: Session, bed: schemas.BedCreate):
-    db_bed = models.Bed(**bed.dict())
+    bed_data = bed.dict()
+    amenity_names = bed_data.pop("amenities")
+    db_bed = models.Bed(**bed_data)
+    db_bed.amenities = get_or_create_amenities(db, amenity_names)
     db.add(db_bed)
+    _add_bed_to_rollup(db, db_bed)
     db.commit()
     db.refresh(db_bed)
+    if db_bed.status == models.BedStatus.VACANT:
+        vacant_beds.bed_vacated(db_bed)
+    publish("beds", bed_id=db_bed.id)
     return db_bed
 
-def get_beds(db: Session):
-    return db.query(models.Bed).all()
+def get_beds(db: Session, amenities: Optional[List[str]] = None):
+    query = db.query(models.Bed)
+    if amenities:
+        query = query.filter(models.Bed.id.in_(_beds_with_amenities(db, amenities)))
+    return query.all()
 
-def get_vacant_beds(db: Session):
-    return db.query(models.Bed).filter(models.Bed.status == models.BedStatus.VACANT).all()
+def get_vacant_beds(db: Session, amenities: Optional[List[str]] = None):
+    query = db.query(models.Bed).filter(models.Bed.status == models.BedStatus.VACANT)
+    if amenities:
+        query = query.filter(models.Bed.id.in_(_beds_with_amenities(db, amenities)))
+    return query.all()
 
 def assign_bed_to_resident(db: Session, bed_id: int, resident_id: int):
-    # Check if bed is vacant
     bed = db.query(models.Bed).filter(models.Bed.id == bed_id).first()
-    if not bed or bed.status != models.BedStatus.VACANT:
+    if not bed:
         return False
     
     # Check if resident exists and doesn't already have a bed
@@ -272,14 +915,31 @@ def assign_bed_to_resident(db: Session, bed_id: int, resident_id: int):
     if not resident:
         return False
     
-    # Assign bed
-    bed.status = models.BedStatus.OCCUPIED
+    # Conditional UPDATE: the bed is only taken if it is still vacant in the database, whatever
+    # this process's vacant-bed index believes
+    taken = db.query(models.Bed).filter(
+        and_(models.Bed.id == bed_id, models.Bed.status == models.BedStatus.VACANT)
+    ).update({models.Bed.status: models.BedStatus.OCCUPIED}, synchronize_session=False)
+    if not taken:
+        db.rollback()
+        vacant_beds.bed_unavailable(bed_id)
+        return False
+    _move_bed_in_rollup(db, bed, models.BedStatus.VACANT, models.BedStatus.OCCUPIED)
     resident.bed_id = bed_id
     resident.room_number = bed.room_number
     
     db.commit()
+    db.refresh(bed)
+    vacant_beds.bed_occupied(bed, resident.gender)
+    publish("beds", bed_id=bed_id)
     return True
 
+def _vacate_bed(db: Session, bed: models.Bed, resident: Optional[models.Resident]):
+    if resident:
+        resident.bed_id = None
+    _move_bed_in_rollup(db, bed, bed.status, models.BedStatus.VACANT)
+    bed.status = models.BedStatus.VACANT
+
 def release_bed(db: Session, bed_id: int):
     bed = db.query(models.Bed).filter(models.Bed.id == bed_id).first()
     if not bed:
@@ -287,23 +947,125 @@ def release_bed(db: Session, bed_id: int):
     
     # Find resident using this bed and remove assignment
     resident = db.query(models.Resident).filter(models.Resident.bed_id == bed_id).first()
-    if resident:
-        resident.bed_id = None
-    
-    bed.status = models.BedStatus.VACANT
+    _vacate_bed(db, bed, resident)
     db.commit()
+    vacant_beds.bed_vacated(bed, resident.gender if resident else None)
+    publish("beds", bed_id=bed_id)
     return True
 
+def recommend_beds(db: Session, floor: Optional[int] = None, bed_type: Optional[str] = None,
+                   amenities: Optional[List[str]] = None, min_rate: Optional[float] = None,
+                   max_rate: Optional[float] = None, gender: Optional[str] = None, limit: int = 10):
+    if not vacant_beds.loaded:
+        vacant_beds.rebuild(db)
+    while True:
+        recommended = vacant_beds.recommend(
+            floor=floor,
+            bed_type=bed_type,
+            amenities=amenities or [],
+            min_rate=min_rate,
+            max_rate=max_rate,
+            gender=gender,
+            limit=limit
+        )
+        # The index only sees this process's writes: drop beds another worker has taken and ask again
+        bed_ids = [bed["bed_id"] for bed in recommended]
+        vacant = {bed_id for (bed_id,) in db.query(models.Bed.id).filter(
+            and_(models.Bed.id.in_(bed_ids), models.Bed.status == models.BedStatus.VACANT)
+        )} if bed_ids else set()
+        stale = [bed_id for bed_id in bed_ids if bed_id not in vacant]
+        if not stale:
+            return recommended
+        for bed_id in stale:
+            vacant_beds.bed_unavailable(bed_id)
+
 # Staff CRUD operations
 def create_staff(db: Session, staff: schemas.StaffCreate):
+    # Returns None when the email is already registered in this facility
     db_staff = models.Staff(**staff.dict())
     db.add(db_staff)
-    db.commit()
+    try:
+        db.commit()
+    except IntegrityError:
+        # A concurrent request registered the same email after the caller's check
+        db.rollback()
+        return None
     db.refresh(db_staff)
     return db_staff
 
-def get_staff(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.Staff).filter(models.Staff.is_active == True).offset(skip).limit(limit).all()
+def get_staff(db: Session, skip: int = 0, limit: int = 100, role: Optional[str] = None, ids=None):
+    query = db.query(models.Staff).filter(models.Staff.is_active == True)
+    if role is not None:
+        query = query.filter(models.Staff.role == role)
+    if ids is not None:
+        query = query.filter(models.Staff.id.in_(ids))
+    return query.order_by(models.Staff.id).offset(skip).limit(limit).all()
+
+def get_staff_member(db: Session, staff_id: int):
+    return db.query(models.Staff).filter(models.Staff.id == staff_id).first()
+
+def get_staff_by_email(db: Session, email: str):
+    return db.query(models.Staff).filter(models.Staff.email == email).first()
+
+# Roster CRUD operations
+def _roster_conflicts(db: Session, assignments: List[schemas.ShiftAssignmentCreate]):
+    keys = Counter((a.staff_id, a.shift_date, a.shift) for a in assignments)
+    conflicts = {key for key, repeats in keys.items() if repeats > 1}
+    dates = [a.shift_date for a in assignments]
+    existing = db.query(
+        models.ShiftAssignment.staff_id, models.ShiftAssignment.shift_date, models.ShiftAssignment.shift
+    ).filter(
+        and_(
+            models.ShiftAssignment.staff_id.in_({a.staff_id for a in assignments}),
+            models.ShiftAssignment.shift_date >= min(dates),
+            models.ShiftAssignment.shift_date <= max(dates)
+        )
+    ).all()
+    conflicts.update(key for key in map(tuple, existing) if key in keys)
+    return sorted(conflicts)
+
+def create_shift_assignments(db: Session, assignments: List[schemas.ShiftAssignmentCreate]):
+    """Insert a batch of assignments; returns (created, conflicts) and inserts nothing on conflict.
+
+    Conflicts are (staff_id, shift_date, shift) keys already rostered or repeated in the batch.
+    """
+    conflicts = _roster_conflicts(db, assignments)
+    if conflicts:
+        return [], conflicts
+
+    db_assignments = [models.ShiftAssignment(**a.dict()) for a in assignments]
+    db.add_all(db_assignments)
+    try:
+        db.commit()
+    except IntegrityError:
+        # A concurrent batch rostered someone first (uq_shift_assignments_staff_shift)
+        db.rollback()
+        conflicts = _roster_conflicts(db, assignments)
+        if conflicts:
+            return [], conflicts
+        raise
+    for db_assignment in db_assignments:
+        db.refresh(db_assignment)
+    return db_assignments, []
+
+def get_shift_assignments(db: Session, start: date, end: date, staff_id: Optional[int] = None, floor: Optional[int] = None):
+    query = db.query(models.ShiftAssignment).filter(
+        and_(models.ShiftAssignment.shift_date >= start, models.ShiftAssignment.shift_date <= end)
+    )
+    if staff_id is not None:
+        query = query.filter(models.ShiftAssignment.staff_id == staff_id)
+    if floor is not None:
+        query = query.filter(models.ShiftAssignment.floor == floor)
+    return query.order_by(
+        models.ShiftAssignment.shift_date, models.ShiftAssignment.floor, models.ShiftAssignment.id
+    ).all()
+
+def delete_shift_assignment(db: Session, assignment_id: int):
+    deleted = db.query(models.ShiftAssignment).filter(
+        models.ShiftAssignment.id == assignment_id
+    ).delete(synchronize_session=False)
+    db.commit()
+    return bool(deleted)
 
 # Visitor CRUD operations
 def create_visitor(db: Session, visitor: schemas.VisitorCreate):
@@ -316,19 +1078,270 @@ def create_visitor(db: Session, visitor: schemas.VisitorCreate):
 def get_visitors(db: Session, skip: int = 0, limit: int = 100):
     return db.query(models.Visitor).offset(skip).limit(limit).all()
 
-def get_resident_visitors(db: Session, resident_id: int):
-    return db.query(models.Visitor).filter(models.Visitor.resident_id == resident_id).all()
+def get_resident_visitors(db: Session, resident_id: int, skip: int = 0, limit: int = 100):
+    return db.query(models.Visitor).filter(
+        models.Visitor.resident_id == resident_id
+    ).order_by(models.Visitor.visit_date.desc(), models.Visitor.id.desc()).offset(skip).limit(limit).all()
+
+def get_visitor(db: Session, visitor_id: int):
+    return db.query(models.Visitor).filter(models.Visitor.id == visitor_id).first()
+
+def check_in_visitor(db: Session, visitor: schemas.VisitorCheckIn):
+    now = datetime.now()
+    db_visitor = models.Visitor(**visitor.dict(), visit_date=now, check_in_time=now)
+    db.add(db_visitor)
+    db.commit()
+    db.refresh(db_visitor)
+    return db_visitor
+
+def check_in_expected_visitor(db: Session, visitor_id: int):
+    # Arrival of a visit booked ahead of time; only the first check-in counts
+    checked_in = db.query(models.Visitor).filter(
+        and_(models.Visitor.id == visitor_id, models.Visitor.check_in_time == None)
+    ).update({models.Visitor.check_in_time: datetime.now()}, synchronize_session=False)
+    db.commit()
+    if not checked_in:
+        return None
+    return get_visitor(db, visitor_id)
+
+def check_out_visitor(db: Session, visitor_id: int):
+    checked_out = db.query(models.Visitor).filter(
+        and_(models.Visitor.id == visitor_id, open_visits())
+    ).update({models.Visitor.check_out_time: datetime.now()}, synchronize_session=False)
+    db.commit()
+    if not checked_out:
+        return None
+    return get_visitor(db, visitor_id)
+
+def archive_closed_visits(db: Session, retention_days: int = 180, batch_size: int = 500, max_batches: Optional[int] = None):
+    # Move closed visits (and no-shows) older than the retention window to the cold archive.
+    # Each batch is written and fsync'd before its rows are deleted.
+    cutoff = datetime.now() - timedelta(days=retention_days)
+    closed = and_(
+        models.Visitor.visit_date < cutoff,
+        or_(models.Visitor.check_out_time != None, models.Visitor.check_in_time == None)
+    )
+    columns = [column.name for column in models.Visitor.__table__.columns]
+    total = batches = 0
+    while max_batches is None or batches < max_batches:
+        visits = db.query(models.Visitor).filter(closed).order_by(models.Visitor.id).limit(batch_size).all()
+        if not visits:
+            break
+        by_facility = {}
+        for visit in visits:
+            by_facility.setdefault(visit.facility_id, []).append({column: getattr(visit, column) for column in columns})
+        for facility_id, rows in by_facility.items():
+            visitor_archive.append(rows, archive_dir=visitor_archive.facility_dir(facility_id))
+        db.query(models.Visitor).filter(
+            models.Visitor.id.in_([visit.id for visit in visits])
+        ).delete(synchronize_session=False)
+        db.commit()
+        db.expunge_all()
+        total += len(visits)
+        batches += 1
+    return {"rows": total, "batches": batches}
+
+# Records moved to the resident archive with a deleted resident; payments before the invoices they reference
+ARCHIVED_WITH_RESIDENT = (
+    models.Payment, models.EventParticipant, models.Medication, models.Checkup,
+    models.Document, models.Visitor, models.Billing,
+)
+
+def _archivable(db: Session, model):
+    # Receivables stay live until settled: an invoice with a balance, and the payments against
+    # it, remain in the ledger and the ageing report
+    if model is models.Billing:
+        return model.balance == 0
+    if model is models.Payment:
+        return ~model.billing_id.in_(db.query(models.Billing.id).filter(models.Billing.balance != 0))
+    return true()
+
+def archive_deleted_residents(db: Session, batch_size: int = 500, max_batches: Optional[int] = None):
+    # Move deleted residents' records to the cold archive, one bounded batch per transaction,
+    # then mark the resident archived once nothing is left. The tombstone row itself stays.
+    resident = models.Resident
+    pending = db.query(resident.id, resident.facility_id).execution_options(include_deleted=True).filter(
+        and_(resident.deleted_at != None, resident.archived_at == None)
+    ).order_by(resident.deleted_at).all()
+    total = batches = 0
+    for resident_id, facility_id in pending:
+        archive_dir = resident_archive.facility_dir(facility_id)
+        # Residents deleted before delete_resident released event seats: release them the same way
+        events = _live_registrations(db, resident_id)
+        if events:
+            for event_id in events:
+                _release_seats(db, event_id, [resident_id])
+            db.commit()
+            for event_id in events:
+                publish("participants", event_id=event_id)
+        for model in ARCHIVED_WITH_RESIDENT:
+            columns = [column.name for column in model.__table__.columns]
+            archivable = _archivable(db, model)
+            while True:
+                if max_batches is not None and batches >= max_batches:
+                    return {"rows": total, "batches": batches}
+                # Ascending ids: a checkup is archived before the follow-up it points to
+                rows = db.query(model).filter(
+                    and_(model.resident_id == resident_id, archivable)
+                ).order_by(model.id).limit(batch_size).all()
+                if not rows:
+                    break
+                resident_archive.append(
+                    resident_id, model.__tablename__, [{column: getattr(row, column) for column in columns} for row in rows],
+                    archive_dir=archive_dir
+                )
+                row_ids = [row.id for row in rows]
+                db.query(model).filter(model.id.in_(row_ids)).delete(synchronize_session=False)
+                db.commit()
+                if model is models.Checkup:
+                    # The job runs unscoped, so drop the archived bookings from every facility's index
+                    for index in checkup_slots.instances():
+                        for checkup_id in row_ids:
+                            index.remove(checkup_id)
+                db.expunge_all()
+                total += len(rows)
+                batches += 1
+        publish("checkups", resident_id=resident_id)
+        publish("visitors", resident_id=resident_id)
+        if db.query(models.Billing.id).filter(models.Billing.resident_id == resident_id).first() is not None:
+            # Unpaid invoices are still owed; try again on a later run once they are settled
+            continue
+        db.query(models.ResidentBalance).filter(models.ResidentBalance.resident_id == resident_id).delete(synchronize_session=False)
+        db.query(resident).filter(resident.id == resident_id).update(
+            {resident.archived_at: datetime.now()}, synchronize_session=False
+        )
+        db.commit()
+    return {"rows": total, "batches": batches}
+
+def get_visit_history(db: Session, resident_id: Optional[int] = None, start: Optional[datetime] = None,
+                      end: Optional[datetime] = None, before: Optional[tuple] = None, limit: int = 50,
+                      include_archive: bool = False):
+    # Newest first, keyset-paged on (visit_date, id); with include_archive the hot rows are
+    # merged with the archived months the page reaches into
+    query = db.query(models.Visitor)
+    if resident_id is not None:
+        query = query.filter(models.Visitor.resident_id == resident_id)
+    if start is not None:
+        query = query.filter(models.Visitor.visit_date >= start)
+    if end is not None:
+        query = query.filter(models.Visitor.visit_date < end)
+    if before is not None:
+        query = query.filter(or_(
+            models.Visitor.visit_date < before[0],
+            and_(models.Visitor.visit_date == before[0], models.Visitor.id < before[1])
+        ))
+    hot = query.order_by(models.Visitor.visit_date.desc(), models.Visitor.id.desc()).limit(limit).all()
+    items = [schemas.Visitor.model_validate(visit) for visit in hot]
+    if include_archive:
+        archived = (
+            schemas.Visitor.model_validate({**record, "archived": True})
+            for record in visitor_archive.iter_archived(
+                before=before, start=start, end=end, resident_id=resident_id,
+                archive_dir=visitor_archive.facility_dir(db.info["facility_id"])
+            )
+        )
+        items = list(islice(
+            heapq.merge(items, archived, key=lambda visit: (visit.visit_date, visit.id), reverse=True), limit
+        ))
+    next_cursor = (items[-1].visit_date, items[-1].id) if len(items) == limit else None
+    return items, next_cursor
+
+def get_on_site_visitors(db: Session, resident_id: Optional[int] = None):
+    return on_site_visitors(db, resident_id=resident_id)
 
 # Billing CRUD operations
 def create_billing(db: Session, billing: schemas.BillingCreate):
     db_billing = models.Billing(**billing.dict())
     db.add(db_billing)
+    ledger.apply(db, [(billing.resident_id, billing.due_date, billing.balance)])
     db.commit()
     db.refresh(db_billing)
     return db_billing
 
-def get_billing(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.Billing).offset(skip).limit(limit).all()
+def get_billing(db: Session, skip: int = 0, limit: int = 100, billing_run_id: Optional[int] = None):
+    query = db.query(models.Billing)
+    if billing_run_id is not None:
+        query = query.filter(models.Billing.billing_run_id == billing_run_id)
+    return query.order_by(models.Billing.id).offset(skip).limit(limit).all()
 
 def get_resident_billing(db: Session, resident_id: int):
     return db.query(models.Billing).filter(models.Billing.resident_id == resident_id).all()
+
+def get_invoice(db: Session, billing_id: int):
+    return db.query(models.Billing).filter(models.Billing.id == billing_id).first()
+
+def record_payment(db: Session, invoice: models.Billing, payment: schemas.PaymentCreate):
+    # Conditional relative UPDATE: concurrent payments can never take the balance below zero
+    paid = db.query(models.Billing).filter(
+        and_(models.Billing.id == invoice.id, models.Billing.balance >= payment.amount)
+    ).update({
+        models.Billing.amount_paid: models.Billing.amount_paid + payment.amount,
+        models.Billing.balance: models.Billing.balance - payment.amount,
+        models.Billing.payment_status: case(
+            (models.Billing.balance == payment.amount, "paid"), else_=models.Billing.payment_status
+        ),
+        models.Billing.payment_method: payment.payment_method,
+        models.Billing.payment_date: payment.payment_date,
+    }, synchronize_session=False)
+    if not paid:
+        db.rollback()
+        return None
+    db_payment = models.Payment(billing_id=invoice.id, resident_id=invoice.resident_id, **payment.dict())
+    db.add(db_payment)
+    ledger.apply(db, [(invoice.resident_id, invoice.due_date, -payment.amount)])
+    db.commit()
+    db.refresh(db_payment)
+    return db_payment
+
+def get_invoice_payments(db: Session, billing_id: int):
+    return db.query(models.Payment).filter(models.Payment.billing_id == billing_id).order_by(models.Payment.id).all()
+
+def get_ageing_report(db: Session, include_residents: bool = False, skip: int = 0, limit: int = 100):
+    # Reads the precomputed ledger only; invoices are never scanned here
+    balance = models.ResidentBalance
+    totals = db.query(
+        func.count(balance.resident_id),
+        func.max(balance.as_of),
+        func.sum(balance.balance),
+        *[func.sum(getattr(balance, bucket)) for bucket in ledger.BUCKETS]
+    ).filter(balance.balance != 0).one()
+    residents = []
+    if include_residents:
+        residents = db.query(balance).filter(balance.balance != 0).order_by(
+            balance.past_due_over_90.desc(), balance.balance.desc(), balance.resident_id
+        ).offset(skip).limit(limit).all()
+    return schemas.AgeingReport(
+        as_of=totals[1],
+        residents_with_balance=totals[0],
+        totals=schemas.AgeingBuckets(
+            balance=totals[2] or ZERO,
+            **{bucket: amount or ZERO for bucket, amount in zip(ledger.BUCKETS, totals[3:])}
+        ),
+        residents=residents
+    )
+
+def get_billing_runs(db: Session, limit: int = 24):
+    return db.query(models.BillingRun).order_by(models.BillingRun.period_start.desc()).limit(limit).all()
+
+def get_billing_totals(db: Session, resident_id: Optional[int] = None):
+    # Exact integer-cent SUMs in SQL, one row per resident
+    query = db.query(
+        models.Billing.resident_id,
+        func.count(models.Billing.id),
+        func.sum(models.Billing.total_amount),
+        func.sum(models.Billing.amount_paid),
+        func.sum(models.Billing.balance)
+    )
+    if resident_id is not None:
+        query = query.filter(models.Billing.resident_id == resident_id)
+    rows = query.group_by(models.Billing.resident_id).order_by(models.Billing.resident_id).all()
+    return [
+        schemas.BillingTotals(
+            resident_id=resident_id,
+            invoices=invoices,
+            total_billed=billed or ZERO,
+            total_paid=paid or ZERO,
+            balance=balance or ZERO
+        )
+        for resident_id, invoices, billed, paid, balance in rows
+    ]
@@ -1,28 +1,93 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, Delete, Insert, Update
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
 from decouple import config
+from typing import Optional
+import time
 import os
 
+from app import tenancy
+
 # Database configuration
 DATABASE_URL = config(
-    'DATABASE_URL', 
+    'DATABASE_URL',
     default='sqlite:///./old_age_home.db'
 )
+# Optional streaming replica for read-only endpoints; unset means everything uses the primary
+DATABASE_REPLICA_URL = config('DATABASE_REPLICA_URL', default='')
+# How long a client's reads stay on the primary after it writes, to cover replication lag
+READ_YOUR_WRITES_SECONDS = config('READ_YOUR_WRITES_SECONDS', default=5, cast=float)
+
+def _create_engine(url):
+    # For SQLite, we need to add check_same_thread=False
+    if url.startswith('sqlite'):
+        return create_engine(
+            url,
+            connect_args={"check_same_thread": False}
+        )
+    return create_engine(url)
+
+engine = _create_engine(DATABASE_URL)
+replica_engine = _create_engine(DATABASE_REPLICA_URL) if DATABASE_REPLICA_URL else engine
+REPLICA_ENABLED = replica_engine is not engine
+
+# Facility databases: the shared primary is pinned, dedicated ones are pooled per URL and evicted when idle
+tenancy.set_router(tenancy.FacilityRouter(DATABASE_URL, tenancy.FACILITY_DATABASES))
+engines = tenancy.EngineCache(_create_engine, pinned={DATABASE_URL: engine})
+
+class RoutingSession(Session):
+    """Session bound to its facility's database.
+
+    Sessions opened read-only read the shared database from the replica; flushes and DML
+    always go to the primary.
+    """
 
-# For SQLite, we need to add check_same_thread=False
-if DATABASE_URL.startswith('sqlite'):
-    engine = create_engine(
-        DATABASE_URL, 
-        connect_args={"check_same_thread": False}
-    )
-else:
-    engine = create_engine(DATABASE_URL)
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.info.setdefault("facility_id", tenancy.current_facility.get())
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        url = self.info.get("database_url") or tenancy.router.url_for(self.info["facility_id"])
+        if url != DATABASE_URL:
+            return engines.get(url)
+        if self.info.get("read_only") and not self._flushing and not isinstance(clause, (Insert, Update, Delete)):
+            return replica_engine
+        return engine
+
+SessionLocal = sessionmaker(class_=RoutingSession, autocommit=False, autoflush=False)
+ReadSessionLocal = sessionmaker(class_=RoutingSession, autocommit=False, autoflush=False, info={"read_only": True})
 
 Base = declarative_base()
 
+# Read-your-writes pin: a write response hands its wall-clock time back to the client as a cookie
+# and a header, and the client's reads stay on the primary while that time is inside the window.
+# The pin travels with the client, so every worker and every instance behind the proxy honours it.
+WRITE_PIN_COOKIE = "last_write_at"
+WRITE_PIN_HEADER = "X-Last-Write-At"
+
+def write_pin() -> str:
+    return f"{time.time():.3f}"
+
+def read_pinned(written_at: Optional[str]) -> bool:
+    """Whether a client that last wrote at ``written_at`` must still read from the primary"""
+    try:
+        written = float(written_at)
+    except (TypeError, ValueError):
+        return False
+    # abs() absorbs small clock differences between the instances that wrote and that read
+    return abs(time.time() - written) < READ_YOUR_WRITES_SECONDS
+
+def each_database():
+    """Unscoped sessions on every facility database in turn, for work that spans facilities"""
+    for url in tenancy.router.database_urls():
+        token = tenancy.current_facility.set(None)
+        db = SessionLocal(info={"facility_id": None, "database_url": url})
+        try:
+            yield db
+        finally:
+            db.close()
+            tenancy.current_facility.reset(token)
+
 # Database dependency
 def get_database():
     db = SessionLocal()
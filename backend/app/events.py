@@ -0,0 +1,30 @@
+"""
+In-process change notifications.
+
+crud publishes a topic (usually the name of the table that changed) after
+a successful commit; caches and in-memory indexes subscribe to drop or
+refresh whatever depends on that data.
+"""
+import logging
+from collections import defaultdict
+
+logger = logging.getLogger(__name__)
+
+_subscribers = defaultdict(list)
+
+
+def subscribe(topic: str):
+    """Register the decorated function as a handler for ``topic``"""
+    def decorator(handler):
+        _subscribers[topic].append(handler)
+        return handler
+    return decorator
+
+
+def publish(topic: str, **payload):
+    """Call every handler for ``topic``; a failing handler never fails the write"""
+    for handler in list(_subscribers[topic]):
+        try:
+            handler(**payload)
+        except Exception:
+            logger.exception("Handler %r failed for %s", handler, topic)
@@ -0,0 +1,165 @@
+"""
+Drug-interaction and allergy conflict checker.
+
+The CSV fixtures in ``app/data`` are compiled once into a compact index:
+every normalised drug or allergen term gets an integer id, interactions
+become an id -> {id: rule} adjacency map and allergen classes become
+id -> frozenset of drug ids. Checking a prescription is then a handful of
+dict and set lookups, cheap enough to run inline on every medication write.
+"""
+import csv
+import os
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+INTERACTIONS_FILE = os.path.join(DATA_DIR, "drug_interactions.csv")
+ALLERGENS_FILE = os.path.join(DATA_DIR, "allergen_groups.csv")
+
+# Severities that stop a prescription unless the prescriber overrides
+BLOCKING_SEVERITIES = {"contraindicated", "major", "allergy"}
+
+MAX_TERM_WORDS = 3
+# Distinct medication names / allergy lists remembered per index
+LOOKUP_CACHE_SIZE = 4096
+
+_NON_WORD = re.compile(r"[^a-z0-9]+")
+_ALLERGY_SEPARATORS = re.compile(r"[,;/\n]|\band\b")
+
+
+def normalise(term: str) -> str:
+    return " ".join(_NON_WORD.sub(" ", (term or "").lower()).split())
+
+
+@dataclass(frozen=True)
+class Conflict:
+    kind: str  # interaction, allergy
+    severity: str
+    medication: str
+    conflicts_with: str
+    description: str
+
+    @property
+    def blocking(self) -> bool:
+        return self.severity in BLOCKING_SEVERITIES
+
+
+class InteractionIndex:
+    def __init__(self):
+        self._ids: Dict[str, int] = {}
+        self._terms: List[str] = []
+        self._interactions: Dict[int, Dict[int, Tuple[str, str]]] = {}
+        self._allergens: Dict[int, FrozenSet[int]] = {}
+        # Per-instance lookup caches, dropped with the index
+        self._drug_cache: Dict[str, FrozenSet[int]] = {}
+        self._allergy_cache: Dict[Optional[str], FrozenSet[Tuple[int, str]]] = {}
+
+    def _intern(self, term: str) -> int:
+        term = normalise(term)
+        term_id = self._ids.get(term)
+        if term_id is None:
+            term_id = self._ids[term] = len(self._terms)
+            self._terms.append(term)
+        return term_id
+
+    @classmethod
+    def from_files(cls, interactions_file: str = INTERACTIONS_FILE, allergens_file: str = ALLERGENS_FILE):
+        index = cls()
+        with open(interactions_file, newline="") as handle:
+            for row in csv.DictReader(handle):
+                first, second = index._intern(row["drug_a"]), index._intern(row["drug_b"])
+                rule = (row["severity"].strip().lower(), row["description"].strip())
+                index._interactions.setdefault(first, {})[second] = rule
+                index._interactions.setdefault(second, {})[first] = rule
+        groups: Dict[int, set] = {}
+        with open(allergens_file, newline="") as handle:
+            for row in csv.DictReader(handle):
+                groups.setdefault(index._intern(row["allergen"]), set()).add(index._intern(row["drug"]))
+        index._allergens = {allergen: frozenset(drugs) for allergen, drugs in groups.items()}
+        return index
+
+    def term(self, term_id: int) -> str:
+        return self._terms[term_id]
+
+    @staticmethod
+    def _remember(cache: dict, key, value):
+        if len(cache) >= LOOKUP_CACHE_SIZE:
+            cache.clear()
+        cache[key] = value
+        return value
+
+    def drug_ids(self, medication_name: str) -> FrozenSet[int]:
+        """Ids of known drugs named in a medication name ("Metformin 500mg XR")"""
+        found = self._drug_cache.get(medication_name)
+        if found is None:
+            found = self._remember(self._drug_cache, medication_name, self._find_drugs(medication_name))
+        return found
+
+    def _find_drugs(self, medication_name: str) -> FrozenSet[int]:
+        words = normalise(medication_name).split()
+        found = set()
+        for size in range(1, MAX_TERM_WORDS + 1):
+            for start in range(len(words) - size + 1):
+                term_id = self._ids.get(" ".join(words[start:start + size]))
+                if term_id is not None:
+                    found.add(term_id)
+        return frozenset(found)
+
+    def allergy_ids(self, allergies: Optional[str]) -> FrozenSet[Tuple[int, str]]:
+        """(term id, original text) for each recognised entry in a free-text allergy list"""
+        found = self._allergy_cache.get(allergies)
+        if found is None:
+            found = self._remember(self._allergy_cache, allergies, self._find_allergies(allergies))
+        return found
+
+    def _find_allergies(self, allergies: Optional[str]) -> FrozenSet[Tuple[int, str]]:
+        found = set()
+        for entry in _ALLERGY_SEPARATORS.split(allergies or ""):
+            term = normalise(entry)
+            for candidate in (term, term[:-1] if term.endswith("s") else None, term.replace(" drugs", "")):
+                term_id = self._ids.get(candidate) if candidate else None
+                if term_id is not None:
+                    found.add((term_id, entry.strip()))
+                    break
+        return frozenset(found)
+
+    def check(self, medication_name: str, active_medications: Iterable[str] = (), allergies: Optional[str] = None) -> List[Conflict]:
+        drugs = self.drug_ids(medication_name)
+        if not drugs:
+            return []
+        conflicts = []
+
+        for allergen_id, allergy in self.allergy_ids(allergies):
+            members = self._allergens.get(allergen_id, frozenset()) | {allergen_id}
+            for drug_id in drugs & members:
+                conflicts.append(Conflict(
+                    kind="allergy",
+                    severity="allergy",
+                    medication=medication_name,
+                    conflicts_with=allergy,
+                    description=f"{self.term(drug_id)} is listed under the resident's {allergy} allergy",
+                ))
+
+        for other_name in active_medications:
+            for drug_id in drugs:
+                neighbours = self._interactions.get(drug_id)
+                if not neighbours:
+                    continue
+                for other_id in self.drug_ids(other_name):
+                    rule = neighbours.get(other_id)
+                    if rule is not None:
+                        conflicts.append(Conflict(
+                            kind="interaction",
+                            severity=rule[0],
+                            medication=medication_name,
+                            conflicts_with=other_name,
+                            description=rule[1],
+                        ))
+        return conflicts
+
+
+@lru_cache(maxsize=1)
+def get_index() -> InteractionIndex:
+    return InteractionIndex.from_files()
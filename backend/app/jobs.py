@@ -0,0 +1,81 @@
+"""
+Background jobs run by the in-process scheduler.
+"""
+from functools import wraps
+
+from decouple import config
+
+from app import ages, crud, ledger, sync
+from app.database import each_database
+from app.scheduler import scheduler
+
+MEDICATION_SWEEP_INTERVAL = config("MEDICATION_SWEEP_INTERVAL_SECONDS", default=3600, cast=int)
+MEDICATION_SWEEP_BATCH_SIZE = config("MEDICATION_SWEEP_BATCH_SIZE", default=500, cast=int)
+EVENT_OCCURRENCE_INTERVAL = config("EVENT_OCCURRENCE_REFRESH_SECONDS", default=3600, cast=int)
+EVENT_OCCURRENCE_WINDOW_DAYS = config("EVENT_OCCURRENCE_WINDOW_DAYS", default=60, cast=int)
+VISITOR_ARCHIVE_INTERVAL = config("VISITOR_ARCHIVE_INTERVAL_SECONDS", default=86400, cast=int)
+VISITOR_RETENTION_DAYS = config("VISITOR_RETENTION_DAYS", default=180, cast=int)
+AR_AGEING_INTERVAL = config("AR_AGEING_INTERVAL_SECONDS", default=86400, cast=int)
+RESIDENT_ARCHIVE_INTERVAL = config("RESIDENT_ARCHIVE_INTERVAL_SECONDS", default=3600, cast=int)
+RESIDENT_ARCHIVE_BATCH_SIZE = config("RESIDENT_ARCHIVE_BATCH_SIZE", default=500, cast=int)
+CHANGE_LOG_COMPACTION_INTERVAL = config("CHANGE_LOG_COMPACTION_INTERVAL_SECONDS", default=86400, cast=int)
+
+
+def across_databases(func):
+    """Run a job once per facility database, unscoped, and add up what it touched"""
+    @wraps(func)
+    def run(_db):
+        rows = batches = 0
+        for db in each_database():
+            result = func(db)
+            if isinstance(result, dict):
+                rows += result.get("rows") or 0
+                batches += result.get("batches") or 0
+            else:
+                rows += result or 0
+        return {"rows": rows, "batches": batches}
+    return run
+
+
+@across_databases
+def expire_medication_courses(db):
+    return crud.deactivate_expired_medications(db, batch_size=MEDICATION_SWEEP_BATCH_SIZE)
+
+
+@across_databases
+def materialise_event_occurrences(db):
+    return crud.refresh_event_occurrences(db, horizon_days=EVENT_OCCURRENCE_WINDOW_DAYS)
+
+
+@across_databases
+def archive_old_visits(db):
+    return crud.archive_closed_visits(db, retention_days=VISITOR_RETENTION_DAYS)
+
+
+@across_databases
+def archive_deleted_residents(db):
+    return crud.archive_deleted_residents(db, batch_size=RESIDENT_ARCHIVE_BATCH_SIZE)
+
+
+@across_databases
+def refresh_resident_ages(db):
+    return ages.refresh(db)
+
+
+@across_databases
+def refresh_ar_ageing(db):
+    return ledger.refresh(db)
+
+
+@across_databases
+def compact_change_log(db):
+    return sync.compact(db)
+
+
+scheduler.register("medication_expiry", MEDICATION_SWEEP_INTERVAL, expire_medication_courses)
+scheduler.register("event_occurrences", EVENT_OCCURRENCE_INTERVAL, materialise_event_occurrences)
+scheduler.register("visitor_archive", VISITOR_ARCHIVE_INTERVAL, archive_old_visits)
+scheduler.register("resident_archive", RESIDENT_ARCHIVE_INTERVAL, archive_deleted_residents)
+scheduler.register("resident_ages", None, refresh_resident_ages, at_midnight=True)
+scheduler.register("ar_ageing", AR_AGEING_INTERVAL, refresh_ar_ageing)
+scheduler.register("change_log_compaction", CHANGE_LOG_COMPACTION_INTERVAL, compact_change_log)
@@ -0,0 +1,145 @@
+"""
+Accounts-receivable ledger.
+
+``resident_balances`` holds one row per resident with their outstanding
+balance split into ageing buckets by days past ``due_date``. Invoices and
+payments adjust the row in the same transaction with relative UPDATEs,
+bucketed as of the row's ``as_of`` date. The nightly ``ar_ageing`` job
+marks unpaid invoices overdue and re-buckets every balance with one
+grouped query, so the ageing report only ever reads the small ledger
+table, however much invoice history builds up. Settled residents keep a
+zero row, which the report skips.
+"""
+from collections import defaultdict
+from datetime import date
+from decimal import Decimal
+from typing import Iterable, Tuple
+
+from sqlalchemy import and_, bindparam, case, func, insert, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from app import models
+from app.money import Cents, ZERO
+
+BUCKETS = ("current", "past_due_0_30", "past_due_31_60", "past_due_61_90", "past_due_over_90")
+
+
+def bucket_for(due_date: date, as_of: date) -> str:
+    days_past_due = (as_of - due_date).days
+    if days_past_due <= 0:
+        return "current"
+    if days_past_due <= 30:
+        return "past_due_0_30"
+    if days_past_due <= 60:
+        return "past_due_31_60"
+    if days_past_due <= 90:
+        return "past_due_61_90"
+    return "past_due_over_90"
+
+
+def apply(db: Session, entries: Iterable[Tuple[int, date, Decimal]]):
+    """Add (resident_id, due_date, amount) to the ledger; negative amounts are payments.
+
+    Runs inside the caller's transaction and does not commit.
+    """
+    entries = [(resident_id, due_date, amount) for resident_id, due_date, amount in entries if amount]
+    if not entries:
+        return
+    balance = models.ResidentBalance
+    resident_ids = {resident_id for resident_id, _, _ in entries}
+
+    def locked(ids):
+        return db.query(balance.resident_id, balance.as_of).filter(balance.resident_id.in_(ids)).with_for_update().all()
+
+    as_of = dict(locked(resident_ids))
+    missing = resident_ids - as_of.keys()
+    if missing:
+        # Insert-if-absent then lock, so two first invoices for a resident don't race on the key
+        today = date.today()
+        dialect = postgresql if db.get_bind().dialect.name == "postgresql" else sqlite
+        db.execute(dialect.insert(balance).on_conflict_do_nothing(index_elements=["resident_id"]), [
+            {"resident_id": resident_id, "balance": ZERO, "as_of": today, **{bucket: ZERO for bucket in BUCKETS}}
+            for resident_id in missing
+        ])
+        as_of.update(locked(missing))
+
+    totals = defaultdict(Decimal)
+    for resident_id, due_date, amount in entries:
+        totals[(bucket_for(due_date, as_of[resident_id]), resident_id)] += amount
+
+    table = balance.__table__
+    by_bucket = defaultdict(list)
+    for (bucket, resident_id), amount in totals.items():
+        by_bucket[bucket].append({"rid": resident_id, "amount": amount})
+    for bucket, params in by_bucket.items():
+        amount = bindparam("amount", type_=Cents())
+        db.execute(
+            update(table).where(table.c.resident_id == bindparam("rid")).values({
+                table.c.balance: table.c.balance + amount,
+                table.c[bucket]: table.c[bucket] + amount,
+            }),
+            params
+        )
+
+
+def refresh(db: Session, as_of: date = None):
+    """Mark unpaid invoices overdue and re-bucket every open balance as of ``as_of``"""
+    as_of = as_of or date.today()
+    billing = models.Billing
+    balance = models.ResidentBalance
+    # Lock the ledger before reading invoices. A payment that committed first is in the read
+    # below; one that commits later waits on these rows and then applies its delta on top of
+    # the refreshed balance, so rows are updated in place rather than deleted and reinserted.
+    db.query(balance.resident_id).with_for_update().all()
+    overdue = db.query(billing).filter(
+        and_(billing.payment_status == "pending", billing.due_date < as_of, billing.balance > 0)
+    ).update({billing.payment_status: "overdue"}, synchronize_session=False)
+
+    days_past_due = func.julianday(as_of) - func.julianday(billing.due_date) \
+        if db.get_bind().dialect.name == "sqlite" else as_of - billing.due_date
+    bucket = case(
+        (days_past_due <= 0, "current"),
+        (days_past_due <= 30, "past_due_0_30"),
+        (days_past_due <= 60, "past_due_31_60"),
+        (days_past_due <= 90, "past_due_61_90"),
+        else_="past_due_over_90",
+    )
+    rows = db.query(
+        billing.facility_id,
+        billing.resident_id,
+        func.sum(billing.balance),
+        *[func.sum(case((bucket == name, billing.balance), else_=ZERO)) for name in BUCKETS]
+    ).filter(billing.balance > 0).group_by(billing.facility_id, billing.resident_id).all()
+    balances = {
+        row[1]: {"facility_id": row[0], "balance": row[2], **dict(zip(BUCKETS, row[3:]))}
+        for row in rows
+    }
+
+    # Rows inserted by invoices since the first lock are already counted in ``rows``
+    existing = [resident_id for (resident_id,) in db.query(balance.resident_id).with_for_update()]
+    settled = {"balance": ZERO, **{name: ZERO for name in BUCKETS}}
+    table = balance.__table__
+    if existing:
+        db.execute(
+            update(table).where(table.c.resident_id == bindparam("rid")),
+            [
+                {"rid": resident_id, "as_of": as_of,
+                 **{key: value for key, value in balances.get(resident_id, settled).items() if key != "facility_id"}}
+                for resident_id in existing
+            ]
+        )
+    missing = balances.keys() - set(existing)
+    if missing:
+        db.execute(insert(balance), [
+            {"resident_id": resident_id, "as_of": as_of, **balances[resident_id]} for resident_id in missing
+        ])
+    db.commit()
+    return {"rows": len(rows) + overdue, "batches": 1}
+
+
+def ensure(db: Session):
+    """Build the ledger once when invoices exist but were never aggregated"""
+    if db.query(models.ResidentBalance).first() is None and db.query(models.Billing).first() is not None:
+        return refresh(db)
+    return None
@@ -1,17 +1,35 @@
-from fastapi import FastAPI, HTTPException, Depends, UploadFile, File
+from fastapi import FastAPI, HTTPException, Depends, UploadFile, File, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from fastapi.staticfiles import StaticFiles
 from sqlalchemy.orm import Session
 from typing import List, Optional
 import os
-from datetime import datetime, date
+from datetime import datetime, date, timedelta
 
-from app.database import SessionLocal, engine
-from app import models, schemas, crud
-from app.auth import get_current_user
-
-# Create database tables
-models.Base.metadata.create_all(bind=engine)
+from app.database import (
+    SessionLocal, ReadSessionLocal, engines, each_database, REPLICA_ENABLED, READ_YOUR_WRITES_SECONDS,
+    WRITE_PIN_COOKIE, WRITE_PIN_HEADER, write_pin, read_pinned,
+)
+from app import tenancy
+from app.tenancy import current_facility, DEFAULT_FACILITY_ID
+from app import models, schemas, crud, ages, ledger, sync
+from app.bed_index import vacant_beds
+from app.billing import run_billing, month_period, BillingRunInProgress
+from app.checkup_slots import checkup_slots
+from app.medication_schedule import get_daily_mar
+from app.schedule import get_schedule, get_today_schedule, MAX_RANGE_DAYS
+from app.scheduler import scheduler, SCHEDULER_ENABLED
+from app.roster import get_coverage, MAX_RANGE_DAYS as ROSTER_MAX_RANGE_DAYS
+from app.recurrence import parse_rule, InvalidRecurrence
+from app.response_cache import cached, coalesced, response_cache
+from app.audit import audit_log, current_actor
+from app import jobs  # registers background jobs
+from app.auth import get_current_user, require_admin, verify_token
+
+# Create database tables (the shared database and every dedicated facility database)
+for database_url in tenancy.router.database_urls():
+    models.Base.metadata.create_all(bind=engines.get(database_url))
 
 app = FastAPI(
     title="Old Age Home Management API",
@@ -26,12 +44,90 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[WRITE_PIN_HEADER],
 )
 
 # Static files for uploaded documents
 os.makedirs("uploads", exist_ok=True)
 app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
 
+def token_facilities(claims: dict) -> set:
+    """Facilities a token may act for: its facility_id claim plus any listed under facilities"""
+    facilities = claims.get("facilities") or []
+    if claims.get("facility_id") is not None:
+        facilities = [claims["facility_id"], *facilities]
+    try:
+        return {int(facility_id) for facility_id in facilities}
+    except (TypeError, ValueError):
+        return set()
+
+def request_facility(request: Request) -> int:
+    """Facility from the X-Facility-Id header (if the bearer token allows it) or the token's facility_id claim"""
+    header = request.headers.get("x-facility-id")
+    try:
+        facility_id = int(header) if header else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="X-Facility-Id must be an integer")
+    if facility_id is not None and facility_id < 1:
+        raise HTTPException(status_code=400, detail="X-Facility-Id must be positive")
+    claims = {}
+    authorization = request.headers.get("authorization", "")
+    if authorization.lower().startswith("bearer "):
+        claims = verify_token(authorization[7:]) or {}
+    home = claims.get("facility_id")
+    if facility_id is None:
+        return int(home) if home is not None else DEFAULT_FACILITY_ID
+    # Choosing another facility needs a token that allows it; naming the default is a no-op
+    if facility_id in token_facilities(claims) or (facility_id == DEFAULT_FACILITY_ID and home is None):
+        return facility_id
+    if not claims:
+        raise HTTPException(status_code=401, detail="X-Facility-Id requires a bearer token for that facility")
+    raise HTTPException(status_code=403, detail="Token is not valid for this facility")
+
+@app.middleware("http")
+async def scope_to_facility(request: Request, call_next):
+    # Sessions opened while handling the request pick the facility up from the context
+    try:
+        facility_id = request_facility(request)
+    except HTTPException as exc:
+        return JSONResponse(status_code=exc.status_code, content={"detail": exc.detail})
+    token = current_facility.set(facility_id)
+    try:
+        return await call_next(request)
+    finally:
+        current_facility.reset(token)
+
+def request_actor(request: Request) -> Optional[int]:
+    """Staff id from the bearer token's sub claim (the id get_current_user looks up)"""
+    authorization = request.headers.get("authorization", "")
+    if not authorization.lower().startswith("bearer "):
+        return None
+    subject = (verify_token(authorization[7:]) or {}).get("sub")
+    try:
+        return int(subject) if subject is not None else None
+    except (TypeError, ValueError):
+        return None
+
+@app.middleware("http")
+async def identify_actor(request: Request, call_next):
+    # Audit entries captured while handling the request are attributed to the token's staff member
+    token = current_actor.set(request_actor(request))
+    try:
+        return await call_next(request)
+    finally:
+        current_actor.reset(token)
+
+@app.middleware("http")
+async def track_writes(request: Request, call_next):
+    response = await call_next(request)
+    # Pin the client's reads to the primary until the replica has caught up with its write
+    if REPLICA_ENABLED and request.method not in ("GET", "HEAD", "OPTIONS"):
+        written_at = write_pin()
+        response.set_cookie(WRITE_PIN_COOKIE, written_at, max_age=max(int(READ_YOUR_WRITES_SECONDS), 1),
+                            httponly=True, samesite="lax")
+        response.headers[WRITE_PIN_HEADER] = written_at
+    return response
+
 # Dependency to get database session
 def get_db():
     db = SessionLocal()
@@ -40,9 +136,53 @@ def get_db():
     finally:
         db.close()
 
+def get_read_db(request: Request):
+    """Session for read-only endpoints: the replica, unless this client wrote recently"""
+    written_at = request.headers.get(WRITE_PIN_HEADER) or request.cookies.get(WRITE_PIN_COOKIE)
+    read_only = REPLICA_ENABLED and not read_pinned(written_at)
+    db = ReadSessionLocal() if read_only else SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+@app.on_event("startup")
+def warm_indexes():
+    for db in each_database():
+        crud.ensure_bed_rollups(db)
+        ledger.ensure(db)
+        ages.ensure(db)
+        sync.ensure(db)
+    # The default facility is warmed now; others load on first use
+    db = SessionLocal()
+    try:
+        vacant_beds.rebuild(db)
+        checkup_slots.rebuild(db)
+    finally:
+        db.close()
+
+@app.on_event("startup")
+async def start_scheduler():
+    if SCHEDULER_ENABLED:
+        await scheduler.start()
+
+@app.on_event("shutdown")
+async def stop_scheduler():
+    await scheduler.stop()
+
+@app.on_event("startup")
+def start_audit_writer():
+    audit_log.start()
+
+@app.on_event("shutdown")
+def stop_audit_writer():
+    # Flush what is still queued before the process exits
+    audit_log.stop()
+
 # Dashboard endpoints
 @app.get("/api/dashboard/stats", response_model=schemas.DashboardStats)
-def get_dashboard_stats(db: Session = Depends(get_db)):
+@coalesced(model=schemas.DashboardStats, daily=True)
+def get_dashboard_stats(db: Session = Depends(get_read_db)):
     """Get dashboard statistics"""
     total_residents = crud.get_total_residents_count(db)
     under_medication = crud.get_residents_under_medication_count(db)
@@ -63,17 +203,23 @@ def create_resident(resident: schemas.ResidentCreate, db: Session = Depends(get_
     return crud.create_resident(db=db, resident=resident)
 
 @app.get("/api/residents/", response_model=List[schemas.Resident])
-def get_residents(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+def get_residents(skip: int = 0, limit: int = 100, db: Session = Depends(get_read_db)):
     """Get all residents"""
     return crud.get_residents(db, skip=skip, limit=limit)
 
 @app.get("/api/residents/recent", response_model=List[schemas.Resident])
-def get_recent_residents(limit: int = 10, db: Session = Depends(get_db)):
+@cached("residents", "beds", model=List[schemas.Resident])
+def get_recent_residents(limit: int = 10, db: Session = Depends(get_read_db)):
     """Get recently added residents"""
     return crud.get_recent_residents(db, limit=limit)
 
+@app.get("/api/residents/age-bands", response_model=schemas.AgeBandReport)
+def get_resident_age_bands(db: Session = Depends(get_read_db)):
+    """Get active residents per ten-year age band, from the rollup kept current nightly"""
+    return crud.get_age_band_report(db)
+
 @app.get("/api/residents/search")
-def search_residents(query: str, db: Session = Depends(get_db)):
+def search_residents(query: str, db: Session = Depends(get_read_db)):
     """Search residents by name, room, or other criteria"""
     return crud.search_residents(db, query=query)
 
@@ -102,45 +248,185 @@ def delete_resident(resident_id: int, db: Session = Depends(get_db)):
     return {"message": "Resident deleted successfully"}
 
 # Medication endpoints
+def medication_conflict_error(conflicts):
+    return HTTPException(
+        status_code=409,
+        detail={
+            "message": "Prescription conflicts with the resident's allergies or active medications",
+            "conflicts": [schemas.MedicationConflict.model_validate(conflict).model_dump() for conflict in conflicts]
+        }
+    )
+
 @app.post("/api/medications/", response_model=schemas.Medication)
-def create_medication(medication: schemas.MedicationCreate, db: Session = Depends(get_db)):
-    """Add medication for a resident"""
+def create_medication(medication: schemas.MedicationCreate, override_conflicts: bool = False, db: Session = Depends(get_db)):
+    """Add medication for a resident (rejected on allergy or major interaction conflicts unless overridden)"""
+    conflicts = crud.check_medication_conflicts(db, medication.resident_id, medication.medication_name)
+    if not override_conflicts and any(conflict.blocking for conflict in conflicts):
+        raise medication_conflict_error(conflicts)
     return crud.create_medication(db=db, medication=medication)
 
+@app.post("/api/medications/check", response_model=List[schemas.MedicationConflict])
+def check_medication(check: schemas.MedicationCheck, db: Session = Depends(get_db)):
+    """Check a prospective prescription against the resident's allergies and active medications"""
+    return crud.check_medication_conflicts(db, check.resident_id, check.medication_name)
+
+@app.put("/api/medications/bulk", response_model=List[schemas.Medication])
+def bulk_update_medications(updates: List[schemas.MedicationBulkUpdate], override_conflicts: bool = False, db: Session = Depends(get_db)):
+    """Update several medications in one transaction, with conflict checks"""
+    medications, conflicts = crud.bulk_update_medications(db, updates, override_conflicts=override_conflicts)
+    if medications is None:
+        raise HTTPException(status_code=404, detail="Medication not found")
+    if not medications and conflicts:
+        raise medication_conflict_error(conflicts)
+    return medications
+
 @app.get("/api/medications/resident/{resident_id}", response_model=List[schemas.Medication])
-def get_resident_medications(resident_id: int, db: Session = Depends(get_db)):
+def get_resident_medications(resident_id: int, db: Session = Depends(get_read_db)):
     """Get all medications for a specific resident"""
     return crud.get_resident_medications(db, resident_id=resident_id)
 
+@app.get("/api/medications/mar", response_model=schemas.MedicationAdministrationRecord)
+def get_medication_administration_record(
+    day: Optional[date] = None,
+    floor: Optional[int] = None,
+    round: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """Get the day's medication administration record for a floor or the whole facility"""
+    return get_daily_mar(db, day=day or date.today(), floor=floor, round_name=round)
+
 # Birthday endpoints
 @app.get("/api/birthdays/upcoming", response_model=List[schemas.ResidentBirthday])
-def get_upcoming_birthdays(days: int = 7, db: Session = Depends(get_db)):
+@cached("residents", model=List[schemas.ResidentBirthday], daily=True)
+def get_upcoming_birthdays(days: int = 7, db: Session = Depends(get_read_db)):
     """Get residents with upcoming birthdays"""
     return crud.get_upcoming_birthdays(db, days=days)
 
 @app.get("/api/birthdays/today", response_model=List[schemas.ResidentBirthday])
-def get_today_birthdays(db: Session = Depends(get_db)):
+@cached("residents", model=List[schemas.ResidentBirthday], daily=True)
+def get_today_birthdays(db: Session = Depends(get_read_db)):
     """Get residents with birthdays today"""
     return crud.get_today_birthdays(db)
 
 # Checkup endpoints
+def checkup_conflict_error(db: Session, checkup: schemas.CheckupCreate, conflicts):
+    next_slot = crud.find_next_checkup_slot(
+        db, after=checkup.scheduled_date, duration_minutes=checkup.duration_minutes,
+        doctor_name=checkup.doctor_name, location=checkup.location, resident_id=checkup.resident_id
+    )
+    return HTTPException(
+        status_code=409,
+        detail={
+            "message": "Checkup overlaps an existing booking",
+            "conflicts": [schemas.CheckupSlotConflict.model_validate(conflict).model_dump(mode="json") for conflict in conflicts],
+            "next_free_slot": next_slot.isoformat() if next_slot else None
+        }
+    )
+
 @app.post("/api/checkups/", response_model=schemas.Checkup)
-def schedule_checkup(checkup: schemas.CheckupCreate, db: Session = Depends(get_db)):
-    """Schedule a medical checkup"""
-    return crud.create_checkup(db=db, checkup=checkup)
+def schedule_checkup(checkup: schemas.CheckupCreate, allow_overlap: bool = False, db: Session = Depends(get_db)):
+    """Schedule a medical checkup (rejected if the doctor, location or resident is already booked)"""
+    db_checkup, conflicts = crud.create_checkup(db=db, checkup=checkup, allow_overlap=allow_overlap)
+    if db_checkup is None:
+        raise checkup_conflict_error(db, checkup, conflicts)
+    return db_checkup
+
+@app.get("/api/checkups/follow-ups", response_model=schemas.FollowUpWorklist)
+def get_follow_up_worklist(
+    scope: str = Query("all", pattern="^(overdue|due_soon|all)$"),
+    days: int = Query(7, ge=0),
+    skip: int = 0,
+    limit: int = Query(50, ge=1, le=500),
+    db: Session = Depends(get_read_db)
+):
+    """Get open follow-ups, overdue first, then those due within `days`"""
+    return crud.get_follow_up_worklist(db, scope=scope, due_within_days=days, skip=skip, limit=limit)
+
+@app.post("/api/checkups/{checkup_id}/follow-up", response_model=schemas.Checkup)
+def complete_follow_up(checkup_id: int, completion: schemas.FollowUpCompletion, allow_overlap: bool = False, db: Session = Depends(get_db)):
+    """Close a follow-up by linking an existing checkup or booking a new one"""
+    original = crud.get_checkup(db, checkup_id=checkup_id)
+    if original is None:
+        raise HTTPException(status_code=404, detail="Checkup not found")
+    if not original.follow_up_required:
+        raise HTTPException(status_code=400, detail="Checkup has no follow-up to complete")
+    if original.follow_up_checkup_id is not None:
+        raise HTTPException(status_code=409, detail="Follow-up already completed")
+    if (completion.follow_up_checkup_id is None) == (completion.checkup is None):
+        raise HTTPException(status_code=400, detail="Provide either follow_up_checkup_id or checkup")
+
+    if completion.checkup is not None:
+        if completion.checkup.resident_id != original.resident_id:
+            raise HTTPException(status_code=400, detail="Follow-up must be for the same resident")
+        if completion.checkup.scheduled_date <= original.scheduled_date:
+            raise HTTPException(status_code=400, detail="Follow-up must be scheduled after the original checkup")
+        # Booked and linked in one transaction: a lost race books nothing
+        follow_up, conflicts = crud.create_checkup(
+            db=db, checkup=completion.checkup, allow_overlap=allow_overlap, follow_up_of=checkup_id
+        )
+        if follow_up is None:
+            if conflicts is None:
+                raise HTTPException(status_code=409, detail="Follow-up already completed")
+            raise checkup_conflict_error(db, completion.checkup, conflicts)
+        return follow_up
+
+    follow_up = crud.get_checkup(db, checkup_id=completion.follow_up_checkup_id)
+    if follow_up is None:
+        raise HTTPException(status_code=404, detail="Follow-up checkup not found")
+    if follow_up.id == original.id or follow_up.resident_id != original.resident_id:
+        raise HTTPException(status_code=400, detail="Follow-up must be another checkup for the same resident")
+    if follow_up.scheduled_date <= original.scheduled_date:
+        raise HTTPException(status_code=400, detail="Follow-up must be scheduled after the original checkup")
+    if not crud.link_follow_up(db, checkup_id=checkup_id, follow_up_checkup_id=follow_up.id):
+        raise HTTPException(status_code=409, detail="Follow-up already completed")
+    return follow_up
+
+@app.get("/api/checkups/conflicts", response_model=List[schemas.CheckupSlotConflict])
+def get_checkup_conflicts(
+    scheduled_date: datetime,
+    duration_minutes: Optional[int] = Query(None, gt=0),
+    doctor_name: Optional[str] = None,
+    location: Optional[str] = None,
+    resident_id: Optional[int] = None,
+    db: Session = Depends(get_db)
+):
+    """List booked checkups that would overlap a proposed slot"""
+    return crud.get_checkup_conflicts(
+        db, resident_id=resident_id, doctor_name=doctor_name, location=location,
+        scheduled_date=scheduled_date, duration_minutes=duration_minutes
+    )
+
+@app.get("/api/checkups/next-slot", response_model=schemas.CheckupSlot)
+def get_next_checkup_slot(
+    after: Optional[datetime] = None,
+    duration_minutes: int = Query(30, gt=0),
+    doctor_name: Optional[str] = None,
+    location: Optional[str] = None,
+    resident_id: Optional[int] = None,
+    db: Session = Depends(get_db)
+):
+    """Find the earliest free slot within working hours for a doctor, location and/or resident"""
+    starts_at = crud.find_next_checkup_slot(
+        db, after=after or datetime.now(), duration_minutes=duration_minutes,
+        doctor_name=doctor_name, location=location, resident_id=resident_id
+    )
+    if starts_at is None:
+        raise HTTPException(status_code=404, detail="No free slot in the search window")
+    return {"starts_at": starts_at, "ends_at": starts_at + timedelta(minutes=duration_minutes)}
 
 @app.get("/api/checkups/", response_model=List[schemas.Checkup])
-def get_checkups(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+def get_checkups(skip: int = 0, limit: int = 100, db: Session = Depends(get_read_db)):
     """Get all scheduled checkups"""
     return crud.get_checkups(db, skip=skip, limit=limit)
 
 @app.get("/api/checkups/today", response_model=List[schemas.Checkup])
-def get_today_checkups(db: Session = Depends(get_db)):
+@coalesced(model=List[schemas.Checkup], daily=True)
+def get_today_checkups(db: Session = Depends(get_read_db)):
     """Get today's scheduled checkups"""
     return crud.get_today_checkups(db)
 
 @app.get("/api/checkups/resident/{resident_id}", response_model=List[schemas.Checkup])
-def get_resident_checkups(resident_id: int, db: Session = Depends(get_db)):
+def get_resident_checkups(resident_id: int, db: Session = Depends(get_read_db)):
     """Get checkups for a specific resident"""
     return crud.get_resident_checkups(db, resident_id=resident_id)
 
@@ -148,18 +434,87 @@ def get_resident_checkups(resident_id: int, db: Session = Depends(get_db)):
 @app.post("/api/events/", response_model=schemas.Event)
 def create_event(event: schemas.EventCreate, db: Session = Depends(get_db)):
     """Create a new event"""
-    return crud.create_event(db=db, event=event)
+    if event.is_recurring and event.recurrence_pattern:
+        try:
+            parse_rule(event.recurrence_pattern)
+        except InvalidRecurrence as exc:
+            raise HTTPException(status_code=400, detail=str(exc))
+    return crud.create_event(db=db, event=event, horizon_days=jobs.EVENT_OCCURRENCE_WINDOW_DAYS)
 
 @app.get("/api/events/", response_model=List[schemas.Event])
-def get_events(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+def get_events(skip: int = 0, limit: int = 100, db: Session = Depends(get_read_db)):
     """Get all events"""
     return crud.get_events(db, skip=skip, limit=limit)
 
 @app.get("/api/events/upcoming", response_model=List[schemas.Event])
-def get_upcoming_events(days: int = 7, db: Session = Depends(get_db)):
+@cached("events", "participants", model=List[schemas.Event], ttl=300)
+def get_upcoming_events(days: int = 7, db: Session = Depends(get_read_db)):
     """Get upcoming events"""
     return crud.get_upcoming_events(db, days=days)
 
+@app.get("/api/events/calendar", response_model=List[schemas.EventOccurrence])
+def get_event_calendar(start: datetime, end: datetime, db: Session = Depends(get_read_db)):
+    """Get every event occurrence, recurring series included, between two dates"""
+    return crud.get_event_calendar(db, start=start, end=end)
+
+def _get_event_or_404(db: Session, event_id: int):
+    event = crud.get_event(db, event_id=event_id)
+    if event is None:
+        raise HTTPException(status_code=404, detail="Event not found")
+    return event
+
+def _with_seat_counts(db: Session, event, result: dict):
+    db.refresh(event)
+    return {**result, "current_participants": event.current_participants or 0, "max_participants": event.max_participants}
+
+@app.get("/api/events/{event_id}/participants", response_model=List[schemas.EventParticipant])
+def get_event_participants(event_id: int, status: Optional[models.ParticipantStatus] = None, db: Session = Depends(get_db)):
+    """Get registered and waitlisted residents for an event"""
+    _get_event_or_404(db, event_id)
+    return crud.get_event_participants(db, event_id=event_id, status=status)
+
+@app.post("/api/events/{event_id}/participants", response_model=schemas.EventRegistrationResult)
+def register_event_participants(event_id: int, registration: schemas.EventRegistration, db: Session = Depends(get_db)):
+    """Register one or more residents; anyone beyond capacity is waitlisted"""
+    event = _get_event_or_404(db, event_id)
+    if event.status not in (models.EventStatus.PLANNED, models.EventStatus.ONGOING):
+        raise HTTPException(status_code=400, detail=f"Event is {event.status.value}")
+    result = crud.register_participants(db, event_id=event_id, resident_ids=registration.resident_ids)
+    return _with_seat_counts(db, event, result)
+
+@app.post("/api/events/{event_id}/participants/remove", response_model=schemas.EventUnregistrationResult)
+def unregister_event_participants(event_id: int, registration: schemas.EventRegistration, db: Session = Depends(get_db)):
+    """Unregister residents, promoting waitlisted residents into freed seats"""
+    event = _get_event_or_404(db, event_id)
+    result = crud.unregister_participants(db, event_id=event_id, resident_ids=registration.resident_ids)
+    return _with_seat_counts(db, event, result)
+
+@app.delete("/api/events/{event_id}/participants/{resident_id}", response_model=schemas.EventUnregistrationResult)
+def unregister_event_participant(event_id: int, resident_id: int, db: Session = Depends(get_db)):
+    """Unregister a single resident"""
+    event = _get_event_or_404(db, event_id)
+    result = crud.unregister_participants(db, event_id=event_id, resident_ids=[resident_id])
+    if not result["removed"]:
+        raise HTTPException(status_code=404, detail="Resident is not registered for this event")
+    return _with_seat_counts(db, event, result)
+
+# Schedule endpoints
+@app.get("/api/schedule/today", response_model=schemas.TodaySchedule)
+def get_schedule_today(db: Session = Depends(get_db)):
+    """Get today's checkups, events, birthdays and the merged timeline in one call"""
+    return get_today_schedule(db)
+
+@app.get("/api/schedule", response_model=List[schemas.ScheduleItem])
+def get_schedule_range(start: Optional[date] = None, end: Optional[date] = None, db: Session = Depends(get_db)):
+    """Get a time-ordered timeline of checkups, events, birthdays and medication rounds"""
+    start = start or date.today()
+    end = end or start
+    if end < start:
+        raise HTTPException(status_code=400, detail="end must not be before start")
+    if (end - start).days >= MAX_RANGE_DAYS:
+        raise HTTPException(status_code=400, detail=f"Range is limited to {MAX_RANGE_DAYS} days")
+    return get_schedule(db, start=start, end=end)
+
 # Document endpoints
 @app.post("/api/documents/upload")
 async def upload_document(
@@ -204,25 +559,60 @@ async def upload_document(
     }
 
 @app.get("/api/documents/", response_model=List[schemas.Document])
-def get_documents(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+def get_documents(skip: int = 0, limit: int = 100, db: Session = Depends(get_read_db)):
     """Get all documents"""
     return crud.get_documents(db, skip=skip, limit=limit)
 
 @app.get("/api/documents/resident/{resident_id}", response_model=List[schemas.Document])
-def get_resident_documents(resident_id: int, db: Session = Depends(get_db)):
+def get_resident_documents(resident_id: int, db: Session = Depends(get_read_db)):
     """Get documents for a specific resident"""
     return crud.get_resident_documents(db, resident_id=resident_id)
 
 # Bed management endpoints
 @app.get("/api/beds/", response_model=List[schemas.Bed])
-def get_beds(db: Session = Depends(get_db)):
-    """Get all beds"""
-    return crud.get_beds(db)
+@cached("beds", model=List[schemas.Bed])
+def get_beds(amenity: Optional[List[str]] = Query(None), db: Session = Depends(get_read_db)):
+    """Get all beds, optionally only those with every given amenity"""
+    return crud.get_beds(db, amenities=amenity)
+
+@app.get("/api/beds/occupancy", response_model=schemas.BedOccupancySummary)
+def get_bed_occupancy(floor: Optional[int] = None, include_rooms: bool = True, db: Session = Depends(get_read_db)):
+    """Get bed occupancy counts, rates and revenue per floor and room"""
+    return crud.get_bed_occupancy_summary(db, floor=floor, include_rooms=include_rooms)
+
+@app.get("/api/beds/recommend", response_model=List[schemas.BedRecommendation])
+def recommend_beds(
+    floor: Optional[int] = None,
+    bed_type: Optional[str] = None,
+    amenity: Optional[List[str]] = Query(None),
+    min_rate: Optional[float] = None,
+    max_rate: Optional[float] = None,
+    gender: Optional[str] = None,
+    limit: int = 10,
+    db: Session = Depends(get_db)
+):
+    """Rank vacant beds by floor, type, amenities, rate range and roommate gender"""
+    return crud.recommend_beds(
+        db,
+        floor=floor,
+        bed_type=bed_type,
+        amenities=amenity,
+        min_rate=min_rate,
+        max_rate=max_rate,
+        gender=gender,
+        limit=limit
+    )
 
 @app.get("/api/beds/vacant", response_model=List[schemas.Bed])
-def get_vacant_beds(db: Session = Depends(get_db)):
-    """Get vacant beds"""
-    return crud.get_vacant_beds(db)
+def get_vacant_beds(amenity: Optional[List[str]] = Query(None), db: Session = Depends(get_db)):
+    """Get vacant beds, optionally only those with every given amenity"""
+    return crud.get_vacant_beds(db, amenities=amenity)
+
+@app.get("/api/amenities/", response_model=List[schemas.Amenity])
+@cached("beds", model=List[schemas.Amenity])
+def get_amenities(db: Session = Depends(get_read_db)):
+    """Get all known bed amenities"""
+    return crud.get_amenities(db)
 
 @app.post("/api/beds/", response_model=schemas.Bed)
 def create_bed(bed: schemas.BedCreate, db: Session = Depends(get_db)):
@@ -245,6 +635,272 @@ def release_bed(bed_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Bed not found")
     return {"message": "Bed released successfully"}
 
+# Visitor endpoints
+@app.post("/api/visitors/", response_model=schemas.Visitor)
+def create_visitor(visitor: schemas.VisitorCreate, db: Session = Depends(get_db)):
+    """Register an expected visit"""
+    if crud.get_resident(db, resident_id=visitor.resident_id) is None:
+        raise HTTPException(status_code=404, detail="Resident not found")
+    return crud.create_visitor(db=db, visitor=visitor)
+
+@app.get("/api/visitors/", response_model=List[schemas.Visitor])
+def get_visitors(skip: int = 0, limit: int = 100, db: Session = Depends(get_read_db)):
+    """Get all visits"""
+    return crud.get_visitors(db, skip=skip, limit=limit)
+
+def _decode_visit_cursor(cursor: str):
+    visit_date, _, visit_id = cursor.rpartition("|")
+    try:
+        return datetime.fromisoformat(visit_date), int(visit_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+@app.get("/api/visitors/history", response_model=schemas.VisitorPage)
+def get_visit_history(
+    resident_id: Optional[int] = None,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=500),
+    include_archive: bool = False,
+    db: Session = Depends(get_read_db)
+):
+    """Page through visits newest first; include_archive also reads archived months"""
+    items, next_key = crud.get_visit_history(
+        db,
+        resident_id=resident_id,
+        start=datetime.combine(start, datetime.min.time()) if start else None,
+        end=datetime.combine(end + timedelta(days=1), datetime.min.time()) if end else None,
+        before=_decode_visit_cursor(cursor) if cursor else None,
+        limit=limit,
+        include_archive=include_archive
+    )
+    next_cursor = f"{next_key[0].isoformat()}|{next_key[1]}" if next_key else None
+    return {"items": items, "next_cursor": next_cursor}
+
+@app.get("/api/visitors/on-site", response_model=schemas.OnSiteVisitors)
+def get_on_site_visitors(resident_id: Optional[int] = None, db: Session = Depends(get_db)):
+    """Get everyone checked in and not yet checked out (the fire roll)"""
+    visitors = crud.get_on_site_visitors(db, resident_id=resident_id)
+    return {"count": len(visitors), "visitors": visitors}
+
+@app.post("/api/visitors/check-in", response_model=schemas.Visitor)
+def check_in_visitor(visitor: schemas.VisitorCheckIn, db: Session = Depends(get_db)):
+    """Check in a walk-in visitor"""
+    if crud.get_resident(db, resident_id=visitor.resident_id) is None:
+        raise HTTPException(status_code=404, detail="Resident not found")
+    return crud.check_in_visitor(db=db, visitor=visitor)
+
+@app.post("/api/visitors/{visitor_id}/check-in", response_model=schemas.Visitor)
+def check_in_expected_visitor(visitor_id: int, db: Session = Depends(get_db)):
+    """Check in a visitor whose visit was registered in advance"""
+    visitor = crud.check_in_expected_visitor(db, visitor_id=visitor_id)
+    if visitor is None:
+        if crud.get_visitor(db, visitor_id=visitor_id) is None:
+            raise HTTPException(status_code=404, detail="Visit not found")
+        raise HTTPException(status_code=409, detail="Visitor already checked in")
+    return visitor
+
+@app.post("/api/visitors/{visitor_id}/check-out", response_model=schemas.Visitor)
+def check_out_visitor(visitor_id: int, db: Session = Depends(get_db)):
+    """Check a visitor out"""
+    visitor = crud.check_out_visitor(db, visitor_id=visitor_id)
+    if visitor is None:
+        if crud.get_visitor(db, visitor_id=visitor_id) is None:
+            raise HTTPException(status_code=404, detail="Visit not found")
+        raise HTTPException(status_code=409, detail="Visitor is not checked in")
+    return visitor
+
+@app.get("/api/visitors/resident/{resident_id}", response_model=List[schemas.Visitor])
+def get_resident_visitors(resident_id: int, skip: int = 0, limit: int = 100, db: Session = Depends(get_read_db)):
+    """Get a resident's visit history, most recent first"""
+    return crud.get_resident_visitors(db, resident_id=resident_id, skip=skip, limit=limit)
+
+# Staff endpoints
+@app.post("/api/staff/", response_model=schemas.Staff)
+def create_staff(staff: schemas.StaffCreate, db: Session = Depends(get_db)):
+    """Add a staff member"""
+    if crud.get_staff_by_email(db, email=staff.email):
+        raise HTTPException(status_code=400, detail="Email already registered")
+    db_staff = crud.create_staff(db=db, staff=staff)
+    if db_staff is None:
+        raise HTTPException(status_code=400, detail="Email already registered")
+    return db_staff
+
+@app.get("/api/staff/", response_model=List[schemas.Staff])
+def get_staff(skip: int = 0, limit: int = 100, role: Optional[str] = None, db: Session = Depends(get_read_db)):
+    """Get active staff, optionally by role"""
+    return crud.get_staff(db, skip=skip, limit=limit, role=role)
+
+@app.get("/api/staff/{staff_id}", response_model=schemas.Staff)
+def get_staff_member(staff_id: int, db: Session = Depends(get_db)):
+    """Get a staff member"""
+    staff = crud.get_staff_member(db, staff_id=staff_id)
+    if staff is None:
+        raise HTTPException(status_code=404, detail="Staff member not found")
+    return staff
+
+# Roster endpoints
+def roster_range(start: Optional[date], end: Optional[date]):
+    start = start or date.today()
+    end = end or start + timedelta(days=6)
+    if end < start:
+        raise HTTPException(status_code=400, detail="end must not be before start")
+    if (end - start).days >= ROSTER_MAX_RANGE_DAYS:
+        raise HTTPException(status_code=400, detail=f"Range is limited to {ROSTER_MAX_RANGE_DAYS} days")
+    return start, end
+
+@app.post("/api/roster/assignments", response_model=List[schemas.ShiftAssignment])
+def create_shift_assignments(batch: schemas.ShiftAssignmentBatch, db: Session = Depends(get_db)):
+    """Assign staff to shifts; the whole batch is rejected if anyone is already rostered for a shift"""
+    staff_ids = {assignment.staff_id for assignment in batch.assignments}
+    found = {staff.id for staff in crud.get_staff(db, limit=len(staff_ids), ids=staff_ids)}
+    missing = staff_ids - found
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Active staff not found: {sorted(missing)}")
+    assignments, conflicts = crud.create_shift_assignments(db, assignments=batch.assignments)
+    if conflicts:
+        raise HTTPException(status_code=409, detail={
+            "message": "Staff already rostered for these shifts",
+            "conflicts": [
+                {"staff_id": staff_id, "shift_date": shift_date.isoformat(), "shift": shift}
+                for staff_id, shift_date, shift in conflicts
+            ],
+        })
+    return assignments
+
+@app.get("/api/roster/assignments", response_model=List[schemas.ShiftAssignment])
+def get_shift_assignments(
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    staff_id: Optional[int] = None,
+    floor: Optional[int] = None,
+    db: Session = Depends(get_read_db)
+):
+    """Get shift assignments in a date range (defaults to the next 7 days)"""
+    start, end = roster_range(start, end)
+    return crud.get_shift_assignments(db, start=start, end=end, staff_id=staff_id, floor=floor)
+
+@app.delete("/api/roster/assignments/{assignment_id}")
+def delete_shift_assignment(assignment_id: int, db: Session = Depends(get_db)):
+    """Remove a shift assignment"""
+    if not crud.delete_shift_assignment(db, assignment_id=assignment_id):
+        raise HTTPException(status_code=404, detail="Shift assignment not found")
+    return {"message": "Shift assignment removed"}
+
+@app.get("/api/roster/coverage", response_model=schemas.RosterCoverage)
+def get_roster_coverage(start: Optional[date] = None, end: Optional[date] = None, db: Session = Depends(get_read_db)):
+    """Get the staffing matrix per day, shift, floor and role against resident-ratio requirements, with gaps"""
+    start, end = roster_range(start, end)
+    return get_coverage(db, start=start, end=end)
+
+@app.get("/api/roster/gaps", response_model=List[schemas.CoverageGap])
+def get_roster_gaps(start: Optional[date] = None, end: Optional[date] = None, db: Session = Depends(get_read_db)):
+    """Get understaffed shifts in a date range"""
+    start, end = roster_range(start, end)
+    return get_coverage(db, start=start, end=end).gaps
+
+# Billing endpoints
+@app.post("/api/billing/", response_model=schemas.Billing)
+def create_billing(billing: schemas.BillingCreate, db: Session = Depends(get_db)):
+    """Create a single invoice"""
+    return crud.create_billing(db=db, billing=billing)
+
+@app.get("/api/billing/", response_model=List[schemas.Billing])
+def get_billing(skip: int = 0, limit: int = 100, billing_run_id: Optional[int] = None, db: Session = Depends(get_read_db)):
+    """Get invoices, optionally only those generated by one billing run"""
+    return crud.get_billing(db, skip=skip, limit=limit, billing_run_id=billing_run_id)
+
+@app.get("/api/billing/totals", response_model=List[schemas.BillingTotals])
+def get_billing_totals(resident_id: Optional[int] = None, db: Session = Depends(get_read_db)):
+    """Get billed, paid and outstanding totals per resident"""
+    return crud.get_billing_totals(db, resident_id=resident_id)
+
+@app.get("/api/billing/ageing", response_model=schemas.AgeingReport)
+def get_ageing_report(
+    include_residents: bool = False,
+    skip: int = 0,
+    limit: int = Query(100, ge=1, le=1000),
+    db: Session = Depends(get_read_db)
+):
+    """Get outstanding receivables by days past due, from the ledger refreshed nightly"""
+    return crud.get_ageing_report(db, include_residents=include_residents, skip=skip, limit=limit)
+
+@app.post("/api/billing/{billing_id}/payments", response_model=schemas.Payment)
+def record_payment(billing_id: int, payment: schemas.PaymentCreate, db: Session = Depends(get_db)):
+    """Record a payment against an invoice"""
+    invoice = crud.get_invoice(db, billing_id=billing_id)
+    if invoice is None:
+        raise HTTPException(status_code=404, detail="Invoice not found")
+    if payment.amount > invoice.balance:
+        raise HTTPException(status_code=400, detail=f"Payment exceeds the outstanding balance of {invoice.balance}")
+    db_payment = crud.record_payment(db, invoice=invoice, payment=payment)
+    if db_payment is None:
+        raise HTTPException(status_code=409, detail="Invoice balance changed; payment not applied")
+    return db_payment
+
+@app.get("/api/billing/{billing_id}/payments", response_model=List[schemas.Payment])
+def get_invoice_payments(billing_id: int, db: Session = Depends(get_db)):
+    """Get payments recorded against an invoice"""
+    if crud.get_invoice(db, billing_id=billing_id) is None:
+        raise HTTPException(status_code=404, detail="Invoice not found")
+    return crud.get_invoice_payments(db, billing_id=billing_id)
+
+@app.get("/api/billing/resident/{resident_id}", response_model=List[schemas.Billing])
+def get_resident_billing(resident_id: int, db: Session = Depends(get_read_db)):
+    """Get a resident's invoices"""
+    return crud.get_resident_billing(db, resident_id=resident_id)
+
+@app.post("/api/billing/runs", response_model=schemas.BillingRun)
+def create_billing_run(period: schemas.BillingRunCreate, db: Session = Depends(get_db)):
+    """Generate invoices for every active resident for a period (re-running only bills new residents)"""
+    period_start, period_end = period.period_start, period.period_end
+    if period_end is None:
+        period_start, period_end = month_period(period_start)
+    if period_end < period_start:
+        raise HTTPException(status_code=400, detail="period_end must not be before period_start")
+    try:
+        return run_billing(db, period_start=period_start, period_end=period_end)
+    except BillingRunInProgress as exc:
+        raise HTTPException(status_code=409, detail=str(exc))
+
+@app.get("/api/billing/runs", response_model=List[schemas.BillingRun])
+def get_billing_runs(limit: int = 24, db: Session = Depends(get_read_db)):
+    """Get recent billing runs"""
+    return crud.get_billing_runs(db, limit=limit)
+
+# Cache endpoints
+@app.get("/api/cache/stats")
+def get_cache_stats():
+    """Get response cache hit/miss counters, overall and per route"""
+    return response_cache.stats()
+
+# Background job endpoints
+@app.get("/api/jobs/runs", response_model=List[schemas.JobRun])
+def get_job_runs(job_name: Optional[str] = None, limit: int = 50, db: Session = Depends(get_read_db)):
+    """Get recent background job runs with their metrics"""
+    return crud.get_job_runs(db, job_name=job_name, limit=limit)
+
+# Sync endpoints
+@app.get("/api/sync", response_model=schemas.SyncPage)
+def get_sync_changes(since: int = Query(0, ge=0), limit: int = Query(1000, ge=1, le=sync.MAX_PAGE_SIZE),
+                     db: Session = Depends(get_read_db)):
+    """Rows changed after sequence number `since`: latest state per row, or a tombstone if deleted"""
+    return sync.get_changes(db, since=since, limit=limit)
+
+# Audit endpoints
+@app.get("/api/audit", response_model=List[schemas.AuditEntry])
+def get_audit_log(table_name: Optional[str] = None, row_id: Optional[str] = None, actor_id: Optional[int] = None,
+                  since: Optional[datetime] = None, limit: int = Query(100, le=1000), db: Session = Depends(get_read_db),
+                  current_user: models.Staff = Depends(require_admin)):
+    """Get audited changes, newest first, filtered by table, row or actor"""
+    return crud.get_audit_log(db, table_name=table_name, row_id=row_id, actor_id=actor_id, since=since, limit=limit)
+
+@app.get("/api/audit/stats")
+def get_audit_stats(current_user: models.Staff = Depends(require_admin)):
+    """Get the audit writer's queue depth and written/dropped/failed counts"""
+    return audit_log.stats()
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,244 @@
+"""
+Medication schedule engine.
+
+Free-text ``Medication.frequency`` values ("twice daily", "every 8 hours",
+"at bedtime") are parsed into a structured ``Recurrence`` and active
+courses are expanded into a daily Medication Administration Record (MAR).
+
+Expansion is vectorised with pandas over one frame of active courses, and
+each day's MAR is cached until a medication, resident or bed changes.
+"""
+import re
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import date, datetime, time
+from functools import lru_cache
+from typing import Optional, Tuple
+
+import pandas as pd
+from sqlalchemy.orm import Session
+
+from app import models
+from app.events import subscribe
+from app.tenancy import FacilityLocal
+
+MORNING = time(8, 0)
+MIDDAY = time(14, 0)
+EVENING = time(20, 0)
+BEDTIME = time(21, 0)
+
+CACHED_DAYS = 31
+
+
+@dataclass(frozen=True)
+class Recurrence:
+    times: Tuple[time, ...]
+    interval_days: int = 1
+    as_needed: bool = False
+    recognised: bool = True
+
+
+_FIXED_FREQUENCIES = {
+    ("once daily", "daily", "od", "qd", "every day", "once a day", "1 time daily", "once"): (MORNING,),
+    ("twice daily", "bid", "bd", "twice a day", "two times daily", "2 times daily", "every 12 hours"): (MORNING, EVENING),
+    ("three times daily", "tid", "tds", "thrice daily", "three times a day", "3 times daily"): (MORNING, MIDDAY, EVENING),
+    ("four times daily", "qid", "qds", "four times a day", "4 times daily"): (MORNING, time(12, 0), time(16, 0), EVENING),
+    ("at bedtime", "bedtime", "nightly", "every night", "hs", "at night"): (BEDTIME,),
+    ("every morning", "morning", "in the morning", "om"): (MORNING,),
+    ("every evening", "evening", "in the evening"): (time(18, 0),),
+}
+_FREQUENCY_TIMES = {alias: times for aliases, times in _FIXED_FREQUENCIES.items() for alias in aliases}
+
+_AS_NEEDED = {"as needed", "prn", "when required", "as required", "sos"}
+_INTERVAL_DAYS = {"weekly": 7, "once a week": 7, "every week": 7, "every other day": 2, "alternate days": 2}
+
+_EVERY_HOURS = re.compile(r"^(?:every|q)\s*(\d+)\s*(?:h|hr|hrs|hours?)$")
+_EVERY_DAYS = re.compile(r"^every\s*(\d+)\s*days?$")
+_TIMES_DAILY = re.compile(r"^(\d+)\s*(?:x|times)\s*(?:daily|a day|per day)$")
+
+
+def _spread(doses: int) -> Tuple[time, ...]:
+    # Spread n doses evenly across the 08:00-20:00 waking window
+    if doses <= 1:
+        return (MORNING,)
+    step = 12 * 60 // (doses - 1)
+    return tuple(time(*divmod(8 * 60 + step * index, 60)) for index in range(doses))
+
+
+@lru_cache(maxsize=512)
+def parse_frequency(frequency: str, instructions: Optional[str] = None) -> Recurrence:
+    """Parse a free-text frequency into a ``Recurrence``.
+
+    Unrecognised text is scheduled once in the morning round and flagged
+    with ``recognised=False`` so staff can correct the prescription.
+    """
+    text = " ".join((frequency or "").lower().replace(".", "").split())
+    hint = (instructions or "").lower()
+
+    if text in _AS_NEEDED:
+        return Recurrence(times=(), as_needed=True)
+    if text in _INTERVAL_DAYS:
+        return Recurrence(times=(BEDTIME,) if "bedtime" in hint else (MORNING,), interval_days=_INTERVAL_DAYS[text])
+    if text in _FREQUENCY_TIMES:
+        times = _FREQUENCY_TIMES[text]
+        if len(times) == 1 and "bedtime" in hint:
+            times = (BEDTIME,)
+        return Recurrence(times=times)
+
+    match = _EVERY_HOURS.match(text)
+    if match and 0 < int(match.group(1)) <= 24:
+        hours = int(match.group(1))
+        return Recurrence(times=tuple(sorted(time((6 + hours * index) % 24, 0) for index in range(24 // hours))))
+    match = _EVERY_DAYS.match(text)
+    if match and int(match.group(1)) > 0:
+        return Recurrence(times=(MORNING,), interval_days=int(match.group(1)))
+    match = _TIMES_DAILY.match(text)
+    if match and int(match.group(1)) > 0:
+        return Recurrence(times=_spread(int(match.group(1))))
+
+    return Recurrence(times=(MORNING,), recognised=False)
+
+
+ROUNDS = ("night", "morning", "midday", "evening", "night")
+ROUND_BOUNDARIES = (0, 5 * 60, 11 * 60, 16 * 60, 21 * 60, 24 * 60)
+
+
+def round_for(dose_time: time) -> str:
+    minutes = dose_time.hour * 60 + dose_time.minute
+    for name, upper in zip(ROUNDS, ROUND_BOUNDARIES[1:]):
+        if minutes < upper:
+            return name
+    return ROUNDS[-1]
+
+
+def _minutes(times: Tuple[time, ...]) -> Tuple[int, ...]:
+    return tuple(dose_time.hour * 60 + dose_time.minute for dose_time in times)
+
+
+def _records(frame: pd.DataFrame, columns):
+    # Column-wise conversion to plain Python values (NaN -> None), much cheaper than to_dict("records")
+    values = []
+    for column in columns:
+        series = frame[column]
+        if column == "scheduled_at":
+            values.append([value.to_pydatetime() for value in series.tolist()])
+        else:
+            values.append(series.astype(object).where(series.notna(), None).tolist())
+    return [dict(zip(columns, row)) for row in zip(*values)]
+
+
+class MARCache:
+    def __init__(self, max_days: int = CACHED_DAYS):
+        self._lock = threading.Lock()
+        self._max_days = max_days
+        self._courses = None
+        self._days = OrderedDict()
+        self._generation = 0
+
+    def invalidate(self, **_):
+        with self._lock:
+            self._generation += 1
+            self._courses = None
+            self._days.clear()
+
+    def _load_courses(self, db: Session) -> pd.DataFrame:
+        rows = db.query(
+            models.Medication.id,
+            models.Medication.resident_id,
+            models.Medication.medication_name,
+            models.Medication.dosage,
+            models.Medication.frequency,
+            models.Medication.instructions,
+            models.Medication.start_date,
+            models.Medication.end_date,
+            models.Resident.name,
+            models.Resident.room_number,
+            models.Bed.floor,
+        ).join(
+            models.Resident, models.Resident.id == models.Medication.resident_id
+        ).outerjoin(
+            models.Bed, models.Bed.id == models.Resident.bed_id
+        ).filter(
+            models.Medication.is_active == True,
+            models.Resident.status == models.ResidentStatus.ACTIVE
+        ).all()
+
+        courses = pd.DataFrame(rows, columns=[
+            "medication_id", "resident_id", "medication_name", "dosage", "frequency", "instructions",
+            "start_date", "end_date", "resident_name", "room_number", "floor",
+        ])
+        recurrences = [parse_frequency(row.frequency, row.instructions) for row in courses.itertuples()]
+        courses["interval_days"] = [recurrence.interval_days for recurrence in recurrences]
+        courses["as_needed"] = [recurrence.as_needed for recurrence in recurrences]
+        courses["recognised"] = [recurrence.recognised for recurrence in recurrences]
+        courses["dose_minute"] = [_minutes(recurrence.times) for recurrence in recurrences]
+        courses["start_date"] = pd.to_datetime(courses["start_date"])
+        courses["end_date"] = pd.to_datetime(courses["end_date"])
+        return courses
+
+    def _expand(self, courses: pd.DataFrame, day: date):
+        day_ts = pd.Timestamp(day)
+        elapsed = (day_ts - courses["start_date"]).dt.days
+        due = (
+            (elapsed >= 0)
+            & (courses["end_date"].isna() | (courses["end_date"] >= day_ts))
+            & (elapsed % courses["interval_days"] == 0)
+        )
+        today = courses[due]
+        if today.empty:
+            # Nothing due (or no active courses at all, e.g. a new facility): explode needs rows
+            return [], []
+
+        as_needed = today[today["as_needed"]]
+        doses = today[~today["as_needed"]].explode("dose_minute")
+        minutes = doses["dose_minute"].astype("int64")
+        doses = doses.assign(
+            scheduled_at=day_ts + pd.to_timedelta(minutes, unit="m"),
+            round=pd.cut(minutes, ROUND_BOUNDARIES, right=False, labels=ROUNDS, ordered=False).astype(str),
+        ).sort_values(["scheduled_at", "floor", "room_number", "resident_name"], na_position="last")
+
+        columns = [
+            "medication_id", "resident_id", "resident_name", "room_number", "floor",
+            "medication_name", "dosage", "instructions", "recognised",
+        ]
+        return _records(doses, columns + ["scheduled_at", "round"]), _records(as_needed, columns)
+
+    def get_day(self, db: Session, day: date):
+        with self._lock:
+            cached = self._days.get(day)
+            if cached is not None:
+                self._days.move_to_end(day)
+                return cached
+            courses = self._courses
+            generation = self._generation
+
+        if courses is None:
+            courses = self._load_courses(db)
+        expanded = self._expand(courses, day)
+
+        with self._lock:
+            # Don't cache an expansion built from data invalidated meanwhile
+            if generation != self._generation:
+                return expanded
+            self._courses = courses
+            self._days[day] = expanded
+            while len(self._days) > self._max_days:
+                self._days.popitem(last=False)
+        return expanded
+
+
+mar_cache = FacilityLocal(MARCache)
+
+for _topic in ("medications", "residents", "beds"):
+    subscribe(_topic)(mar_cache.invalidate)
+
+
+def get_daily_mar(db: Session, day: date, floor: Optional[int] = None, round_name: Optional[str] = None):
+    scheduled, as_needed = mar_cache.get_day(db, day)
+    if floor is not None:
+        scheduled = [dose for dose in scheduled if dose["floor"] == floor]
+        as_needed = [dose for dose in as_needed if dose["floor"] == floor]
+    if round_name:
+        scheduled = [dose for dose in scheduled if dose["round"] == round_name]
+    return {"day": day, "floor": floor, "doses": scheduled, "as_needed": as_needed}
@@ -1,7 +1,10 @@
-from sqlalchemy import Column, Integer, String, DateTime, Date, Boolean, Text, ForeignKey, Enum, Float
+from sqlalchemy import Column, Integer, String, DateTime, Date, Boolean, Text, ForeignKey, Enum, Float, Table, Index, UniqueConstraint, and_, text
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.database import Base
+from app.money import Cents
+from app.tenancy import FacilityScoped, current_facility_id
+from app.soft_delete import SoftDeletable
 import enum
 
 class ResidentStatus(enum.Enum):
@@ -26,13 +29,20 @@ class EventStatus(enum.Enum):
     COMPLETED = "completed"
     CANCELLED = "cancelled"
 
-class Resident(Base):
+class ParticipantStatus(enum.Enum):
+    REGISTERED = "registered"
+    WAITLISTED = "waitlisted"
+
+class Resident(FacilityScoped, SoftDeletable, Base):
     __tablename__ = "residents"
 
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String(100), nullable=False, index=True)
+    # Derived from date_of_birth on write and kept current by the nightly resident_ages job
     age = Column(Integer, nullable=False)
     date_of_birth = Column(Date, nullable=False)
+    birth_month = Column(Integer)
+    birth_day = Column(Integer)
     gender = Column(String(10), nullable=False)
     phone = Column(String(20))
     emergency_contact = Column(String(100))
@@ -47,6 +57,8 @@ class Resident(Base):
     notes = Column(Text)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    # Set by the resident_archive job once a deleted resident's records have been moved to the archive
+    archived_at = Column(DateTime)
 
     # Relationships
     bed = relationship("Bed", back_populates="resident")
@@ -54,24 +66,110 @@ class Resident(Base):
     checkups = relationship("Checkup", back_populates="resident")
     documents = relationship("Document", back_populates="resident")
 
-class Bed(Base):
+    __table_args__ = (
+        # Partial indexes: hot reads only ever see live residents (soft_delete adds deleted_at IS NULL)
+        Index(
+            "ix_residents_live_status",
+            "status",
+            sqlite_where=text("deleted_at IS NULL"),
+            postgresql_where=text("deleted_at IS NULL"),
+        ),
+        Index(
+            "ix_residents_live_created_at",
+            "created_at",
+            sqlite_where=text("deleted_at IS NULL"),
+            postgresql_where=text("deleted_at IS NULL"),
+        ),
+        # Deleted residents the archive job hasn't finished with
+        Index(
+            "ix_residents_pending_archive",
+            "deleted_at",
+            sqlite_where=text("deleted_at IS NOT NULL AND archived_at IS NULL"),
+            postgresql_where=text("deleted_at IS NOT NULL AND archived_at IS NULL"),
+        ),
+        # Birthday lookups: today's/upcoming birthdays and the nightly age refresh
+        Index(
+            "ix_residents_live_birthday",
+            "birth_month",
+            "birth_day",
+            sqlite_where=text("deleted_at IS NULL"),
+            postgresql_where=text("deleted_at IS NULL"),
+        ),
+    )
+
+class Bed(FacilityScoped, Base):
     __tablename__ = "beds"
 
     id = Column(Integer, primary_key=True, index=True)
-    bed_number = Column(String(10), unique=True, nullable=False, index=True)
+    bed_number = Column(String(10), nullable=False, index=True)
     room_number = Column(String(10), nullable=False)
     floor = Column(Integer, nullable=False)
     bed_type = Column(String(50))  # single, shared, etc.
     status = Column(Enum(BedStatus), default=BedStatus.VACANT)
-    monthly_rate = Column(Float)
-    amenities = Column(Text)  # JSON string of amenities
+    monthly_rate = Column(Cents)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
     # Relationships
     resident = relationship("Resident", back_populates="bed", uselist=False)
+    amenities = relationship("Amenity", secondary="bed_amenities", back_populates="beds", lazy="selectin")
+
+    __table_args__ = (
+        # Bed numbers are unique within a facility
+        Index("uq_beds_facility_bed_number", "facility_id", "bed_number", unique=True),
+    )
+
+bed_amenities = Table(
+    "bed_amenities",
+    Base.metadata,
+    Column("bed_id", Integer, ForeignKey("beds.id", ondelete="CASCADE"), primary_key=True),
+    Column("amenity_id", Integer, ForeignKey("amenities.id", ondelete="CASCADE"), primary_key=True),
+    # Amenity-first index so "beds with amenity X" is an index range scan
+    Index("ix_bed_amenities_amenity_bed", "amenity_id", "bed_id"),
+)
+
+class Amenity(Base):
+    __tablename__ = "amenities"
+
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String(50), nullable=False)  # display label, e.g. "Private Bathroom"
+    slug = Column(String(50), unique=True, nullable=False, index=True)  # normalised lookup key
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    # Relationships
+    beds = relationship("Bed", secondary="bed_amenities", back_populates="amenities")
+
+    @staticmethod
+    def slug_for(name: str) -> str:
+        return " ".join(name.split()).lower()
+
+class BedOccupancyRollup(FacilityScoped, Base):
+    __tablename__ = "bed_occupancy_rollups"
+
+    # One row per room, kept in step with bed status changes by crud so the
+    # occupancy map never has to scan the beds table.
+    facility_id = Column(Integer, primary_key=True, default=current_facility_id)
+    floor = Column(Integer, primary_key=True)
+    room_number = Column(String(10), primary_key=True)
+    total_beds = Column(Integer, nullable=False, default=0)
+    occupied_beds = Column(Integer, nullable=False, default=0)
+    vacant_beds = Column(Integer, nullable=False, default=0)
+    maintenance_beds = Column(Integer, nullable=False, default=0)
+    occupied_revenue = Column(Cents, nullable=False, default=0)
+    potential_revenue = Column(Cents, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class ResidentAgeBand(FacilityScoped, Base):
+    __tablename__ = "resident_age_bands"
 
-class Medication(Base):
+    # Active residents per ten-year age band, kept in step with resident writes and
+    # birthdays so staffing-ratio reports never scan the residents table.
+    facility_id = Column(Integer, primary_key=True, default=current_facility_id)
+    band = Column(Integer, primary_key=True)  # lowest age in the band: 60, 70, 80, ...
+    residents = Column(Integer, nullable=False, default=0)
+    as_of = Column(Date, nullable=False)  # ages are current as of this day
+
+class Medication(FacilityScoped, Base):
     __tablename__ = "medications"
 
     id = Column(Integer, primary_key=True, index=True)
@@ -90,13 +188,25 @@ class Medication(Base):
     # Relationships
     resident = relationship("Resident", back_populates="medications")
 
-class Checkup(Base):
+    __table_args__ = (
+        # Partial index: hot lookups only ever touch the active courses
+        Index(
+            "ix_medications_active_resident",
+            "resident_id",
+            "end_date",
+            sqlite_where=is_active == True,
+            postgresql_where=is_active == True,
+        ),
+    )
+
+class Checkup(FacilityScoped, Base):
     __tablename__ = "checkups"
 
     id = Column(Integer, primary_key=True, index=True)
     resident_id = Column(Integer, ForeignKey("residents.id"), nullable=False)
     checkup_type = Column(String(50), nullable=False)  # routine, emergency, specialist
     scheduled_date = Column(DateTime, nullable=False)
+    duration_minutes = Column(Integer, default=30)
     doctor_name = Column(String(100))
     location = Column(String(100))  # clinic, hospital, on-site
     status = Column(Enum(CheckupStatus), default=CheckupStatus.SCHEDULED)
@@ -104,13 +214,26 @@ class Checkup(Base):
     results = Column(Text)
     follow_up_required = Column(Boolean, default=False)
     follow_up_date = Column(Date)
+    follow_up_checkup_id = Column(Integer, ForeignKey("checkups.id"))  # set once the follow-up is booked
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
     # Relationships
     resident = relationship("Resident", back_populates="checkups")
+    follow_up_checkup = relationship("Checkup", remote_side=[id])
 
-class Event(Base):
+    __table_args__ = (
+        # Partial index: the follow-up worklist only ever reads open follow-ups
+        Index(
+            "ix_checkups_open_follow_up",
+            "follow_up_date",
+            "id",
+            sqlite_where=and_(follow_up_required == True, follow_up_checkup_id == None),
+            postgresql_where=and_(follow_up_required == True, follow_up_checkup_id == None),
+        ),
+    )
+
+class Event(FacilityScoped, Base):
     __tablename__ = "events"
 
     id = Column(Integer, primary_key=True, index=True)
@@ -129,7 +252,50 @@ class Event(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
-class Document(Base):
+    # Relationships
+    occurrences = relationship("EventOccurrence", back_populates="event", passive_deletes=True)
+    participants = relationship("EventParticipant", back_populates="event", passive_deletes=True)
+
+class EventOccurrence(FacilityScoped, Base):
+    __tablename__ = "event_occurrences"
+
+    # Materialised occurrences of events over a rolling window, so upcoming and
+    # calendar queries are index range scans rather than per-request expansion
+    id = Column(Integer, primary_key=True, index=True)
+    event_id = Column(Integer, ForeignKey("events.id", ondelete="CASCADE"), nullable=False)
+    occurrence_at = Column(DateTime, nullable=False)
+    status = Column(Enum(EventStatus), nullable=False, default=EventStatus.PLANNED)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    # Relationships
+    event = relationship("Event", back_populates="occurrences")
+
+    __table_args__ = (
+        UniqueConstraint("event_id", "occurrence_at", name="uq_event_occurrences_event_at"),
+        Index("ix_event_occurrences_at_status", "occurrence_at", "status"),
+    )
+
+class EventParticipant(Base):
+    __tablename__ = "event_participants"
+
+    # Seats are claimed with a conditional UPDATE on events.current_participants;
+    # anyone who does not get a seat is waitlisted and promoted in id order
+    id = Column(Integer, primary_key=True, index=True)
+    event_id = Column(Integer, ForeignKey("events.id", ondelete="CASCADE"), nullable=False)
+    resident_id = Column(Integer, ForeignKey("residents.id", ondelete="CASCADE"), nullable=False)
+    status = Column(Enum(ParticipantStatus), nullable=False, default=ParticipantStatus.REGISTERED)
+    registered_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    # Relationships
+    event = relationship("Event", back_populates="participants")
+    resident = relationship("Resident")
+
+    __table_args__ = (
+        UniqueConstraint("event_id", "resident_id", name="uq_event_participants_event_resident"),
+        Index("ix_event_participants_event_status", "event_id", "status", "id"),
+    )
+
+class Document(FacilityScoped, Base):
     __tablename__ = "documents"
 
     id = Column(Integer, primary_key=True, index=True)
@@ -149,12 +315,12 @@ class Document(Base):
     # Relationships
     resident = relationship("Resident", back_populates="documents")
 
-class Staff(Base):
+class Staff(FacilityScoped, Base):
     __tablename__ = "staff"
 
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String(100), nullable=False)
-    email = Column(String(100), unique=True, nullable=False, index=True)
+    email = Column(String(100), nullable=False, index=True)
     phone = Column(String(20))
     role = Column(String(50), nullable=False)  # admin, nurse, doctor, caregiver
     department = Column(String(50))
@@ -167,7 +333,31 @@ class Staff(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
-class Visitor(Base):
+    __table_args__ = (
+        # Staff emails are unique within a facility
+        Index("uq_staff_facility_email", "facility_id", "email", unique=True),
+    )
+
+class ShiftAssignment(FacilityScoped, Base):
+    __tablename__ = "shift_assignments"
+
+    id = Column(Integer, primary_key=True, index=True)
+    staff_id = Column(Integer, ForeignKey("staff.id"), nullable=False)
+    shift_date = Column(Date, nullable=False)
+    shift = Column(String(20), nullable=False)  # morning, evening, night
+    floor = Column(Integer, nullable=False)
+    notes = Column(Text)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    staff = relationship("Staff")
+
+    __table_args__ = (
+        UniqueConstraint("staff_id", "shift_date", "shift", name="uq_shift_assignments_staff_shift"),
+        # Coverage reads a date range for every floor at once
+        Index("ix_shift_assignments_date_shift_floor", "shift_date", "shift", "floor"),
+    )
+
+class Visitor(FacilityScoped, Base):
     __tablename__ = "visitors"
 
     id = Column(Integer, primary_key=True, index=True)
@@ -183,24 +373,160 @@ class Visitor(Base):
     approved_by = Column(String(100))
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
-class Billing(Base):
+    __table_args__ = (
+        Index("ix_visitors_resident_visit_date", "resident_id", "visit_date"),
+        Index("ix_visitors_visit_date", "visit_date", "id"),
+        # Partial index over open visits: the fire roll reads a facility's in check-in order
+        Index(
+            "ix_visitors_on_site",
+            "facility_id",
+            "check_in_time",
+            sqlite_where=and_(check_out_time == None, check_in_time != None),
+            postgresql_where=and_(check_out_time == None, check_in_time != None),
+        ),
+    )
+
+class Billing(FacilityScoped, Base):
     __tablename__ = "billing"
 
     id = Column(Integer, primary_key=True, index=True)
     resident_id = Column(Integer, ForeignKey("residents.id"), nullable=False)
     billing_period_start = Column(Date, nullable=False)
     billing_period_end = Column(Date, nullable=False)
-    accommodation_charges = Column(Float, default=0.0)
-    medical_charges = Column(Float, default=0.0)
-    food_charges = Column(Float, default=0.0)
-    other_charges = Column(Float, default=0.0)
-    total_amount = Column(Float, nullable=False)
-    amount_paid = Column(Float, default=0.0)
-    balance = Column(Float, default=0.0)
+    accommodation_charges = Column(Cents, default=0)
+    medical_charges = Column(Cents, default=0)
+    food_charges = Column(Cents, default=0)
+    other_charges = Column(Cents, default=0)
+    total_amount = Column(Cents, nullable=False)
+    amount_paid = Column(Cents, default=0)
+    balance = Column(Cents, default=0)
     due_date = Column(Date, nullable=False)
     payment_status = Column(String(20), default="pending")  # pending, paid, overdue
     payment_method = Column(String(50))
     payment_date = Column(Date)
     notes = Column(Text)
+    billing_run_id = Column(Integer, ForeignKey("billing_runs.id"))  # set on invoices generated by a run
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+    __table_args__ = (
+        Index("ix_billing_period_resident", "billing_period_start", "resident_id"),
+        # Nightly ageing job: pending invoices that fell due
+        Index("ix_billing_status_due", "payment_status", "due_date"),
+    )
+
+class Payment(Base):
+    __tablename__ = "payments"
+
+    id = Column(Integer, primary_key=True, index=True)
+    billing_id = Column(Integer, ForeignKey("billing.id"), nullable=False, index=True)
+    resident_id = Column(Integer, ForeignKey("residents.id"), nullable=False, index=True)
+    amount = Column(Cents, nullable=False)
+    payment_date = Column(Date, nullable=False)
+    payment_method = Column(String(50))
+    reference = Column(String(100))
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class ResidentBalance(FacilityScoped, Base):
+    __tablename__ = "resident_balances"
+
+    # AR ledger: outstanding balance per resident, bucketed by days past due as of as_of
+    resident_id = Column(Integer, ForeignKey("residents.id"), primary_key=True)
+    balance = Column(Cents, nullable=False, default=0)
+    current = Column(Cents, nullable=False, default=0)
+    past_due_0_30 = Column(Cents, nullable=False, default=0)
+    past_due_31_60 = Column(Cents, nullable=False, default=0)
+    past_due_61_90 = Column(Cents, nullable=False, default=0)
+    past_due_over_90 = Column(Cents, nullable=False, default=0)
+    as_of = Column(Date, nullable=False)
+
+class BillingRun(FacilityScoped, Base):
+    __tablename__ = "billing_runs"
+
+    # One row per billing period; re-running a period reuses it
+    id = Column(Integer, primary_key=True, index=True)
+    period_start = Column(Date, nullable=False)
+    period_end = Column(Date, nullable=False)
+    status = Column(String(20), nullable=False, default="running")  # running, completed, failed
+    invoices_created = Column(Integer, default=0)
+    total_amount = Column(Cents, default=0)
+    error = Column(Text)
+    started_at = Column(DateTime, nullable=False)
+    finished_at = Column(DateTime)
+
+    __table_args__ = (
+        UniqueConstraint("facility_id", "period_start", "period_end", name="uq_billing_runs_facility_period"),
+    )
+
+class SchedulerLease(Base):
+    __tablename__ = "scheduler_leases"
+
+    # Leader lock for background jobs: one row per job, owned until expires_at
+    name = Column(String(100), primary_key=True)
+    holder = Column(String(100), nullable=False)
+    expires_at = Column(DateTime, nullable=False)
+
+class JobRun(Base):
+    __tablename__ = "job_runs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    job_name = Column(String(100), nullable=False, index=True)
+    holder = Column(String(100))
+    status = Column(String(20), nullable=False, default="running")  # success, failed
+    rows_affected = Column(Integer)
+    batches = Column(Integer)
+    duration_ms = Column(Float)
+    error = Column(Text)
+    started_at = Column(DateTime, nullable=False)
+    finished_at = Column(DateTime)
+
+class AuditLog(FacilityScoped, Base):
+    __tablename__ = "audit_log"
+
+    # Append-only change history written in batches by app.audit; never updated or deleted
+    id = Column(Integer, primary_key=True, index=True)
+    # None for background work spanning facilities (e.g. a bulk UPDATE over every facility's rows)
+    facility_id = Column(Integer, default=current_facility_id, index=True)
+    occurred_at = Column(DateTime, nullable=False, index=True)
+    actor_id = Column(Integer)  # staff id from the bearer token, None for anonymous and background work
+    table_name = Column(String(50), nullable=False)
+    row_id = Column(String(64))  # None for bulk statements, whose changes hold the SQL instead
+    action = Column(String(10), nullable=False)  # insert, update, delete
+    changes = Column(Text, nullable=False)  # JSON: {"column": [before, after]} or {"sql": "..."}
+
+    __table_args__ = (
+        Index("ix_audit_log_table_row", "table_name", "row_id"),
+        Index("ix_audit_log_actor", "actor_id", "occurred_at"),
+    )
+
+class ChangeLog(FacilityScoped, Base):
+    __tablename__ = "change_log"
+
+    # One entry per row written to a synced table; seq comes from change_log_sequence as the
+    # writing transaction commits, so it follows commit order and is never reused
+    seq = Column(Integer, primary_key=True)
+    table_name = Column(String(50), nullable=False)
+    row_id = Column(Integer, nullable=False)
+    changed_at = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        # Sync reads a facility's entries after a sequence number
+        Index("ix_change_log_facility_seq", "facility_id", "seq"),
+        Index("ix_change_log_table_row", "table_name", "row_id"),
+        {"sqlite_autoincrement": True},
+    )
+
+class CheckupSlotLock(Base):
+    __tablename__ = "checkup_slot_locks"
+
+    # One row per "facility:kind:value" booking key (doctor, location, resident). A booking locks
+    # its keys' rows before checking for overlaps, so concurrent workers book a key one at a time.
+    lock_key = Column(String(200), primary_key=True)
+
+class ChangeLogSequence(Base):
+    __tablename__ = "change_log_sequence"
+
+    # A single row holding the last change_log seq handed out. Committing transactions update it
+    # and keep its row lock until they commit, so seqs are assigned in commit order.
+    id = Column(Integer, primary_key=True)
+    last_seq = Column(Integer, nullable=False, default=0)
@@ -0,0 +1,41 @@
+"""
+Money handling.
+
+Amounts are stored as integer minor units (cents) through the ``Cents``
+column type and surface in Python as ``Decimal`` quantised to two places,
+so SQL ``SUM``s are exact integer sums and nothing accumulates float error.
+"""
+from decimal import Decimal, ROUND_HALF_UP
+
+from sqlalchemy import BigInteger
+from sqlalchemy.types import TypeDecorator
+
+CENT = Decimal("0.01")
+ZERO = Decimal("0.00")
+
+
+def to_decimal(value) -> Decimal:
+    if isinstance(value, Decimal):
+        return value.quantize(CENT, rounding=ROUND_HALF_UP)
+    # str() first so 0.1 becomes Decimal("0.1") rather than its binary expansion
+    return Decimal(str(value)).quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def to_cents(value) -> int:
+    return int(to_decimal(value) * 100)
+
+
+def from_cents(cents) -> Decimal:
+    return Decimal(int(round(cents))).scaleb(-2)
+
+
+class Cents(TypeDecorator):
+    """Decimal amount stored as an integer number of cents"""
+    impl = BigInteger
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        return None if value is None else to_cents(value)
+
+    def process_result_value(self, value, dialect):
+        return None if value is None else from_cents(value)
@@ -0,0 +1,155 @@
+"""
+Recurrence rules for events.
+
+``Event.recurrence_pattern`` accepts simple presets ("daily", "weekly",
+"biweekly", "monthly", "yearly", "weekdays", "every 3 days") or an
+RRULE-style string such as ``FREQ=WEEKLY;INTERVAL=2;BYDAY=MO,WE;COUNT=10``.
+Supported RRULE parts: FREQ (DAILY/WEEKLY/MONTHLY/YEARLY), INTERVAL,
+BYDAY (weekly rules), COUNT and UNTIL.
+
+``occurrences`` expands a rule lazily and only over the requested window;
+rules without COUNT jump straight to the window instead of walking the
+series from its first date.
+"""
+import re
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from typing import Iterator, Optional, Tuple
+
+WEEKDAYS = ("MO", "TU", "WE", "TH", "FR", "SA", "SU")
+FREQUENCIES = ("DAILY", "WEEKLY", "MONTHLY", "YEARLY")
+
+# Stop expanding a rule that keeps producing empty periods (e.g. a bad BYDAY)
+MAX_EMPTY_PERIODS = 1000
+
+_PRESETS = {
+    "daily": "FREQ=DAILY",
+    "weekly": "FREQ=WEEKLY",
+    "biweekly": "FREQ=WEEKLY;INTERVAL=2",
+    "fortnightly": "FREQ=WEEKLY;INTERVAL=2",
+    "monthly": "FREQ=MONTHLY",
+    "yearly": "FREQ=YEARLY",
+    "annually": "FREQ=YEARLY",
+    "weekdays": "FREQ=WEEKLY;BYDAY=MO,TU,WE,TH,FR",
+    "weekends": "FREQ=WEEKLY;BYDAY=SA,SU",
+}
+_EVERY_N = re.compile(r"^every\s+(\d+)\s+(day|week|month|year)s?$")
+_EVERY_N_FREQ = {"day": "DAILY", "week": "WEEKLY", "month": "MONTHLY", "year": "YEARLY"}
+
+
+class InvalidRecurrence(ValueError):
+    pass
+
+
+@dataclass(frozen=True)
+class RecurrenceRule:
+    freq: str
+    interval: int = 1
+    by_weekday: Tuple[int, ...] = ()
+    count: Optional[int] = None
+    until: Optional[datetime] = None
+
+
+def _parse_until(value: str) -> datetime:
+    value = value.rstrip("Z")
+    for layout in ("%Y%m%dT%H%M%S", "%Y%m%d", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%d"):
+        try:
+            parsed = datetime.strptime(value, layout)
+        except ValueError:
+            continue
+        # A date-only UNTIL includes the whole day
+        return parsed if "T" in value else parsed.replace(hour=23, minute=59, second=59)
+    raise InvalidRecurrence(f"Invalid UNTIL value: {value}")
+
+
+@lru_cache(maxsize=256)
+def parse_rule(pattern: str) -> RecurrenceRule:
+    text = (pattern or "").strip()
+    lowered = " ".join(text.lower().split())
+    if lowered in _PRESETS:
+        text = _PRESETS[lowered]
+    else:
+        match = _EVERY_N.match(lowered)
+        if match:
+            text = f"FREQ={_EVERY_N_FREQ[match.group(2)]};INTERVAL={match.group(1)}"
+    if text.upper().startswith("RRULE:"):
+        text = text[6:]
+
+    parts = {}
+    for part in filter(None, text.split(";")):
+        key, _, value = part.partition("=")
+        parts[key.strip().upper()] = value.strip().upper()
+
+    freq = parts.get("FREQ")
+    if freq not in FREQUENCIES:
+        raise InvalidRecurrence(f"Unsupported recurrence pattern: {pattern!r}")
+    try:
+        interval = int(parts.get("INTERVAL", 1))
+        count = int(parts["COUNT"]) if "COUNT" in parts else None
+        by_weekday = tuple(sorted({WEEKDAYS.index(day[-2:]) for day in parts["BYDAY"].split(",")})) if "BYDAY" in parts else ()
+    except ValueError as exc:
+        raise InvalidRecurrence(f"Invalid recurrence pattern: {pattern!r}") from exc
+    if interval < 1 or (count is not None and count < 1):
+        raise InvalidRecurrence(f"Invalid recurrence pattern: {pattern!r}")
+    if by_weekday and freq != "WEEKLY":
+        raise InvalidRecurrence("BYDAY is only supported for weekly rules")
+    until = _parse_until(parts["UNTIL"]) if "UNTIL" in parts else None
+    return RecurrenceRule(freq=freq, interval=interval, by_weekday=by_weekday, count=count, until=until)
+
+
+def _week_start(value: datetime) -> date:
+    return value.date() - timedelta(days=value.weekday())
+
+
+def _first_period(start: datetime, rule: RecurrenceRule, window_start: datetime) -> int:
+    if window_start <= start:
+        return 0
+    if rule.freq == "DAILY":
+        return (window_start - start).days // rule.interval
+    if rule.freq == "WEEKLY":
+        return ((window_start.date() - _week_start(start)).days // 7) // rule.interval
+    if rule.freq == "MONTHLY":
+        return ((window_start.year - start.year) * 12 + window_start.month - start.month) // rule.interval
+    return (window_start.year - start.year) // rule.interval
+
+
+def _period(start: datetime, rule: RecurrenceRule, index: int):
+    step = index * rule.interval
+    if rule.freq == "DAILY":
+        return [start + timedelta(days=step)]
+    if rule.freq == "WEEKLY":
+        if not rule.by_weekday:
+            return [start + timedelta(weeks=step)]
+        week = _week_start(start) + timedelta(weeks=step)
+        return [datetime.combine(week + timedelta(days=weekday), start.time()) for weekday in rule.by_weekday]
+    if rule.freq == "MONTHLY":
+        year, month = divmod(start.month - 1 + step, 12)
+        year, month = start.year + year, month + 1
+    else:
+        year, month = start.year + step, start.month
+    try:
+        return [start.replace(year=year, month=month)]
+    except ValueError:
+        # e.g. the 31st in a 30-day month, or 29 February outside leap years
+        return []
+
+
+def occurrences(start: datetime, rule: RecurrenceRule, window_start: datetime, window_end: datetime) -> Iterator[datetime]:
+    """Yield occurrences of the series starting at ``start`` within [window_start, window_end]"""
+    index = 0 if rule.count is not None else _first_period(start, rule, window_start)
+    emitted = empty = 0
+    while empty < MAX_EMPTY_PERIODS:
+        candidates = _period(start, rule, index)
+        index += 1
+        empty = 0 if candidates else empty + 1
+        for occurrence in candidates:
+            if occurrence < start:
+                continue
+            if rule.count is not None and emitted >= rule.count:
+                return
+            if (rule.until is not None and occurrence > rule.until) or occurrence > window_end:
+                return
+            emitted += 1
+            if occurrence >= window_start:
+                yield occurrence
@@ -0,0 +1,44 @@
+"""
+Cold storage for deleted residents' records.
+
+Deleting a resident only sets ``deleted_at``. The ``resident_archive`` job
+then moves their payments, event registrations, medications, checkups,
+documents, visits and settled invoices out of the live tables in bounded
+batches, into one gzip'd NDJSON file per resident
+(``<RESIDENT_ARCHIVE_DIR>/resident-<id>.ndjson.gz``; facilities other than
+the default one archive under ``facility-<id>/``), one line per row tagged
+with its table. Files are written through ``app.cold_archive`` like the
+visitor archive's, so ``read`` drops a row archived twice by a crash.
+"""
+import os
+from typing import Iterable, List
+
+from decouple import config
+
+from app import cold_archive
+
+ARCHIVE_DIR = config("RESIDENT_ARCHIVE_DIR", default="archive/residents")
+SUFFIX = cold_archive.SUFFIX
+
+
+def facility_dir(facility_id: int) -> str:
+    return cold_archive.facility_dir(ARCHIVE_DIR, facility_id)
+
+
+def resident_path(resident_id: int, archive_dir: str = None) -> str:
+    return os.path.join(archive_dir or ARCHIVE_DIR, f"resident-{resident_id}{SUFFIX}")
+
+
+def append(resident_id: int, table_name: str, rows: Iterable[dict], archive_dir: str = None) -> int:
+    """Append one table's rows to the resident's archive file; returns the number written"""
+    return cold_archive.append(
+        resident_path(resident_id, archive_dir), ({"table": table_name, "row": row} for row in rows)
+    )
+
+
+def read(resident_id: int, archive_dir: str = None) -> List[dict]:
+    """A resident's archived rows as ``{"table", "row"}`` records, in archival order"""
+    records = {}
+    for record in cold_archive.read(resident_path(resident_id, archive_dir)):
+        records[(record["table"], record["row"]["id"])] = record
+    return list(records.values())
@@ -0,0 +1,346 @@
+"""
+Response cache for read endpoints.
+
+``@cached("beds", ...)`` under a route decorator stores the endpoint's
+serialised JSON under a key built from the facility, path and sorted query
+parameters, tagged with the tables (event topics) it was built from. crud
+publishes a topic after every commit that changes it; the cache bumps that
+tag's version, and any entry stored under an older version is a miss from
+then on. Versioning instead of deleting keeps invalidation O(1) and works
+the same on a shared store, where the entries can't be enumerated.
+
+Backends implement ``get``, ``set``, ``get_many`` and ``incr``:
+
+* ``LRUBackend`` (default) keeps up to ``RESPONSE_CACHE_MAX_ENTRIES``
+  entries in process, least recently used evicted first;
+* ``SharedBackend`` adapts a Redis-style client (``get``, ``set(ex=)``,
+  ``mget``, ``incr``) so several workers share entries and invalidations.
+  ``RESPONSE_CACHE_REDIS_URL`` uses redis-py when it is installed;
+  ``FakeSharedClient`` is an in-memory stand-in for tests.
+
+Tag versions are per facility; unscoped work (background jobs) bumps a
+global version that invalidates the tag for every facility.
+
+Misses go through ``single_flight``, so a burst of identical requests
+computes an entry once; ``@coalesced`` gives routes that shouldn't be
+cached the same protection without keeping anything.
+"""
+import functools
+import inspect
+import json
+import logging
+import threading
+import time
+from collections import Counter, OrderedDict
+from datetime import date
+from typing import Any, Dict, Iterable, List, Optional
+
+from decouple import config
+from fastapi import HTTPException, Request, Response
+from pydantic import TypeAdapter
+
+from app.database import READ_YOUR_WRITES_SECONDS
+from app.events import subscribe
+from app.single_flight import FlightTimeout, flights
+from app.tenancy import current_facility
+
+logger = logging.getLogger(__name__)
+
+RESPONSE_CACHE_ENABLED = config("RESPONSE_CACHE_ENABLED", default=True, cast=bool)
+RESPONSE_CACHE_MAX_ENTRIES = config("RESPONSE_CACHE_MAX_ENTRIES", default=1024, cast=int)
+RESPONSE_CACHE_REDIS_URL = config("RESPONSE_CACHE_REDIS_URL", default="")
+
+
+class LRUBackend:
+    """In-process entries bounded by count; tag versions are kept apart so eviction never resets one"""
+
+    def __init__(self, max_entries: int = RESPONSE_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (value, expires_at)
+        self._versions: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: bytes, ttl: Optional[float] = None):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl if ttl else None)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_many(self, keys: List[str]) -> List[Optional[int]]:
+        with self._lock:
+            return [self._versions.get(key) for key in keys]
+
+    def incr(self, key: str) -> int:
+        with self._lock:
+            self._versions[key] = self._versions.get(key, 0) + 1
+            return self._versions[key]
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SharedBackend:
+    """Entries and tag versions in a shared Redis-style store"""
+
+    def __init__(self, client, prefix: str = "response-cache:"):
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.client.get(self.prefix + key)
+
+    def set(self, key: str, value: bytes, ttl: Optional[float] = None):
+        self.client.set(self.prefix + key, value, ex=int(ttl) if ttl else None)
+
+    def get_many(self, keys: List[str]) -> List[Optional[int]]:
+        return [int(value) if value is not None else None for value in self.client.mget([self.prefix + key for key in keys])]
+
+    def incr(self, key: str) -> int:
+        return self.client.incr(self.prefix + key)
+
+
+class FakeSharedClient:
+    """The subset of the redis-py client SharedBackend uses, in memory"""
+
+    def __init__(self):
+        self.data: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value, expires_at = self.data.get(key, (None, None))
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self.data[key]
+                return None
+            return value
+
+    def set(self, key, value, ex=None):
+        with self._lock:
+            self.data[key] = (value, time.monotonic() + ex if ex else None)
+
+    def mget(self, keys):
+        return [self.get(key) for key in keys]
+
+    def incr(self, key):
+        with self._lock:
+            value = int(self.data.get(key, (0, None))[0]) + 1
+            self.data[key] = (str(value).encode(), None)
+            return value
+
+
+class ResponseCache:
+    def __init__(self, backend=None):
+        self.backend = backend or LRUBackend()
+        self._lock = threading.Lock()
+        self._counts = Counter()
+        self._routes: Dict[str, Counter] = {}
+        self._tags = set()
+
+    def configure(self, backend):
+        """Switch backends (e.g. to a SharedBackend); existing entries are dropped"""
+        self.backend = backend
+
+    def _count(self, route: str, outcome: str):
+        with self._lock:
+            self._counts[outcome] += 1
+            self._routes.setdefault(route, Counter())[outcome] += 1
+
+    def _version_keys(self, tags: Iterable[str], facility_id) -> List[str]:
+        keys = []
+        for tag in tags:
+            keys += [f"tag:{tag}", f"tag:{facility_id}:{tag}"]
+        return keys
+
+    def signature(self, tags: Iterable[str]) -> bytes:
+        versions = self.backend.get_many(self._version_keys(tags, current_facility.get()))
+        return json.dumps([version or 0 for version in versions]).encode()
+
+    def lookup(self, route: str, key: str, signature: bytes) -> Optional[bytes]:
+        raw = self.backend.get(key)
+        if raw is not None:
+            stored_signature, _, body = raw.partition(b"\n")
+            if stored_signature == signature:
+                self._count(route, "hits")
+                return body
+        self._count(route, "misses")
+        return None
+
+    def store(self, key: str, signature: bytes, body: bytes, ttl: Optional[float]):
+        self.backend.set(key, signature + b"\n" + body, ttl)
+
+    def track(self, tags: Iterable[str]):
+        for tag in tags:
+            if tag not in self._tags:
+                self._tags.add(tag)
+                subscribe(tag)(functools.partial(self.invalidate, tag))
+
+    def invalidate(self, tag: str, **_):
+        facility_id = current_facility.get()
+        self.backend.incr(f"tag:{tag}" if facility_id is None else f"tag:{facility_id}:{tag}")
+        with self._lock:
+            self._counts["invalidations"] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            counts = dict(self._counts)
+            routes = {route: dict(route_counts) for route, route_counts in self._routes.items()}
+        lookups = counts.get("hits", 0) + counts.get("misses", 0)
+        return {
+            "enabled": RESPONSE_CACHE_ENABLED,
+            "backend": type(self.backend).__name__,
+            "entries": len(self.backend) if hasattr(self.backend, "__len__") else None,
+            "hits": counts.get("hits", 0),
+            "misses": counts.get("misses", 0),
+            "hit_ratio": counts.get("hits", 0) / lookups if lookups else 0.0,
+            "invalidations": counts.get("invalidations", 0),
+            "routes": routes,
+            "coalescing": flights.stats(),
+        }
+
+
+def _default_backend():
+    if not RESPONSE_CACHE_REDIS_URL:
+        return LRUBackend()
+    try:
+        import redis
+    except ImportError:
+        logger.warning("RESPONSE_CACHE_REDIS_URL is set but redis is not installed; using the in-process cache")
+        return LRUBackend()
+    return SharedBackend(redis.Redis.from_url(RESPONSE_CACHE_REDIS_URL))
+
+
+response_cache = ResponseCache(_default_backend())
+
+
+def cache_key(request: Request, daily: bool = False) -> str:
+    query = "&".join(f"{name}={value}" for name, value in sorted(request.query_params.multi_items()))
+    key = f"{current_facility.get()}:{request.url.path}?{query}"
+    return f"{key}@{date.today().isoformat()}" if daily else key
+
+
+def _serialiser(model):
+    adapter = TypeAdapter(model)
+    return lambda result: adapter.dump_json(adapter.validate_python(result, from_attributes=True))
+
+
+def _read_source(kwargs) -> str:
+    # A client pinned to the primary after a write must not share a replica read
+    db = kwargs.get("db")
+    return "replica" if db is not None and db.info.get("read_only") else "primary"
+
+
+def _json_route(func, endpoint):
+    """Wrap ``func`` as a route whose ``endpoint(request, args, kwargs)`` returns the JSON body.
+
+    Adds a ``request`` parameter to the signature FastAPI sees when ``func``
+    doesn't take one.
+    """
+    signature = inspect.signature(func)
+    takes_request = "request" in signature.parameters
+
+    def call_args(request, kwargs):
+        if takes_request:
+            kwargs["request"] = request
+        return kwargs
+
+    if inspect.iscoroutinefunction(endpoint):
+        @functools.wraps(func)
+        async def wrapper(*args, request: Request, **kwargs):
+            try:
+                body = await endpoint(request, args, call_args(request, kwargs))
+            except FlightTimeout:
+                raise HTTPException(status_code=503, detail="Timed out waiting for an identical request in progress")
+            return Response(content=body, media_type="application/json")
+    else:
+        @functools.wraps(func)
+        def wrapper(*args, request: Request, **kwargs):
+            try:
+                body = endpoint(request, args, call_args(request, kwargs))
+            except FlightTimeout:
+                raise HTTPException(status_code=503, detail="Timed out waiting for an identical request in progress")
+            return Response(content=body, media_type="application/json")
+
+    if not takes_request:
+        wrapper.__signature__ = signature.replace(parameters=[
+            *signature.parameters.values(),
+            inspect.Parameter("request", inspect.Parameter.KEYWORD_ONLY, annotation=Request),
+        ])
+    return wrapper
+
+
+def cached(*tags: str, model, ttl: Optional[float] = None, daily: bool = False):
+    """Cache a read route's JSON, invalidated when any of ``tags`` is published.
+
+    ``model`` is the route's response model, used to serialise the result once
+    on a miss; ``daily`` keys entries by date for answers that depend on today.
+    Concurrent misses for the same entry are coalesced into one computation.
+
+    Entries are kept apart by read source, so a client pinned to the primary
+    after a write never gets one filled from the replica. A replica fill may
+    predate the write that bumped the tag, so it lives no longer than the
+    ``READ_YOUR_WRITES_SECONDS`` the replica is allowed to lag.
+    """
+    serialise = _serialiser(model)
+    response_cache.track(tags)
+
+    def decorator(func):
+        def endpoint(request, args, kwargs):
+            if not RESPONSE_CACHE_ENABLED:
+                return serialise(func(*args, **kwargs))
+            route = request.scope.get("route").path if request.scope.get("route") else request.url.path
+            source = _read_source(kwargs)
+            key = f"{cache_key(request, daily=daily)}#{source}"
+            version = response_cache.signature(tags)
+            body = response_cache.lookup(route, key, version)
+            if body is not None:
+                return body
+            lifetime = ttl
+            if source == "replica":
+                lifetime = min(ttl, READ_YOUR_WRITES_SECONDS) if ttl else READ_YOUR_WRITES_SECONDS
+
+            def fill():
+                body = serialise(func(*args, **kwargs))
+                response_cache.store(key, version, body, lifetime)
+                return body
+            return flights.do(("cached", key, version), fill)
+        return _json_route(func, endpoint)
+    return decorator
+
+
+def coalesced(model, timeout: Optional[float] = None, daily: bool = False):
+    """Share one run of a read route between identical concurrent requests.
+
+    Nothing is kept once the leading request finishes; use ``cached`` for
+    answers that can be reused until a write. Works on sync and async routes.
+    """
+    serialise = _serialiser(model)
+
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            async def endpoint(request, args, kwargs):
+                async def run():
+                    return serialise(await func(*args, **kwargs))
+                return await flights.do_async(
+                    ("coalesced", cache_key(request, daily=daily), _read_source(kwargs)), run, timeout
+                )
+        else:
+            def endpoint(request, args, kwargs):
+                return flights.do(
+                    ("coalesced", cache_key(request, daily=daily), _read_source(kwargs)),
+                    lambda: serialise(func(*args, **kwargs)), timeout
+                )
+        return _json_route(func, endpoint)
+    return decorator
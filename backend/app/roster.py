@@ -0,0 +1,118 @@
+"""
+Staff roster coverage.
+
+Shift assignments for a date range are loaded with one query and counted
+into a dense numpy array indexed (day, shift, floor, role). Required
+staffing comes from each floor's resident census for the day (active
+residents in a bed on that floor, admitted on or before the day) divided
+by the ``ROSTER_STAFFING_RATIOS`` residents-per-staff ratio for the role,
+rounded up. Gaps are the cells where assigned < required, found with one
+vectorised comparison, so a month for the whole facility is a few small
+arrays rather than a spreadsheet.
+"""
+from datetime import date, timedelta
+from typing import Dict
+
+import numpy as np
+from decouple import config
+from sqlalchemy import and_
+from sqlalchemy.orm import Session
+
+from app import models, schemas
+
+SHIFTS = ("morning", "evening", "night")
+MAX_RANGE_DAYS = 62
+
+
+def _parse_ratios(value: str) -> Dict[str, int]:
+    ratios = {}
+    for item in value.split(","):
+        if item.strip():
+            role, residents = item.split(":")
+            ratios[role.strip()] = int(residents)
+    return ratios
+
+
+# Residents per staff member on each shift, e.g. "nurse:8,caregiver:6"
+STAFFING_RATIOS = config("ROSTER_STAFFING_RATIOS", default="nurse:8,caregiver:6", cast=_parse_ratios)
+
+
+def _floors(db: Session, assignment_floors) -> list:
+    floors = {floor for (floor,) in db.query(models.Bed.floor).distinct()}
+    return sorted(floors | set(assignment_floors))
+
+
+def _census(db: Session, days: np.ndarray, floor_index: Dict[int, int]) -> np.ndarray:
+    """Residents per (day, floor)"""
+    rows = db.query(models.Bed.floor, models.Resident.admission_date).join(
+        models.Bed, models.Bed.id == models.Resident.bed_id
+    ).filter(
+        and_(models.Resident.status == models.ResidentStatus.ACTIVE, models.Resident.admission_date <= days[-1].item())
+    ).all()
+    admitted = np.zeros((len(days), len(floor_index)), dtype=np.int32)
+    if rows:
+        floors, admissions = zip(*rows)
+        first_day = np.searchsorted(days, np.array(admissions, dtype="datetime64[D]"))
+        np.add.at(admitted, (first_day, [floor_index[floor] for floor in floors]), 1)
+    return np.cumsum(admitted, axis=0)
+
+
+def get_coverage(db: Session, start: date, end: date) -> schemas.RosterCoverage:
+    days = np.arange(np.datetime64(start, "D"), np.datetime64(end + timedelta(days=1), "D"))
+    roles = list(STAFFING_RATIOS)
+    rows = db.query(
+        models.ShiftAssignment.shift_date, models.ShiftAssignment.shift, models.ShiftAssignment.floor, models.Staff.role
+    ).join(
+        models.Staff, models.Staff.id == models.ShiftAssignment.staff_id
+    ).filter(
+        and_(
+            models.ShiftAssignment.shift_date >= start,
+            models.ShiftAssignment.shift_date <= end,
+            models.Staff.role.in_(roles)
+        )
+    ).all()
+
+    floors = _floors(db, (floor for _, _, floor, _ in rows))
+    floor_index = {floor: i for i, floor in enumerate(floors)}
+    shift_index = {shift: i for i, shift in enumerate(SHIFTS)}
+    role_index = {role: i for i, role in enumerate(roles)}
+
+    assigned = np.zeros((len(days), len(SHIFTS), len(floors), len(roles)), dtype=np.int16)
+    if rows:
+        shift_dates, shifts, assignment_floors, staff_roles = zip(*rows)
+        np.add.at(assigned, (
+            (np.array(shift_dates, dtype="datetime64[D]") - days[0]).astype(np.int64),
+            [shift_index[shift] for shift in shifts],
+            [floor_index[floor] for floor in assignment_floors],
+            [role_index[role] for role in staff_roles],
+        ), 1)
+
+    census = _census(db, days, floor_index)
+    ratios = np.array([STAFFING_RATIOS[role] for role in roles], dtype=np.int32)
+    # ceil(census / ratio) per (day, floor, role)
+    required = (census[:, :, None] + ratios - 1) // ratios
+
+    short = assigned < required[:, None, :, :]
+    gaps = [
+        schemas.CoverageGap(
+            date=days[d].item(),
+            shift=SHIFTS[s],
+            floor=floors[f],
+            role=roles[r],
+            assigned=int(assigned[d, s, f, r]),
+            required=int(required[d, f, r]),
+            shortfall=int(required[d, f, r] - assigned[d, s, f, r]),
+        )
+        for d, s, f, r in zip(*np.nonzero(short))
+    ]
+    return schemas.RosterCoverage(
+        start=start,
+        end=end,
+        shifts=list(SHIFTS),
+        floors=floors,
+        roles=roles,
+        census=census.tolist(),
+        assigned=assigned.tolist(),
+        required=required.tolist(),
+        gaps=gaps,
+    )
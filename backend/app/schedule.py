@@ -0,0 +1,174 @@
+"""
+Unified daily schedule.
+
+A day's timeline is a k-way merge (``heapq.merge``) of four streams that
+each come back already sorted from their own index: checkups by
+``scheduled_date``, event occurrences by ``occurrence_at``, birthdays and
+medication rounds from the MAR engine. Each day's timeline is cached and
+dropped whenever a checkup, event, resident, bed or medication changes.
+"""
+import heapq
+import threading
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+from itertools import groupby
+from typing import List
+
+from sqlalchemy import and_
+from sqlalchemy.orm import Session
+
+from app import crud, models, schemas
+from app.events import subscribe
+from app.tenancy import FacilityLocal
+from app.medication_schedule import get_daily_mar
+
+CACHED_DAYS = 62
+MAX_RANGE_DAYS = 31
+
+
+ACTIVE_EVENT_STATUSES = [models.EventStatus.PLANNED, models.EventStatus.ONGOING]
+
+
+def _day_bounds(day: date):
+    start = datetime.combine(day, datetime.min.time())
+    return start, start + timedelta(days=1)
+
+
+def _checkup_items(db: Session, day: date):
+    start, end = _day_bounds(day)
+    rows = db.query(models.Checkup, models.Resident.name, models.Resident.room_number).join(
+        models.Resident, models.Resident.id == models.Checkup.resident_id
+    ).filter(
+        and_(
+            models.Checkup.scheduled_date >= start,
+            models.Checkup.scheduled_date < end,
+            models.Checkup.status != models.CheckupStatus.CANCELLED
+        )
+    ).order_by(models.Checkup.scheduled_date).all()
+    for checkup, resident_name, room_number in rows:
+        yield schemas.ScheduleItem(
+            kind="checkup",
+            starts_at=checkup.scheduled_date,
+            title=f"{checkup.checkup_type.capitalize()} checkup",
+            reference_id=checkup.id,
+            resident_id=checkup.resident_id,
+            resident_name=resident_name,
+            room_number=room_number,
+            location=checkup.location,
+            details=checkup.doctor_name,
+        )
+
+
+def _event_rows(db: Session, day: date):
+    start, end = _day_bounds(day)
+    # The occurrence window is inclusive; stop just short of the next midnight
+    return crud._occurrence_window(db, start, end - timedelta(microseconds=1), ACTIVE_EVENT_STATUSES)
+
+
+def _event_items(db: Session, day: date):
+    for occurrence, event in _event_rows(db, day):
+        yield schemas.ScheduleItem(
+            kind="event",
+            starts_at=occurrence.occurrence_at,
+            duration_minutes=event.duration_minutes,
+            title=event.title,
+            reference_id=event.id,
+            location=event.location,
+            details=event.event_type,
+        )
+
+
+def _birthday_items(db: Session, day: date):
+    for birthday in crud.get_birthdays_on(db, day):
+        yield schemas.ScheduleItem(
+            kind="birthday",
+            starts_at=datetime.combine(day, datetime.min.time()),
+            all_day=True,
+            title=f"{birthday.name}'s birthday",
+            reference_id=birthday.id,
+            resident_id=birthday.id,
+            resident_name=birthday.name,
+            room_number=birthday.room_number,
+            details=f"Turns {day.year - birthday.date_of_birth.year}",
+        )
+
+
+def _medication_round_items(db: Session, day: date):
+    doses = get_daily_mar(db, day=day)["doses"]
+    for scheduled_at, round_doses in groupby(doses, key=lambda dose: dose["scheduled_at"]):
+        round_doses = list(round_doses)
+        residents = {dose["resident_id"] for dose in round_doses}
+        yield schemas.ScheduleItem(
+            kind="medication_round",
+            starts_at=scheduled_at,
+            title=f"Medication round ({round_doses[0]['round']})",
+            details=f"{len(round_doses)} doses for {len(residents)} residents",
+        )
+
+
+def build_day(db: Session, day: date) -> List[schemas.ScheduleItem]:
+    # Every stream is already ordered by start time, so a heap merge is enough
+    streams = (
+        _birthday_items(db, day),
+        _checkup_items(db, day),
+        _event_items(db, day),
+        _medication_round_items(db, day),
+    )
+    return list(heapq.merge(*streams, key=lambda item: item.starts_at))
+
+
+class ScheduleCache:
+    def __init__(self, max_days: int = CACHED_DAYS):
+        self._lock = threading.Lock()
+        self._max_days = max_days
+        self._days = OrderedDict()
+        self._generation = 0
+
+    def invalidate(self, **_):
+        with self._lock:
+            self._generation += 1
+            self._days.clear()
+
+    def get_day(self, db: Session, day: date) -> List[schemas.ScheduleItem]:
+        with self._lock:
+            cached = self._days.get(day)
+            if cached is not None:
+                self._days.move_to_end(day)
+                return cached
+            generation = self._generation
+        timeline = build_day(db, day)
+        with self._lock:
+            if generation == self._generation:
+                self._days[day] = timeline
+                while len(self._days) > self._max_days:
+                    self._days.popitem(last=False)
+        return timeline
+
+
+schedule_cache = FacilityLocal(ScheduleCache)
+
+for _topic in ("checkups", "events", "residents", "medications", "beds"):
+    subscribe(_topic)(schedule_cache.invalidate)
+
+
+def get_schedule(db: Session, start: date, end: date) -> List[schemas.ScheduleItem]:
+    """Time-ordered timeline for every day from ``start`` to ``end`` inclusive"""
+    timeline = []
+    day = start
+    while day <= end:
+        timeline.extend(schedule_cache.get_day(db, day))
+        day += timedelta(days=1)
+    return timeline
+
+
+def get_today_schedule(db: Session) -> schemas.TodaySchedule:
+    today = date.today()
+    return schemas.TodaySchedule(
+        checkups=crud.get_today_checkups(db),
+        events=[
+            schemas.Event.model_validate(event).model_copy(update={"event_date": occurrence.occurrence_at})
+            for occurrence, event in _event_rows(db, today)
+        ],
+        birthdays=crud.get_today_birthdays(db),
+        timeline=schedule_cache.get_day(db, today),
+    )
@@ -0,0 +1,211 @@
+"""
+In-process background job scheduler.
+
+Each registered job runs on its own asyncio task. Before every run the
+task takes (or renews) a lease row in ``scheduler_leases``; the lease acts
+as a leader lock so that with several uvicorn workers, or several hosts
+sharing the database, only one process runs a given job at a time. The
+job itself runs in a worker thread with its own session, and every run is
+recorded in ``job_runs``.
+
+Leases are short (``SCHEDULER_LEASE_SECONDS``) whatever the job's
+interval. A heartbeat task renews every lease this process holds a few
+times per lease period, through long runs and the idle wait between
+runs alike, so a leader keeps its jobs while it is alive and a dead
+leader's jobs pass to another process within one lease period.
+
+Jobs that depend on the calendar date register with ``at_midnight`` and
+run once at startup, then just after each local midnight rather than a
+fixed interval after the process started.
+"""
+import asyncio
+import logging
+import os
+import socket
+import time
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Optional
+
+from decouple import config
+from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
+
+from app import models
+from app.database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+SCHEDULER_ENABLED = config("SCHEDULER_ENABLED", default=True, cast=bool)
+LEASE_SECONDS = config("SCHEDULER_LEASE_SECONDS", default=60, cast=float)
+
+
+@dataclass
+class Job:
+    name: str
+    interval_seconds: Optional[float]
+    func: Callable
+    lease_seconds: float
+    at_midnight: bool = False
+    wake: asyncio.Event = field(default=None, repr=False)
+
+    def seconds_to_next_run(self) -> float:
+        if not self.at_midnight:
+            return self.interval_seconds
+        now = datetime.now()
+        midnight = datetime.combine(now.date() + timedelta(days=1), datetime.min.time())
+        # A second's slack so the run lands on the new date
+        return (midnight - now).total_seconds() + 1
+
+
+class Scheduler:
+    def __init__(self, session_factory=SessionLocal):
+        self.session_factory = session_factory
+        self.holder = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.jobs: Dict[str, Job] = {}
+        self._tasks = []
+        self._loop = None
+
+    def register(self, name: str, interval_seconds: Optional[float], func: Callable,
+                 lease_seconds: Optional[float] = None, at_midnight: bool = False):
+        """Register ``func(db)`` to run every ``interval_seconds``, or after every local midnight.
+
+        The function returns the number of rows it touched, or a dict with
+        ``rows`` and ``batches``, which is stored with the run.
+        """
+        self.jobs[name] = Job(
+            name=name,
+            interval_seconds=interval_seconds,
+            func=func,
+            lease_seconds=lease_seconds or LEASE_SECONDS,
+            at_midnight=at_midnight,
+        )
+        return func
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        for job in self.jobs.values():
+            job.wake = asyncio.Event()
+            self._tasks.append(asyncio.create_task(self._run_forever(job), name=f"job:{job.name}"))
+        if self.jobs:
+            self._tasks.append(asyncio.create_task(self._heartbeat(), name="scheduler:heartbeat"))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await asyncio.to_thread(self._release_leases)
+
+    def trigger(self, name: str):
+        """Ask a job to run now instead of waiting for its next interval"""
+        job = self.jobs.get(name)
+        if job is None or job.wake is None or self._loop is None:
+            return
+        self._loop.call_soon_threadsafe(job.wake.set)
+
+    async def _run_forever(self, job: Job):
+        while True:
+            try:
+                if await asyncio.to_thread(self.acquire, job.name, job.lease_seconds):
+                    await asyncio.to_thread(self.run_job, job)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Scheduler loop for %s failed", job.name)
+            job.wake.clear()
+            try:
+                await asyncio.wait_for(job.wake.wait(), timeout=job.seconds_to_next_run())
+            except asyncio.TimeoutError:
+                pass
+
+    async def _heartbeat(self):
+        # Renew well inside the shortest lease so one slow beat doesn't lose it
+        interval = min(job.lease_seconds for job in self.jobs.values()) / 3
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await asyncio.to_thread(self.renew_leases)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Scheduler heartbeat failed")
+
+    def renew_leases(self):
+        """Extend every lease this process holds by its job's lease period"""
+        lease = models.SchedulerLease
+        db = self.session_factory()
+        try:
+            now = datetime.utcnow()
+            for job in self.jobs.values():
+                db.query(lease).filter(lease.name == job.name, lease.holder == self.holder).update(
+                    {lease.expires_at: now + timedelta(seconds=job.lease_seconds)}, synchronize_session=False
+                )
+            db.commit()
+        finally:
+            db.close()
+
+    def acquire(self, name: str, lease_seconds: float) -> bool:
+        """Take or renew the lease for ``name``; False if another holder owns it"""
+        lease = models.SchedulerLease
+        db = self.session_factory()
+        try:
+            now = datetime.utcnow()
+            renewed = db.query(lease).filter(
+                lease.name == name,
+                or_(lease.holder == self.holder, lease.expires_at < now)
+            ).update(
+                {lease.holder: self.holder, lease.expires_at: now + timedelta(seconds=lease_seconds)},
+                synchronize_session=False
+            )
+            if not renewed:
+                db.add(lease(name=name, holder=self.holder, expires_at=now + timedelta(seconds=lease_seconds)))
+                try:
+                    db.flush()
+                except IntegrityError:
+                    db.rollback()
+                    return False
+            db.commit()
+            return True
+        finally:
+            db.close()
+
+    def _release_leases(self):
+        lease = models.SchedulerLease
+        db = self.session_factory()
+        try:
+            db.query(lease).filter(lease.holder == self.holder).update(
+                {lease.expires_at: datetime.utcnow()}, synchronize_session=False
+            )
+            db.commit()
+        finally:
+            db.close()
+
+    def run_job(self, job: Job):
+        run = models.JobRun(job_name=job.name, holder=self.holder, started_at=datetime.utcnow())
+        started = time.perf_counter()
+        db = self.session_factory()
+        try:
+            result = job.func(db)
+            if isinstance(result, dict):
+                run.rows_affected = result.get("rows")
+                run.batches = result.get("batches")
+            else:
+                run.rows_affected = result
+            run.status = "success"
+        except Exception as exc:
+            db.rollback()
+            logger.exception("Job %s failed", job.name)
+            run.status = "failed"
+            run.error = repr(exc)
+        finally:
+            run.finished_at = datetime.utcnow()
+            run.duration_ms = (time.perf_counter() - started) * 1000
+            db.add(run)
+            db.commit()
+            db.close()
+        return run
+
+
+scheduler = Scheduler()
@@ -1,7 +1,19 @@
-from pydantic import BaseModel, EmailStr
-from typing import Optional, List
+from pydantic import BaseModel, EmailStr, Field, field_validator, AfterValidator, BeforeValidator, PlainSerializer
+from typing import Annotated, Any, Dict, Optional, List
 from datetime import datetime, date
-from app.models import ResidentStatus, BedStatus, CheckupStatus, EventStatus
+from decimal import Decimal
+import json
+from app import money
+from app.models import ResidentStatus, BedStatus, CheckupStatus, EventStatus, ParticipantStatus
+
+# Amounts are exact two-place Decimals internally and plain JSON numbers on the wire
+Money = Annotated[Decimal, BeforeValidator(money.to_decimal), PlainSerializer(float, return_type=float, when_used="json")]
+
+def to_local_naive(value: datetime) -> datetime:
+    return value.astimezone().replace(tzinfo=None) if value.tzinfo is not None else value
+
+# Timestamps are stored as naive server-local times; offsets sent by clients ("...Z") are converted on the way in
+LocalDateTime = Annotated[datetime, AfterValidator(to_local_naive)]
 
 # Base schemas
 class ResidentBase(BaseModel):
@@ -21,11 +33,12 @@ class ResidentBase(BaseModel):
     notes: Optional[str] = None
 
 class ResidentCreate(ResidentBase):
-    pass
+    # Derived from date_of_birth when the resident is saved; any value sent is ignored
+    age: Optional[int] = None
 
 class ResidentUpdate(BaseModel):
     name: Optional[str] = None
-    age: Optional[int] = None
+    gender: Optional[str] = None
     phone: Optional[str] = None
     emergency_contact: Optional[str] = None
     emergency_phone: Optional[str] = None
@@ -56,6 +69,16 @@ class ResidentBirthday(BaseModel):
     class Config:
         from_attributes = True
 
+class AgeBand(BaseModel):
+    min_age: int
+    max_age: int
+    residents: int
+
+class AgeBandReport(BaseModel):
+    as_of: Optional[date] = None
+    total_residents: int = 0
+    bands: List[AgeBand] = []
+
 # Bed schemas
 class BedBase(BaseModel):
     bed_number: str
@@ -63,8 +86,18 @@ class BedBase(BaseModel):
     floor: int
     bed_type: Optional[str] = None
     status: BedStatus = BedStatus.VACANT
-    monthly_rate: Optional[float] = None
-    amenities: Optional[str] = None
+    monthly_rate: Optional[Money] = None
+    amenities: List[str] = []
+
+    @field_validator("amenities", mode="before")
+    @classmethod
+    def split_amenities(cls, value):
+        # Accept the legacy "AC, TV" string as well as lists of names or Amenity rows
+        if value is None:
+            return []
+        if isinstance(value, str):
+            return [item.strip() for item in value.split(",") if item.strip()]
+        return [getattr(item, "name", item) for item in value]
 
 class BedCreate(BedBase):
     pass
@@ -77,6 +110,54 @@ class Bed(BedBase):
     class Config:
         from_attributes = True
 
+class Amenity(BaseModel):
+    id: int
+    name: str
+    slug: str
+
+    class Config:
+        from_attributes = True
+
+class BedRecommendation(BaseModel):
+    bed_id: int
+    bed_number: str
+    room_number: str
+    floor: int
+    bed_type: Optional[str] = None
+    monthly_rate: Money
+    amenities: List[str] = []
+    room_occupants: int = 0
+
+class RoomOccupancy(BaseModel):
+    room_number: str
+    total_beds: int = 0
+    occupied: int = 0
+    vacant: int = 0
+    maintenance: int = 0
+    occupancy_rate: float = 0.0
+    monthly_revenue: Money = money.ZERO
+
+class FloorOccupancy(BaseModel):
+    floor: int
+    total_beds: int = 0
+    occupied: int = 0
+    vacant: int = 0
+    maintenance: int = 0
+    occupancy_rate: float = 0.0
+    monthly_revenue: Money = money.ZERO
+    potential_revenue: Money = money.ZERO
+    rooms: List[RoomOccupancy] = []
+
+class BedOccupancySummary(BaseModel):
+    total_beds: int = 0
+    occupied: int = 0
+    vacant: int = 0
+    maintenance: int = 0
+    occupancy_rate: float = 0.0
+    monthly_revenue: Money = money.ZERO
+    potential_revenue: Money = money.ZERO
+    floors: List[FloorOccupancy] = []
+
 # Medication schemas
 class MedicationBase(BaseModel):
     resident_id: int
@@ -100,11 +181,57 @@ class Medication(MedicationBase):
     class Config:
         from_attributes = True
 
+class MedicationBulkUpdate(BaseModel):
+    id: int
+    medication_name: Optional[str] = None
+    dosage: Optional[str] = None
+    frequency: Optional[str] = None
+    start_date: Optional[date] = None
+    end_date: Optional[date] = None
+    prescribed_by: Optional[str] = None
+    instructions: Optional[str] = None
+    is_active: Optional[bool] = None
+
+class MedicationCheck(BaseModel):
+    resident_id: int
+    medication_name: str
+
+class MedicationConflict(BaseModel):
+    kind: str
+    severity: str
+    medication: str
+    conflicts_with: str
+    description: str
+    blocking: bool
+
+    class Config:
+        from_attributes = True
+
+class MARDose(BaseModel):
+    medication_id: int
+    resident_id: int
+    resident_name: str
+    room_number: Optional[str] = None
+    floor: Optional[int] = None
+    medication_name: str
+    dosage: str
+    instructions: Optional[str] = None
+    recognised: bool = True
+    scheduled_at: Optional[datetime] = None
+    round: Optional[str] = None
+
+class MedicationAdministrationRecord(BaseModel):
+    day: date
+    floor: Optional[int] = None
+    doses: List[MARDose]
+    as_needed: List[MARDose]
+
 # Checkup schemas
 class CheckupBase(BaseModel):
     resident_id: int
     checkup_type: str
-    scheduled_date: datetime
+    scheduled_date: LocalDateTime
+    duration_minutes: Optional[int] = Field(30, gt=0)
     doctor_name: Optional[str] = None
     location: Optional[str] = None
     status: CheckupStatus = CheckupStatus.SCHEDULED
@@ -118,17 +245,54 @@ class CheckupCreate(CheckupBase):
 
 class Checkup(CheckupBase):
     id: int
+    follow_up_checkup_id: Optional[int] = None
     created_at: datetime
     updated_at: Optional[datetime] = None
 
     class Config:
         from_attributes = True
 
+class CheckupSlotConflict(BaseModel):
+    kind: str  # doctor, location, resident
+    value: str
+    checkup_id: int
+    starts_at: datetime
+    ends_at: datetime
+
+    class Config:
+        from_attributes = True
+
+class CheckupSlot(BaseModel):
+    starts_at: datetime
+    ends_at: datetime
+
+class FollowUpItem(BaseModel):
+    checkup_id: int
+    resident_id: int
+    resident_name: str
+    room_number: Optional[str] = None
+    checkup_type: str
+    doctor_name: Optional[str] = None
+    scheduled_date: datetime
+    follow_up_date: date
+    days_overdue: int  # negative while the follow-up is not yet due
+    notes: Optional[str] = None
+
+class FollowUpWorklist(BaseModel):
+    overdue: int
+    due_soon: int
+    items: List[FollowUpItem]
+
+class FollowUpCompletion(BaseModel):
+    # Link an existing checkup, or book a new one
+    follow_up_checkup_id: Optional[int] = None
+    checkup: Optional[CheckupCreate] = None
+
 # Event schemas
 class EventBase(BaseModel):
     title: str
     description: Optional[str] = None
-    event_date: datetime
+    event_date: LocalDateTime
     duration_minutes: Optional[int] = None
     location: Optional[str] = None
     organizer: Optional[str] = None
@@ -150,6 +314,46 @@ class Event(EventBase):
     class Config:
         from_attributes = True
 
+class EventOccurrence(BaseModel):
+    id: int
+    event_id: int
+    occurrence_at: datetime
+    status: EventStatus
+    title: str
+    location: Optional[str] = None
+    duration_minutes: Optional[int] = None
+    event_type: Optional[str] = None
+    is_recurring: bool = False
+
+class EventParticipant(BaseModel):
+    id: int
+    event_id: int
+    resident_id: int
+    status: ParticipantStatus
+    registered_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+class EventRegistration(BaseModel):
+    resident_ids: List[int]
+
+class EventRegistrationResult(BaseModel):
+    event_id: int
+    registered: List[int] = []
+    waitlisted: List[int] = []
+    already_registered: List[int] = []
+    unknown_residents: List[int] = []
+    current_participants: int = 0
+    max_participants: Optional[int] = None
+
+class EventUnregistrationResult(BaseModel):
+    event_id: int
+    removed: List[int] = []
+    promoted: List[int] = []
+    current_participants: int = 0
+    max_participants: Optional[int] = None
+
 # Document schemas
 class DocumentBase(BaseModel):
     resident_id: Optional[int] = None
@@ -199,6 +403,48 @@ class Staff(StaffBase):
     class Config:
         from_attributes = True
 
+# Roster schemas
+class ShiftAssignmentBase(BaseModel):
+    staff_id: int
+    shift_date: date
+    shift: str = Field(..., pattern="^(morning|evening|night)$")
+    floor: int
+    notes: Optional[str] = None
+
+class ShiftAssignmentCreate(ShiftAssignmentBase):
+    pass
+
+class ShiftAssignment(ShiftAssignmentBase):
+    id: int
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
+class ShiftAssignmentBatch(BaseModel):
+    assignments: List[ShiftAssignmentCreate] = Field(..., min_length=1)
+
+class CoverageGap(BaseModel):
+    date: date
+    shift: str
+    floor: int
+    role: str
+    assigned: int
+    required: int
+    shortfall: int
+
+class RosterCoverage(BaseModel):
+    # assigned is indexed [day][shift][floor][role]; required [day][floor][role]; census [day][floor]
+    start: date
+    end: date
+    shifts: List[str]
+    floors: List[int]
+    roles: List[str]
+    census: List[List[int]]
+    assigned: List[List[List[List[int]]]]
+    required: List[List[List[int]]]
+    gaps: List[CoverageGap] = []
+
 # Visitor schemas
 class VisitorBase(BaseModel):
     resident_id: int
@@ -218,22 +464,52 @@ class VisitorCreate(VisitorBase):
 class Visitor(VisitorBase):
     id: int
     created_at: datetime
+    archived: bool = False
+
+    class Config:
+        from_attributes = True
+
+class VisitorPage(BaseModel):
+    items: List[Visitor]
+    next_cursor: Optional[str] = None
+
+class VisitorCheckIn(BaseModel):
+    resident_id: int
+    visitor_name: str
+    relationship: Optional[str] = None
+    phone: Optional[str] = None
+    purpose: Optional[str] = None
+    notes: Optional[str] = None
+    approved_by: Optional[str] = None
+
+class OnSiteVisitor(BaseModel):
+    visitor_id: int
+    visitor_name: str
+    phone: Optional[str] = None
+    resident_id: int
+    resident_name: Optional[str] = None
+    room_number: Optional[str] = None
+    check_in_time: datetime
 
     class Config:
         from_attributes = True
 
+class OnSiteVisitors(BaseModel):
+    count: int
+    visitors: List[OnSiteVisitor]
+
 # Billing schemas
 class BillingBase(BaseModel):
     resident_id: int
     billing_period_start: date
     billing_period_end: date
-    accommodation_charges: float = 0.0
-    medical_charges: float = 0.0
-    food_charges: float = 0.0
-    other_charges: float = 0.0
-    total_amount: float
-    amount_paid: float = 0.0
-    balance: float = 0.0
+    accommodation_charges: Money = money.ZERO
+    medical_charges: Money = money.ZERO
+    food_charges: Money = money.ZERO
+    other_charges: Money = money.ZERO
+    total_amount: Money
+    amount_paid: Money = money.ZERO
+    balance: Money = money.ZERO
     due_date: date
     payment_status: str = "pending"
     payment_method: Optional[str] = None
@@ -245,12 +521,123 @@ class BillingCreate(BillingBase):
 
 class Billing(BillingBase):
     id: int
+    billing_run_id: Optional[int] = None
     created_at: datetime
     updated_at: Optional[datetime] = None
 
     class Config:
         from_attributes = True
 
+class BillingTotals(BaseModel):
+    resident_id: int
+    invoices: int
+    total_billed: Money
+    total_paid: Money
+    balance: Money
+
+class PaymentCreate(BaseModel):
+    amount: Money = Field(..., gt=0)
+    payment_date: date = Field(default_factory=date.today)
+    payment_method: Optional[str] = None
+    reference: Optional[str] = None
+
+class Payment(PaymentCreate):
+    id: int
+    billing_id: int
+    resident_id: int
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
+class AgeingBuckets(BaseModel):
+    balance: Money = money.ZERO
+    current: Money = money.ZERO
+    past_due_0_30: Money = money.ZERO
+    past_due_31_60: Money = money.ZERO
+    past_due_61_90: Money = money.ZERO
+    past_due_over_90: Money = money.ZERO
+
+class ResidentAgeing(AgeingBuckets):
+    resident_id: int
+    as_of: date
+
+    class Config:
+        from_attributes = True
+
+class AgeingReport(BaseModel):
+    as_of: Optional[date] = None
+    residents_with_balance: int = 0
+    totals: AgeingBuckets
+    residents: List[ResidentAgeing] = []
+
+class BillingRunCreate(BaseModel):
+    # Defaults to the calendar month containing period_start
+    period_start: date
+    period_end: Optional[date] = None
+
+class BillingRun(BaseModel):
+    id: int
+    period_start: date
+    period_end: date
+    status: str
+    invoices_created: int = 0
+    total_amount: Money = money.ZERO
+    error: Optional[str] = None
+    started_at: datetime
+    finished_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+# Sync schemas
+class SyncChange(BaseModel):
+    seq: int
+    table: str
+    id: int
+    deleted: bool = False
+    data: Optional[Dict[str, Any]] = None  # the row's current state; None for tombstones
+
+class SyncPage(BaseModel):
+    since: int
+    next_since: int
+    has_more: bool = False
+    changes: List[SyncChange] = []
+
+# Audit log schemas
+class AuditEntry(BaseModel):
+    id: int
+    occurred_at: datetime
+    actor_id: Optional[int] = None
+    table_name: str
+    row_id: Optional[str] = None
+    action: str
+    changes: Dict[str, Any]
+
+    @field_validator("changes", mode="before")
+    @classmethod
+    def parse_changes(cls, value):
+        return json.loads(value) if isinstance(value, str) else value
+
+    class Config:
+        from_attributes = True
+
+# Background job schemas
+class JobRun(BaseModel):
+    id: int
+    job_name: str
+    holder: Optional[str] = None
+    status: str
+    rows_affected: Optional[int] = None
+    batches: Optional[int] = None
+    duration_ms: Optional[float] = None
+    error: Optional[str] = None
+    started_at: datetime
+    finished_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
 # Dashboard schemas
 class DashboardStats(BaseModel):
     total_residents: int
@@ -258,10 +645,24 @@ class DashboardStats(BaseModel):
     vacant_beds: int
     upcoming_birthdays: int
 
+class ScheduleItem(BaseModel):
+    kind: str  # checkup, event, birthday, medication_round
+    starts_at: datetime
+    all_day: bool = False
+    duration_minutes: Optional[int] = None
+    title: str
+    reference_id: Optional[int] = None
+    resident_id: Optional[int] = None
+    resident_name: Optional[str] = None
+    room_number: Optional[str] = None
+    location: Optional[str] = None
+    details: Optional[str] = None
+
 class TodaySchedule(BaseModel):
     checkups: List[Checkup]
     events: List[Event]
     birthdays: List[ResidentBirthday]
+    timeline: List[ScheduleItem] = []
 
 # Search and filter schemas
 class ResidentSearch(BaseModel):
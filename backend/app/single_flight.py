@@ -0,0 +1,121 @@
+"""
+Single-flight request coalescing.
+
+``flights.do(key, fn)`` runs ``fn`` once for any number of concurrent
+callers that ask for the same ``key``: the first caller (the leader) runs
+it, everyone arriving while it is in flight waits for and shares its
+result, and the key is released as soon as the leader finishes, so later
+callers compute afresh. Followers that wait longer than ``timeout`` get
+``FlightTimeout``; an exception raised by the leader is re-raised in every
+follower. ``do_async`` does the same for coroutines on the event loop.
+
+Results are shared between callers, so they should be immutable (the
+route decorators share serialised JSON bytes).
+"""
+import asyncio
+import threading
+from collections import Counter
+from typing import Awaitable, Callable, Dict, Hashable, Optional
+
+from decouple import config
+
+# How long a follower waits for the leader before giving up
+SINGLE_FLIGHT_TIMEOUT_SECONDS = config("SINGLE_FLIGHT_TIMEOUT_SECONDS", default=10, cast=float)
+
+
+class FlightTimeout(Exception):
+    """A follower waited longer than its timeout for the in-flight call"""
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    def __init__(self, timeout: float = SINGLE_FLIGHT_TIMEOUT_SECONDS):
+        self.timeout = timeout
+        self._calls: Dict[Hashable, _Call] = {}
+        self._futures: Dict[Hashable, asyncio.Future] = {}
+        self._lock = threading.Lock()
+        self._counts = Counter()
+
+    def _count(self, outcome: str):
+        with self._lock:
+            self._counts[outcome] += 1
+
+    def do(self, key: Hashable, fn: Callable, timeout: Optional[float] = None):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            self._counts["leaders" if leader else "shared"] += 1
+
+        if leader:
+            try:
+                call.result = fn()
+                return call.result
+            except BaseException as exc:
+                call.error = exc
+                raise
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+
+        if not call.done.wait(self.timeout if timeout is None else timeout):
+            self._count("timeouts")
+            raise FlightTimeout(key)
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    async def do_async(self, key: Hashable, fn: Callable[[], Awaitable], timeout: Optional[float] = None):
+        # Only touched from the event loop thread, so no lock around the futures
+        future = self._futures.get(key)
+        if future is not None:
+            self._count("shared")
+            try:
+                # shield: a follower timing out must not cancel the leader's work
+                return await asyncio.wait_for(asyncio.shield(future), self.timeout if timeout is None else timeout)
+            except asyncio.TimeoutError:
+                self._count("timeouts")
+                raise FlightTimeout(key) from None
+
+        self._count("leaders")
+        future = self._futures[key] = asyncio.get_running_loop().create_future()
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as exc:
+            future.set_exception(exc)
+            # Mark the exception retrieved so an unwaited future doesn't log it
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._futures[key]
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls) + len(self._futures)
+
+    def stats(self) -> dict:
+        with self._lock:
+            counts = dict(self._counts)
+        return {
+            "leaders": counts.get("leaders", 0),
+            "shared": counts.get("shared", 0),
+            "timeouts": counts.get("timeouts", 0),
+            "in_flight": self.in_flight(),
+        }
+
+
+flights = SingleFlight()
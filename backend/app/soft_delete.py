@@ -0,0 +1,29 @@
+"""
+Soft delete.
+
+Rows of tables mixing in ``SoftDeletable`` are deleted by setting
+``deleted_at``. Every ORM SELECT touching such a table gets
+``deleted_at IS NULL`` added (``with_loader_criteria``, the same way
+tenancy scopes queries to a facility), so default reads only ever see live
+rows and can be served by the tables' partial indexes on live rows. Queries
+that need deleted rows too opt in with
+``execution_options(include_deleted=True)``.
+"""
+from sqlalchemy import Column, DateTime, event
+from sqlalchemy.orm import Session, with_loader_criteria
+
+
+class SoftDeletable:
+    """Mixin for tables whose rows are tombstoned rather than deleted"""
+    deleted_at = Column(DateTime)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _exclude_deleted(state):
+    if not state.is_select or state.is_column_load or state.is_relationship_load:
+        return
+    if state.execution_options.get("include_deleted", False):
+        return
+    state.statement = state.statement.options(
+        with_loader_criteria(SoftDeletable, lambda cls: cls.deleted_at.is_(None), include_aliases=True)
+    )
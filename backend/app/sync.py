@@ -0,0 +1,197 @@
+"""
+Change-data capture for incremental client sync.
+
+Every insert, update or delete of a row in ``SYNCED`` is logged to
+``change_log`` as ``(seq, table_name, row_id)`` by the writing transaction:
+
+* Unit-of-work writes are captured in ``after_flush``.
+* Bulk ORM statements are captured in ``do_orm_execute``: UPDATE and DELETE
+  first read the ids their WHERE clause matches; a multi-row INSERT reads
+  the ids above the previous maximum once it has run.
+
+Captured rows wait in the session until it commits. ``before_commit`` then
+takes the next ``seq`` values from the single ``change_log_sequence`` row
+and inserts the entries. The transaction keeps that row locked until it
+commits, so a transaction that commits later always gets higher seqs. A
+client that has synced up to ``seq`` therefore never misses a change
+committed afterwards with a lower one. That gap would be possible if seq
+came from an autoincrement key taken mid-transaction (on PostgreSQL, say).
+
+``get_changes(since)`` pages through the log after ``since`` and compacts
+each page to one entry per row: the row's current state, or a tombstone
+when it no longer exists. ``compact`` drops log entries superseded by a
+later one for the same row, which never changes what a client syncing from
+any ``since`` receives, so the log stays proportional to the rows touched
+rather than the writes made.
+"""
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Iterable, Tuple
+
+from sqlalchemy import DateTime, event, func, insert, literal, select, update
+from sqlalchemy.orm import Session
+
+from app import models, schemas
+
+# Synced tables and the schema each row is sent as
+SYNCED = {
+    model.__tablename__: (model, schema)
+    for model, schema in (
+        (models.Resident, schemas.Resident),
+        (models.Bed, schemas.Bed),
+        (models.Medication, schemas.Medication),
+        (models.Checkup, schemas.Checkup),
+        (models.Event, schemas.Event),
+        (models.Document, schemas.Document),
+        (models.Staff, schemas.Staff),
+        (models.ShiftAssignment, schemas.ShiftAssignment),
+        (models.Visitor, schemas.Visitor),
+        (models.Billing, schemas.Billing),
+    )
+}
+
+MAX_PAGE_SIZE = 5000
+
+
+def _log(session: Session, table_name: str, rows: Iterable[Tuple[int, int]]):
+    """Note (row_id, facility_id) changes; they are written to change_log when the session commits"""
+    pending = session.info.setdefault("sync_pending", {})
+    for row_id, facility_id in rows:
+        pending[(table_name, row_id)] = facility_id
+
+
+def _next_seq(session: Session, count: int) -> int:
+    """Reserve ``count`` seqs and return the first; the counter row stays locked until commit"""
+    counter = models.ChangeLogSequence.__table__
+    reserved = session.execute(
+        update(counter).where(counter.c.id == 1).values(last_seq=counter.c.last_seq + count)
+    )
+    if not reserved.rowcount:
+        # Table column, not the ORM attribute: the maximum across every facility in the database
+        last = session.execute(select(func.max(models.ChangeLog.__table__.c.seq))).scalar() or 0
+        session.execute(insert(counter).values(id=1, last_seq=last + count))
+        return last + 1
+    return session.execute(select(counter.c.last_seq).where(counter.c.id == 1)).scalar() - count + 1
+
+
+@event.listens_for(Session, "before_commit")
+def _write_log(session):
+    # Flush first so the commit's own pending writes are captured too
+    session.flush()
+    pending = session.info.pop("sync_pending", None)
+    if not pending:
+        return
+    first = _next_seq(session, len(pending))
+    changed_at = datetime.utcnow()
+    session.execute(insert(models.ChangeLog.__table__), [
+        {"seq": first + offset, "facility_id": facility_id, "table_name": table_name,
+         "row_id": row_id, "changed_at": changed_at}
+        for offset, ((table_name, row_id), facility_id) in enumerate(pending.items())
+    ])
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_log(session):
+    session.info.pop("sync_pending", None)
+
+
+@event.listens_for(Session, "after_flush")
+def _capture_flush(session, flush_context):
+    changed = defaultdict(dict)
+    for objects, modified_only in ((session.new, False), (session.dirty, True), (session.deleted, False)):
+        for obj in objects:
+            table_name = obj.__table__.name
+            if table_name in SYNCED and not (modified_only and not session.is_modified(obj)):
+                changed[table_name][obj.id] = obj.facility_id
+    for table_name, rows in changed.items():
+        _log(session, table_name, rows.items())
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _capture_statement(state):
+    if not (state.is_insert or state.is_update or state.is_delete):
+        return None
+    mapper = state.bind_mapper
+    if mapper is None or mapper.local_table.name not in SYNCED:
+        return None
+    model, session = mapper.class_, state.session
+    if state.is_insert:
+        before = session.execute(select(func.max(model.id))).scalar() or 0
+        result = state.invoke_statement()
+        _log(session, model.__tablename__, session.execute(
+            select(model.id, model.facility_id).where(model.id > before)
+        ).all())
+        return result
+    matched = select(model.id, model.facility_id)
+    if state.statement.whereclause is not None:
+        matched = matched.where(state.statement.whereclause)
+    _log(session, model.__tablename__, session.execute(matched).all())
+    return None
+
+
+def get_changes(db: Session, since: int = 0, limit: int = 1000) -> schemas.SyncPage:
+    change = models.ChangeLog
+    entries = db.query(change.seq, change.table_name, change.row_id).filter(
+        change.seq > since
+    ).order_by(change.seq).limit(limit + 1).all()
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+
+    latest: Dict[Tuple[str, int], int] = {}
+    for seq, table_name, row_id in entries:
+        latest[(table_name, row_id)] = seq
+    ids = defaultdict(list)
+    for table_name, row_id in latest:
+        ids[table_name].append(row_id)
+    current = {}
+    for table_name, row_ids in ids.items():
+        model, schema = SYNCED[table_name]
+        for row in db.query(model).filter(model.id.in_(row_ids)):
+            current[(table_name, row.id)] = schema.model_validate(row).model_dump(mode="json")
+
+    changes = [
+        schemas.SyncChange(
+            seq=seq,
+            table=table_name,
+            id=row_id,
+            deleted=(table_name, row_id) not in current,
+            data=current.get((table_name, row_id)),
+        )
+        for (table_name, row_id), seq in sorted(latest.items(), key=lambda item: item[1])
+    ]
+    return schemas.SyncPage(
+        since=since,
+        next_since=entries[-1].seq if entries else since,
+        has_more=has_more,
+        changes=changes,
+    )
+
+
+def compact(db: Session):
+    """Delete log entries superseded by a later entry for the same row"""
+    change = models.ChangeLog
+    latest = select(func.max(change.seq)).group_by(change.table_name, change.row_id).scalar_subquery()
+    removed = db.query(change).filter(change.seq.not_in(latest)).delete(synchronize_session=False)
+    db.commit()
+    return {"rows": removed, "batches": 1}
+
+
+def ensure(db: Session):
+    """Log every existing row once, so a first sync from 0 returns the full dataset"""
+    if db.query(models.ChangeLog.seq).first() is not None:
+        return None
+    changed_at = datetime.utcnow()
+    rows = 0
+    for table_name, (model, _) in SYNCED.items():
+        result = db.execute(insert(models.ChangeLog.__table__).from_select(
+            ["facility_id", "table_name", "row_id", "changed_at"],
+            select(model.facility_id, literal(table_name), model.id, literal(changed_at, DateTime))
+        ))
+        rows += result.rowcount or 0
+    counter = models.ChangeLogSequence.__table__
+    db.execute(counter.delete())
+    db.execute(insert(counter).values(
+        id=1, last_seq=select(func.coalesce(func.max(models.ChangeLog.__table__.c.seq), 0)).scalar_subquery()
+    ))
+    db.commit()
+    return {"rows": rows, "batches": len(SYNCED)}
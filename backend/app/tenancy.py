@@ -0,0 +1,170 @@
+"""
+Multi-facility tenancy.
+
+Every request runs for one facility, taken from the ``facility_id`` claim
+of the bearer token or from the ``X-Facility-Id`` header when the token
+allows that facility, and held in the ``current_facility`` context
+variable (``DEFAULT_FACILITY_ID`` when neither is given, so a single-home
+deployment behaves as before).
+
+* Tables owned by a facility mix in ``FacilityScoped``: their
+  ``facility_id`` defaults to the current facility on insert, and sessions
+  opened for a facility add ``facility_id = :id`` to every ORM SELECT,
+  UPDATE and DELETE touching them (``with_loader_criteria``), backed by a
+  per-table facility index.
+* ``router`` maps a facility to the database holding its rows. The default
+  ``FacilityRouter`` sends the facilities listed in ``FACILITY_DATABASES``
+  to their own database and everyone else to the shared ``DATABASE_URL``;
+  install another router with ``set_router`` (anything with ``url_for``
+  and ``database_urls``).
+* ``EngineCache`` keeps one engine (and connection pool) per database URL,
+  disposing the least recently used once there are more than
+  ``FACILITY_MAX_ENGINES`` or one has sat idle for
+  ``FACILITY_ENGINE_IDLE_SECONDS``.
+* ``FacilityLocal`` gives in-memory indexes and caches one instance per
+  facility.
+"""
+import threading
+import time
+from collections import OrderedDict
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional
+
+from decouple import config
+from sqlalchemy import Column, Integer, event
+from sqlalchemy.orm import Session, with_loader_criteria
+
+DEFAULT_FACILITY_ID = config("DEFAULT_FACILITY_ID", default=1, cast=int)
+FACILITY_MAX_ENGINES = config("FACILITY_MAX_ENGINES", default=8, cast=int)
+FACILITY_ENGINE_IDLE_SECONDS = config("FACILITY_ENGINE_IDLE_SECONDS", default=600, cast=float)
+
+
+def _parse_databases(value: str) -> Dict[int, str]:
+    # "3=postgresql://.../home3,7=sqlite:///./home7.db"
+    databases = {}
+    for item in value.split(","):
+        if item.strip():
+            facility_id, url = item.split("=", 1)
+            databases[int(facility_id)] = url.strip()
+    return databases
+
+
+# Facilities large enough for a database of their own
+FACILITY_DATABASES = config("FACILITY_DATABASES", default="", cast=_parse_databases)
+
+# None means unscoped: background jobs working across every facility in a database
+current_facility: ContextVar[Optional[int]] = ContextVar("current_facility", default=DEFAULT_FACILITY_ID)
+
+
+def current_facility_id() -> Optional[int]:
+    return current_facility.get()
+
+
+class FacilityScoped:
+    """Mixin for tables whose rows belong to one facility"""
+    facility_id = Column(Integer, nullable=False, default=current_facility_id,
+                         server_default=str(DEFAULT_FACILITY_ID), index=True)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _scope_to_facility(state):
+    facility_id = state.session.info.get("facility_id")
+    if facility_id is None or state.is_column_load or state.is_relationship_load:
+        return
+    if state.is_select or state.is_update or state.is_delete:
+        state.statement = state.statement.options(
+            with_loader_criteria(FacilityScoped, lambda cls: cls.facility_id == facility_id, include_aliases=True)
+        )
+
+
+class FacilityRouter:
+    """Maps a facility to the database URL holding its rows"""
+
+    def __init__(self, default_url: str, databases: Dict[int, str]):
+        self.default_url = default_url
+        self.databases = dict(databases)
+
+    def url_for(self, facility_id: Optional[int]) -> str:
+        return self.databases.get(facility_id, self.default_url)
+
+    def database_urls(self) -> List[str]:
+        return list(dict.fromkeys([self.default_url, *self.databases.values()]))
+
+
+router: Optional[FacilityRouter] = None
+
+
+def set_router(new_router):
+    global router
+    router = new_router
+
+
+class EngineCache:
+    """One engine per database URL, least recently used first; pinned engines are never evicted"""
+
+    def __init__(self, create: Callable, pinned: Dict[str, object],
+                 max_engines: int = FACILITY_MAX_ENGINES, idle_seconds: float = FACILITY_ENGINE_IDLE_SECONDS):
+        self._create = create
+        self._pinned = dict(pinned)
+        self._max_engines = max_engines
+        self._idle_seconds = idle_seconds
+        self._engines = OrderedDict()  # url -> (engine, last used)
+        self._lock = threading.Lock()
+
+    def get(self, url: str):
+        engine = self._pinned.get(url)
+        if engine is not None:
+            return engine
+        now = time.monotonic()
+        with self._lock:
+            entry = self._engines.pop(url, None)
+            engine = entry[0] if entry else self._create(url)
+            self._engines[url] = (engine, now)
+            evicted = self._evict(now)
+        for stale in evicted:
+            # Checked-out connections finish their work; the pool just stops handing them out
+            stale.dispose()
+        return engine
+
+    def _evict(self, now: float):
+        evicted = []
+        while self._engines:
+            url, (engine, last_used) = next(iter(self._engines.items()))
+            if len(self._engines) <= self._max_engines and now - last_used < self._idle_seconds:
+                break
+            del self._engines[url]
+            evicted.append(engine)
+        return evicted
+
+    def __len__(self):
+        return len(self._engines)
+
+
+class FacilityLocal:
+    """One ``factory()`` instance per facility; attribute access goes to the current facility's"""
+
+    def __init__(self, factory: Callable):
+        self._factory = factory
+        self._instances = {}
+        self._lock = threading.Lock()
+
+    def get(self):
+        facility_id = current_facility.get()
+        instance = self._instances.get(facility_id)
+        if instance is None:
+            with self._lock:
+                instance = self._instances.setdefault(facility_id, self._factory())
+        return instance
+
+    def instances(self):
+        with self._lock:
+            return list(self._instances.values())
+
+    def invalidate(self, **payload):
+        """Invalidate the current facility's instance, or every facility's after unscoped work"""
+        targets = self.instances() if current_facility.get() is None else [self.get()]
+        for instance in targets:
+            instance.invalidate(**payload)
+
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
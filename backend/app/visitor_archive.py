@@ -0,0 +1,98 @@
+"""
+Cold storage for old visitor records.
+
+Closed visits older than the retention window are moved out of the
+``visitors`` table by the ``visitor_archive`` job into one gzip'd NDJSON
+file per month of ``visit_date`` (``<VISITOR_ARCHIVE_DIR>/2026-03.ndjson.gz``;
+facilities other than the default one archive under ``facility-<id>/``),
+written through ``app.cold_archive``.
+
+The monthly files are the time partitions of the visit log. PostgreSQL
+declarative partitions and per-month SQLite tables were considered, but
+they would split the schema by dialect and break the primary key and
+indexes the hot table relies on; month files give the same pruning
+(history reads only open the months they reach into) on both databases,
+and the hot table only ever holds the retention window.
+
+Reads decompress a month at a time and keep recently used months in
+memory, keyed on the file's size and mtime so appends are picked up.
+"""
+import os
+from datetime import datetime
+from functools import lru_cache
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from decouple import config
+
+from app import cold_archive
+
+ARCHIVE_DIR = config("VISITOR_ARCHIVE_DIR", default="archive/visitors")
+SUFFIX = cold_archive.SUFFIX
+
+
+def facility_dir(facility_id: int) -> str:
+    return cold_archive.facility_dir(ARCHIVE_DIR, facility_id)
+
+
+def month_key(value: datetime) -> str:
+    return value.strftime("%Y-%m")
+
+
+def month_path(key: str, archive_dir: str = None) -> str:
+    return os.path.join(archive_dir or ARCHIVE_DIR, f"{key}{SUFFIX}")
+
+
+def append(rows: Iterable[dict], archive_dir: str = None) -> int:
+    """Append visit rows to their month files; returns the number written"""
+    by_month: Dict[str, List[dict]] = {}
+    for row in rows:
+        by_month.setdefault(month_key(row["visit_date"]), []).append(row)
+    return sum(cold_archive.append(month_path(key, archive_dir), month_rows) for key, month_rows in by_month.items())
+
+
+def archived_months(archive_dir: str = None) -> List[str]:
+    directory = archive_dir or ARCHIVE_DIR
+    if not os.path.isdir(directory):
+        return []
+    return sorted(name[:-len(SUFFIX)] for name in os.listdir(directory) if name.endswith(SUFFIX))
+
+
+@lru_cache(maxsize=24)
+def _load_month(path: str, mtime_ns: int, size: int) -> Tuple[dict, ...]:
+    records = {}
+    for record in cold_archive.read(path):
+        record["visit_date"] = datetime.fromisoformat(record["visit_date"])
+        records[record["id"]] = record
+    return tuple(sorted(records.values(), key=lambda record: (record["visit_date"], record["id"]), reverse=True))
+
+
+def read_month(key: str, archive_dir: str = None) -> Tuple[dict, ...]:
+    """A month's archived visits, newest first"""
+    path = month_path(key, archive_dir)
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return ()
+    return _load_month(path, stat.st_mtime_ns, stat.st_size)
+
+
+def iter_archived(before: Optional[Tuple[datetime, int]] = None, start: Optional[datetime] = None,
+                  end: Optional[datetime] = None, resident_id: Optional[int] = None,
+                  archive_dir: str = None) -> Iterator[dict]:
+    """Archived visits newest first, strictly before the ``(visit_date, id)`` cursor"""
+    upper = min(filter(None, (before[0] if before else None, end)), default=None)
+    for key in reversed(archived_months(archive_dir)):
+        if upper is not None and key > month_key(upper):
+            continue
+        if start is not None and key < month_key(start):
+            break
+        for record in read_month(key, archive_dir):
+            if before is not None and (record["visit_date"], record["id"]) >= before:
+                continue
+            if end is not None and record["visit_date"] >= end:
+                continue
+            if start is not None and record["visit_date"] < start:
+                break
+            if resident_id is not None and record["resident_id"] != resident_id:
+                continue
+            yield record
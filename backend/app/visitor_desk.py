@@ -0,0 +1,38 @@
+"""
+Visitors currently on site.
+
+The fire-roll "who is in the building" query reads the open visits
+(checked in, not yet checked out) from the database through the partial
+index ix_visitors_on_site. Every worker therefore answers from the same
+committed check-ins and check-outs, and the roll only touches current
+visitors however much visit history builds up.
+"""
+from typing import Optional
+
+from sqlalchemy import and_
+from sqlalchemy.orm import Session
+
+from app import models
+
+
+def open_visits():
+    # Matches the partial index ix_visitors_on_site
+    return and_(models.Visitor.check_out_time == None, models.Visitor.check_in_time != None)
+
+
+def on_site_visitors(db: Session, resident_id: Optional[int] = None):
+    visitor = models.Visitor
+    query = db.query(
+        visitor.id.label("visitor_id"),
+        visitor.visitor_name,
+        visitor.phone,
+        visitor.resident_id,
+        models.Resident.name.label("resident_name"),
+        models.Resident.room_number,
+        visitor.check_in_time,
+    ).outerjoin(
+        models.Resident, models.Resident.id == visitor.resident_id
+    ).filter(open_visits())
+    if resident_id is not None:
+        query = query.filter(visitor.resident_id == resident_id)
+    return query.order_by(visitor.check_in_time).all()
@@ -5,7 +5,7 @@ Seed script to populate the database with sample data for testing
 from datetime import datetime, date, timedelta
 from sqlalchemy.orm import Session
 from app.database import SessionLocal, engine
-from app import models
+from app import models, crud
 import random
 
 # Create database tables
@@ -18,18 +18,31 @@ def seed_database():
         # Clear existing data (optional - comment out if you want to keep existing data)
         print("Clearing existing data...")
         db.query(models.Visitor).delete()
+        db.query(models.Payment).delete()
+        db.query(models.ResidentBalance).delete()
         db.query(models.Billing).delete()
+        db.query(models.BillingRun).delete()
         db.query(models.Document).delete()
         db.query(models.Medication).delete()
         db.query(models.Checkup).delete()
+        db.query(models.EventParticipant).delete()
+        db.query(models.EventOccurrence).delete()
         db.query(models.Event).delete()
         db.query(models.Resident).delete()
+        db.execute(models.bed_amenities.delete())
+        db.query(models.Amenity).delete()
         db.query(models.Bed).delete()
+        db.query(models.BedOccupancyRollup).delete()
+        db.query(models.ShiftAssignment).delete()
         db.query(models.Staff).delete()
         db.commit()
         
         # Create beds
         print("Creating beds...")
+        ac, tv, private_bathroom = [
+            models.Amenity(name=name, slug=models.Amenity.slug_for(name))
+            for name in ("AC", "TV", "Private Bathroom")
+        ]
         beds_data = []
         for floor in range(1, 4):  # 3 floors
             for room in range(1, 21):  # 20 rooms per floor
@@ -44,7 +57,7 @@ def seed_database():
                         bed_type="single" if bed_num == 'A' else "shared",
                         status=models.BedStatus.VACANT,
                         monthly_rate=random.uniform(800, 1500),
-                        amenities="AC, TV, Private Bathroom" if bed_num == 'A' else "AC, TV"
+                        amenities=[ac, tv, private_bathroom] if bed_num == 'A' else [ac, tv]
                     )
                     beds_data.append(bed)
         
@@ -197,6 +210,7 @@ def seed_database():
         
         db.add_all(created_residents)
         db.commit()
+        crud.rebuild_bed_rollups(db)
         
         # Get created residents
         residents = db.query(models.Resident).all()
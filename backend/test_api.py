@@ -64,7 +64,6 @@ def test_api():
         if response.status_code == 200:
             created_resident = response.json()
             print(f"✅ Created resident: {created_resident['name']} (ID: {created_resident['id']})")
-            return created_resident['id']
         else:
             print(f"❌ Create Resident failed: {response.status_code}")
             print(f"   Response: {response.text}")
@@ -119,6 +118,43 @@ def test_api():
     except Exception as e:
         print(f"❌ Get Upcoming Events error: {e}")
     
+    # Test 8: Create a recurring event with a UTC timestamp
+    print("\n8. Testing Recurring Event With UTC Timestamp...")
+    try:
+        new_event = {
+            "title": "Test Weekly Bingo",
+            "event_date": "2026-11-01T10:00:00Z",
+            "is_recurring": True,
+            "recurrence_pattern": "FREQ=WEEKLY;COUNT=4"
+        }
+        response = requests.post(f"{BASE_URL}/api/events/", json=new_event)
+        if response.status_code == 200:
+            print(f"✅ Created recurring event at {response.json()['event_date']}")
+        else:
+            print(f"❌ Create Recurring Event failed: {response.status_code}")
+            print(f"   Response: {response.text}")
+    except Exception as e:
+        print(f"❌ Create Recurring Event error: {e}")
+    
+    # Test 9: Book a checkup with a UTC timestamp
+    print("\n9. Testing Checkup Booking With UTC Timestamp...")
+    try:
+        residents = requests.get(f"{BASE_URL}/api/residents/").json()
+        new_checkup = {
+            "resident_id": residents[0]["id"],
+            "checkup_type": "General",
+            "scheduled_date": "2026-11-03T10:00:00Z",
+            "doctor_name": "Test Doctor"
+        }
+        response = requests.post(f"{BASE_URL}/api/checkups/", json=new_checkup)
+        if response.status_code in (200, 409):
+            print(f"✅ Checkup booking answered {response.status_code}")
+        else:
+            print(f"❌ Book Checkup failed: {response.status_code}")
+            print(f"   Response: {response.text}")
+    except Exception as e:
+        print(f"❌ Book Checkup error: {e}")
+    
     print("\n" + "=" * 50)
     print("API Testing Complete!")
     print("\nTo run the server:")